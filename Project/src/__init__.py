@@ -1,28 +1,98 @@
-from .utils import (
-    load_data,
-    downsample_data,
-    load_variables,
-    save_variables,
-    update_variable,
-)
-from .cleaning import cast_types, check_ts_vs_time, clean_data
-from .features import (
-    label_churn,
-    extract_seasonality,
-    extract_user_attributes,
-    extract_behavioral_flags,
-    aggregate_session_metrics,
-    aggregate_user_features,
-)
-from .visualization import (
-    plot_churn_distribution,
-    plot_avg_songs_per_session,
-    plot_error_frequency,
-    plot_user_journeys,
-    plot_categorical_churn_impact,
-    plot_numerical_churn_impact,
-    analyze_location,
-    analyze_user_agent,
-    analyze_page_distribution,
-    get_true_names_and_importance,
-)
+"""
+Churn prediction package.
+
+Submodules are imported on demand: `from src.features import ...` only loads
+pandas / numpy, and matplotlib / sklearn / optuna are loaded the first time
+a name that needs them is accessed (e.g. `src.plot_user_journeys`).
+"""
+
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "utils": [
+        "load_data",
+        "downsample_data",
+        "load_variables",
+        "save_variables",
+        "update_variable",
+        "allocate_experiment_id",
+        "load_report",
+    ],
+    "cleaning": ["cast_types", "check_ts_vs_time", "clean_data"],
+    "features": [
+        "label_churn",
+        "extract_seasonality",
+        "extract_user_attributes",
+        "extract_behavioral_flags",
+        "aggregate_session_metrics",
+        "aggregate_user_features",
+    ],
+    "feature_registry": ["FeatureSpec", "DEFAULT_FEATURES", "default_features"],
+    "user_index": ["build_user_index", "get_user_index"],
+    "feature_transformer": ["FeatureTransformer"],
+    "inference": ["InferenceBundle"],
+    "compiled_ensemble": ["CompiledEnsemble", "compare_scoring"],
+    "equivalence": ["make_synthetic_events", "check_version_equivalence"],
+    "differential": ["differential_check", "compare_frames", "random_event_log"],
+    "transitions": ["page_transition_matrix", "sparse_design_matrix"],
+    "eda_summary": ["EDASummary"],
+    "decay": ["decayed_features", "DecayedCounters"],
+    "memory_guard": ["guarded_merge", "estimate_merge"],
+    "sampling": ["user_keys"],
+    "visualization": [
+        "plot_churn_distribution",
+        "plot_avg_songs_per_session",
+        "plot_error_frequency",
+        "plot_user_journeys",
+        "plot_categorical_churn_impact",
+        "plot_numerical_churn_impact",
+        "analyze_location",
+        "analyze_user_agent",
+        "analyze_page_distribution",
+        "get_true_names_and_importance",
+    ],
+    "tuning": [
+        "build_model",
+        "build_fold_cache",
+        "load_fold_cache",
+        "tune_models",
+    ],
+    "oof": ["OOFPredictionCache"],
+    "backtesting": ["build_snapshot_features", "walk_forward_folds", "backtest"],
+    "daily_grid": ["DailyCounts", "grid_features"],
+    "ingestion": ["UserAggregates", "EventIngestor"],
+    "threshold": [
+        "threshold_curve",
+        "find_optimal_threshold",
+        "bootstrap_threshold_bands",
+    ],
+    "importance": ["compute_permutation_importance", "get_permutation_importance"],
+    "registry": ["ExperimentRegistry", "get_registry"],
+    "benchmarks": [
+        "benchmark_import_time",
+        "benchmark_feature_versions",
+        "benchmark_backends",
+    ],
+}
+
+_NAME_TO_MODULE = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_NAME_TO_MODULE) + list(_EXPORTS)
+
+
+def __getattr__(name):
+    """Loads the submodule defining 'name' on first access (PEP 562)."""
+    if name in _EXPORTS:
+        return importlib.import_module(f".{name}", __name__)
+    if name in _NAME_TO_MODULE:
+        module = importlib.import_module(f".{_NAME_TO_MODULE[name]}", __name__)
+        value = getattr(module, name)
+        # Cache it so the next access is a plain attribute lookup
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
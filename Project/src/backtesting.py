@@ -0,0 +1,287 @@
+"""
+Time-based (walk-forward) validation on snapshot features.
+
+Features are computed once for a rolling grid of cutoff dates: a single
+aggregate_user_features call covers every (user, cutoff) pair. Each
+train / validation fold is then a row selection on that table, so evaluating
+a feature change over N time folds costs one feature build instead of N
+(generate_training_data(train_end_date=...) rebuilds the features per split).
+
+A snapshot of user u at cutoff c exists if u has an event at or before c and
+has not churned yet; its target is 1 if u churns within 'horizon_days' after c.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .user_index import get_user_index
+
+# --- 1. SNAPSHOT FEATURES (Computed once) ---
+
+
+def cutoff_grid(df, start=None, end=None, freq="7D", horizon_days=10):
+    """
+    Rolling cutoff dates from 'start' to 'end' every 'freq'.
+
+    By default the grid starts at midnight 'freq' after the first event and
+    stops 'horizon_days' before the last event, so every target is observable.
+    """
+    if start is None:
+        start = (df["ts"].min() + pd.Timedelta(freq)).normalize()
+    if end is None:
+        end = df["ts"].max() - pd.Timedelta(days=horizon_days)
+    return pd.date_range(
+        start, end, freq=freq, unit=np.datetime_data(df["ts"].dtype)[0]
+    )
+
+
+def user_dates(df):
+    """First event and churn date (NaT if none) of each user, sorted by userId."""
+    index = get_user_index(df)
+    return index["first_ts"], index["churn_ts"]
+
+
+def active_pairs(first_ts, churn_ts, cutoffs, horizon_days=10):
+    """
+    Every (user, cutoff) where the user has started and not churned yet.
+
+    Returns (user_pos, cutoff_pos, target): positions in first_ts / cutoffs and
+    1 if the user churns within 'horizon_days' after the cutoff.
+    """
+    grid = pd.DatetimeIndex(cutoffs).to_numpy()[None, :]
+    first = first_ts.to_numpy()[:, None]
+    churn = churn_ts.to_numpy()[:, None]
+    user_pos, cutoff_pos = np.nonzero((first <= grid) & ~(churn <= grid))
+
+    horizon = np.timedelta64(horizon_days, "D")
+    churn_at = churn_ts.to_numpy()[user_pos]
+    target = (churn_at <= grid[0, cutoff_pos] + horizon).astype(int)
+    return user_pos, cutoff_pos, target
+
+
+def build_snapshot_features(
+    df,
+    cutoffs=None,
+    freq="7D",
+    horizon_days=10,
+    features=None,
+    version="current",
+    backend="pandas",
+):
+    """
+    Computes the features of every active user at every cutoff date, in one pass.
+
+    Args:
+        df: Event log (after extract_user_attributes).
+        cutoffs: Cutoff dates. Defaults to cutoff_grid(df, freq=freq, ...).
+        horizon_days: Target = churn within this many days after the cutoff.
+        features, version, backend: Passed to aggregate_user_features.
+
+    Returns a DataFrame indexed by (userId, cutoff_ts) with the feature columns
+    and 'target', sorted by cutoff. .attrs keeps horizon_days, the version and
+    'fitted_inputs': raw columns (e.g. 'state') also returned so that backtest
+    can re-learn the fitted statistics (state_freq) on each training fold
+    instead of on the whole multi-cutoff table.
+    """
+    from .feature_registry import FITTED_STATS
+    from .feature_transformer import FeatureTransformer
+    from .features import aggregate_user_features
+
+    if cutoffs is None:
+        cutoffs = cutoff_grid(df, freq=freq, horizon_days=horizon_days)
+    cutoffs = pd.DatetimeIndex(cutoffs).as_unit(np.datetime_data(df["ts"].dtype)[0])
+
+    # 1. Every (user, cutoff) pair where the user is active and not churned yet
+    first_ts, churn_ts = user_dates(df)
+    user_pos, cutoff_pos, target = active_pairs(
+        first_ts, churn_ts, cutoffs, horizon_days
+    )
+    snapshot_df = pd.DataFrame(
+        {
+            "userId": first_ts.index[user_pos],
+            "cutoff_ts": cutoffs[cutoff_pos],
+            "target": target,
+        }
+    )
+    print(
+        f"Generated {len(snapshot_df)} snapshots over {len(cutoffs)} cutoffs "
+        f"(Class Balance: {snapshot_df['target'].mean():.2%})"
+    )
+
+    # 2. One feature build for every snapshot (+ the fitted statistics' inputs)
+    transformer = FeatureTransformer(features, version)
+    features = transformer.features
+    fitted_inputs = [
+        col
+        for name in transformer.fitted_stats
+        for col in FITTED_STATS[name].requires
+        if col not in features
+    ]
+    features_df = aggregate_user_features(
+        df,
+        snapshot_df,
+        features=features + fitted_inputs,
+        version=version,
+        backend=backend,
+    )
+    targets = snapshot_df.set_index(["userId", "cutoff_ts"])["target"]
+    features_df["target"] = targets.reindex(features_df.index)
+
+    features_df = features_df.sort_index(level="cutoff_ts", sort_remaining=True)
+    features_df.attrs["horizon_days"] = horizon_days
+    features_df.attrs["version"] = version
+    features_df.attrs["fitted_inputs"] = fitted_inputs
+    return features_df
+
+
+# --- 2. WALK-FORWARD FOLDS (Row selections on the snapshot table) ---
+
+
+def walk_forward_folds(snapshots, n_folds=4, val_cutoffs=1, train_cutoffs=None):
+    """
+    Splits the snapshot table into walk-forward train / validation folds.
+
+    The last n_folds * val_cutoffs cutoffs are validated in blocks of
+    'val_cutoffs'. Each fold trains on the earlier cutoffs whose target window
+    has closed before the validation block starts (cutoff + horizon <= start),
+    so no training label looks into the validation period.
+
+    Args:
+        snapshots: Output of build_snapshot_features.
+        n_folds: Number of validation blocks (at most; folds without any
+                 usable training cutoff are skipped).
+        val_cutoffs: Cutoffs per validation block.
+        train_cutoffs: Train on the N most recent usable cutoffs (sliding
+                       window). None trains on all of them (expanding window).
+
+    Returns a list of (train_idx, val_idx) positional index arrays.
+    """
+    horizon = pd.Timedelta(days=snapshots.attrs.get("horizon_days", 0))
+    row_cutoffs = snapshots.index.get_level_values("cutoff_ts")
+    cutoffs = row_cutoffs.unique().sort_values()
+
+    folds = []
+    first_val = len(cutoffs) - n_folds * val_cutoffs
+    for start in range(first_val, len(cutoffs), val_cutoffs):
+        if start < 0:
+            continue
+        val_block = cutoffs[start : start + val_cutoffs]
+        train_block = cutoffs[:start][cutoffs[:start] + horizon <= val_block[0]]
+        if train_cutoffs is not None:
+            train_block = train_block[-train_cutoffs:]
+        if len(train_block) == 0:
+            continue
+        folds.append(
+            (
+                np.flatnonzero(row_cutoffs.isin(train_block)),
+                np.flatnonzero(row_cutoffs.isin(val_block)),
+            )
+        )
+    if not folds:
+        raise ValueError(
+            f"Not enough cutoffs ({len(cutoffs)}) for {n_folds} folds of "
+            f"{val_cutoffs} cutoff(s) with {horizon.days}-day targets"
+        )
+    return folds
+
+
+# --- 3. BACKTEST ---
+
+
+def _fold_features(snapshots, train_idx, val_idx):
+    """
+    Train / validation feature rows of a fold. The fitted statistics (e.g.
+    state_freq) are re-learned on the training rows only, so no fold sees
+    frequencies from later cutoffs; their raw inputs are then dropped.
+    """
+    from .feature_registry import FITTED_STATS, get_spec
+
+    X = snapshots.drop(columns=["target"])
+    X_train, X_val = X.iloc[train_idx].copy(), X.iloc[val_idx].copy()
+    inputs = snapshots.attrs.get("fitted_inputs", [])
+    if inputs:
+        version = snapshots.attrs.get("version", "current")
+        names = [name for name in FITTED_STATS if name in X.columns]
+        stats = {name: FITTED_STATS[name].compute(X_train) for name in names}
+        ctx = {"group_keys": list(X.index.names), "stats": stats}
+        for name in names:
+            spec = get_spec(name, version)
+            X_train[name] = spec.compute(X_train, ctx)
+            X_val[name] = spec.compute(X_val, ctx)
+    return X_train.drop(columns=inputs), X_val.drop(columns=inputs)
+
+
+def backtest(
+    snapshots, model, preprocessor=None, folds=None, scoring="roc_auc", **fold_args
+):
+    """
+    Fits a fresh copy of (preprocessor +) model on each walk-forward fold and
+    scores it on the validation cutoffs.
+
+    Args:
+        snapshots: Output of build_snapshot_features.
+        model: Unfitted estimator (e.g. tuning.build_model("lgbm")).
+        preprocessor: Optional unfitted transformer fitted on each training fold.
+        folds: (train_idx, val_idx) pairs. Defaults to walk_forward_folds(
+               snapshots, **fold_args).
+        scoring: sklearn scorer name.
+
+    Folds whose training (or validation) rows hold a single class (e.g. no
+    churner before an early cutoff) cannot be fitted (or scored): they are
+    skipped, with a NaN score and the reason in 'status'.
+
+    Returns a DataFrame with one row per fold (dates, sizes, churn rates,
+    status, score).
+    """
+    from sklearn.base import clone
+    from sklearn.metrics import get_scorer
+    from sklearn.pipeline import make_pipeline
+
+    if folds is None:
+        folds = walk_forward_folds(snapshots, **fold_args)
+    scorer = get_scorer(scoring)
+    y = snapshots["target"].to_numpy()
+    row_cutoffs = snapshots.index.get_level_values("cutoff_ts")
+
+    rows = []
+    for i, (train_idx, val_idx) in enumerate(folds):
+        row = {
+            "fold": i,
+            "train_end": row_cutoffs[train_idx].max(),
+            "val_start": row_cutoffs[val_idx].min(),
+            "val_end": row_cutoffs[val_idx].max(),
+            "n_train": len(train_idx),
+            "n_val": len(val_idx),
+            "train_churn_rate": y[train_idx].mean(),
+            "val_churn_rate": y[val_idx].mean(),
+            "status": "ok",
+            scoring: np.nan,
+        }
+        rows.append(row)
+
+        # 1. Single-class folds: nothing to fit / score
+        if len(np.unique(y[train_idx])) < 2:
+            row["status"] = "skipped: single-class training fold"
+        elif len(np.unique(y[val_idx])) < 2:
+            row["status"] = "skipped: single-class validation fold"
+        if row["status"] != "ok":
+            print(
+                f"⚠️ Fold {i}: {row['status']} (churn rate {y[train_idx].mean():.2%})"
+            )
+            continue
+
+        # 2. Fit on the training cutoffs (statistics learned on them only)
+        X_train, X_val = _fold_features(snapshots, train_idx, val_idx)
+        steps = (
+            [clone(model)]
+            if preprocessor is None
+            else [clone(preprocessor), clone(model)]
+        )
+        estimator = make_pipeline(*steps)
+        estimator.fit(X_train, y[train_idx])
+        row[scoring] = scorer(estimator, X_val, y[val_idx])
+        print(
+            f"Fold {i}: train <= {row['train_end']:%Y-%m-%d} | "
+            f"val {row['val_start']:%Y-%m-%d} -> {scoring} = {row[scoring]:.4f}"
+        )
+    return pd.DataFrame(rows)
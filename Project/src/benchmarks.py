@@ -0,0 +1,200 @@
+import sys
+import subprocess
+
+import pandas as pd
+
+from .utils import PROJECT_ROOT
+
+# --- 1. IMPORT TIME ---
+
+_IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def benchmark_import_time(
+    modules=("src", "src.utils", "src.features", "src.visualization"), repeats=5
+):
+    """
+    Measures the cold import time of each module in a fresh interpreter
+    (what a short-lived worker or CLI invocation pays at start-up).
+
+    Returns a DataFrame with the min / median time in seconds per module.
+    """
+    rows = []
+    for module in modules:
+        times = []
+        for _ in range(repeats):
+            out = subprocess.run(
+                [sys.executable, "-c", _IMPORT_SNIPPET.format(module=module)],
+                cwd=PROJECT_ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            times.append(float(out.stdout.strip().splitlines()[-1]))
+        rows.append(
+            {
+                "module": module,
+                "min_sec": min(times),
+                "median_sec": float(pd.Series(times).median()),
+            }
+        )
+        print(f"import {module}: {min(times) * 1000:.0f} ms (best of {repeats})")
+    return pd.DataFrame(rows)
+
+
+# --- 2. FEATURE ENGINE ---
+
+
+def benchmark_feature_versions(n_users=2000, versions=None, repeats=3, seed=0):
+    """
+    Times aggregate_user_features (no snapshot and one test snapshot per user)
+    for each feature-set version on a synthetic log of 'n_users' users.
+
+    Returns a DataFrame with the best time in seconds per version / mode.
+    """
+    import time
+
+    from .equivalence import make_synthetic_events
+    from .feature_registry import VERSIONS
+    from .features import aggregate_user_features, extract_user_attributes
+
+    events = extract_user_attributes(make_synthetic_events(n_users, seed=seed))
+    snapshot_df = pd.DataFrame(
+        {"userId": events["userId"].unique(), "cutoff_ts": events["ts"].max()}
+    )
+    print(f"Synthetic log: {len(events)} events, {n_users} users")
+
+    rows = []
+    for version in versions or list(VERSIONS):
+        for mode, snapshots in [("full", None), ("snapshot", snapshot_df)]:
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                aggregate_user_features(events, snapshots, version=version)
+                times.append(time.perf_counter() - start)
+            rows.append({"version": version, "mode": mode, "best_sec": min(times)})
+            print(f"{version}/{mode}: {min(times):.3f}s (best of {repeats})")
+    return pd.DataFrame(rows)
+
+
+# --- 3. EXECUTION BACKENDS ---
+
+
+def _best_time(func, repeats):
+    import time
+
+    times, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def benchmark_backends(
+    raw=None,
+    fractions=(0.01, 0.1, 1.0),
+    n_users=5000,
+    repeats=3,
+    seed=0,
+    backends=("polars", "numba"),
+):
+    """
+    Compares the pandas backend of clean_data, extract_user_attributes,
+    label_churn and aggregate_user_features with the other 'backends'
+    (numba only covers aggregate_user_features) on 1%, 10% and 100% of the users.
+
+    Args:
+        raw: Raw event log. Defaults to data/train.parquet if present,
+             else a synthetic log of 'n_users' users.
+
+    Returns a DataFrame (fraction, n_events, step, backend, pandas_sec,
+    backend_sec, speedup, match) where 'match' checks both outputs column by column.
+    """
+    import numpy as np
+
+    from .cleaning import clean_data
+    from .differential import compare_frames
+    from .features import (
+        AGGREGATION_BACKENDS,
+        BACKENDS,
+        aggregate_user_features,
+        extract_user_attributes,
+        label_churn,
+    )
+
+    if raw is None:
+        data_path = PROJECT_ROOT / "data/train.parquet"
+        if data_path.exists():
+            raw = pd.read_parquet(data_path)
+        else:
+            import io
+
+            from .equivalence import make_synthetic_events
+
+            # Through parquet, so columns are laid out as after load_data
+            buffer = io.BytesIO()
+            make_synthetic_events(n_users, seed=seed).to_parquet(buffer)
+            raw = pd.read_parquet(buffer)
+
+    users = raw["userId"].astype(str).unique()
+    rng = np.random.default_rng(seed)
+
+    rows = []
+    for fraction in fractions:
+        n = max(1, int(round(len(users) * fraction)))
+        sample = set(rng.permutation(users)[:n])
+        df = raw[raw["userId"].astype(str).isin(sample)]
+        events = extract_user_attributes(df)
+        snapshot_df = pd.DataFrame(
+            {"userId": events["userId"].unique(), "cutoff_ts": events["ts"].max()}
+        )
+        # step -> (function of the backend, backends supporting it)
+        steps = {
+            "clean_data": (lambda b: clean_data(df, backend=b), BACKENDS),
+            "extract_user_attributes": (
+                lambda b: extract_user_attributes(df, backend=b),
+                BACKENDS,
+            ),
+            "label_churn": (lambda b: label_churn(events, backend=b), BACKENDS),
+            "aggregate_user_features": (
+                lambda b: aggregate_user_features(events, backend=b),
+                AGGREGATION_BACKENDS,
+            ),
+            "aggregate_user_features (snapshot)": (
+                lambda b: aggregate_user_features(events, snapshot_df, backend=b),
+                AGGREGATION_BACKENDS,
+            ),
+        }
+        for step, (run, supported) in steps.items():
+            pandas_sec, expected = _best_time(lambda: run("pandas"), repeats)
+            for backend in backends:
+                if backend not in supported:
+                    continue
+                backend_sec, actual = _best_time(lambda: run(backend), repeats)
+                rows.append(
+                    {
+                        "fraction": fraction,
+                        "n_events": len(df),
+                        "step": step,
+                        "backend": backend,
+                        "pandas_sec": pandas_sec,
+                        "backend_sec": backend_sec,
+                        "speedup": pandas_sec / backend_sec,
+                        "match": compare_frames(expected, actual).empty,
+                    }
+                )
+                print(
+                    f"{fraction:>5.0%} {step}: pandas {pandas_sec:.3f}s | "
+                    f"{backend} {backend_sec:.3f}s (x{pandas_sec / backend_sec:.1f})"
+                )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    benchmark_import_time()
+    benchmark_feature_versions()
+    benchmark_backends()
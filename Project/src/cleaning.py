@@ -21,14 +21,25 @@ def cast_types(df):
     return df
 
 
-def clean_data(df):
+def clean_data(df, backend="pandas"):
     """
     Performs data cleaning steps:
     - Casts types
     - Drops leakage columns ('auth')
     - Drops redundant columns ('time')
     - Drops PII/irrelevant columns ('firstName', 'lastName')
+
+    backend: "pandas" (default) or "polars" (see polars_backend.py).
     """
+    if backend == "polars":
+        from . import polars_backend
+
+        return polars_backend.clean_data(df)
+    if backend != "pandas":
+        raise ValueError(
+            f"Unknown backend '{backend}'. Choose from ['pandas', 'polars']"
+        )
+
     df = cast_types(df)
 
     # Drop leakage
@@ -0,0 +1,226 @@
+"""
+Faster scoring mode for the soft-voting ensemble of Modeling.ipynb.
+
+VotingClassifier.predict_proba runs its members one after another, and each
+member is a Pipeline(preprocessor, model) that re-applies its own copy of the
+preprocessor. CompiledEnsemble scores the same fitted models differently:
+
+- identical fitted preprocessors (same joblib hash) are applied only once,
+- the tree models run through their native batch predictors (XGBoost
+  inplace_predict, LightGBM / CatBoost boosters, RandomForest) in parallel
+  threads (the libraries release the GIL),
+- the bagged logistic regressions become one stacked (n_features x
+  n_estimators) weight matrix: a single float32 matrix multiply + sigmoid
+  instead of n_estimators predict_proba calls.
+
+The tree models keep their input precision (XGBoost and sklearn forests
+already split on float32 values). compare_scoring times both paths on the
+same rows and checks the probabilities match within a tolerance.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+
+# Tree models scored through their native batch predictor (see _predict_tree)
+TREE_MODELS = {
+    "XGBClassifier": "xgb",
+    "LGBMClassifier": "lgbm",
+    "CatBoostClassifier": "cat",
+    "RandomForestClassifier": "rf",
+    "ExtraTreesClassifier": "rf",
+}
+
+
+def _split_member(estimator):
+    """(preprocessing steps or None, final model) of an ensemble member."""
+    if hasattr(estimator, "steps"):
+        prep = estimator[:-1] if len(estimator.steps) > 1 else None
+        return prep, estimator[-1]
+    return None, estimator
+
+
+def _stack_bagged_lr(model, dtype):
+    """
+    Weight matrix W (n_features x n_estimators) and intercepts b of a
+    BaggingClassifier of binary logistic regressions, or None if it is not one.
+    Each column holds one regression's coefficients on its feature subset.
+    """
+    estimators = getattr(model, "estimators_", None)
+    if type(model).__name__ != "BaggingClassifier" or not estimators:
+        return None
+    if not all(hasattr(est, "coef_") and len(est.classes_) == 2 for est in estimators):
+        return None
+
+    W = np.zeros((model.n_features_in_, len(estimators)))
+    for j, (est, feats) in enumerate(zip(estimators, model.estimators_features_)):
+        np.add.at(W[:, j], feats, est.coef_[0])
+    b = np.array([est.intercept_[0] for est in estimators])
+    return W.astype(dtype), b.astype(dtype)
+
+
+def _predict_tree(kind, model, X):
+    """Probability of class 1 through the model's own batch predictor."""
+    if kind == "xgb":
+        try:
+            rounds = (0, model.best_iteration + 1)
+        except AttributeError:
+            rounds = (0, 0)
+        proba = model.get_booster().inplace_predict(X, iteration_range=rounds)
+        return proba if proba.ndim == 1 else proba[:, 1]
+    if kind == "lgbm":
+        return model.booster_.predict(X)
+    if kind == "cat":
+        return model.predict(X, prediction_type="Probability")[:, 1]
+    return model.predict_proba(X)[:, 1]
+
+
+class CompiledEnsemble:
+    """
+    Soft-voting scorer built from a fitted VotingClassifier.
+
+    Args:
+        ensemble: Fitted VotingClassifier(voting='soft'); members may be
+                  Pipelines(preprocessor, model) as in Modeling.ipynb.
+        dtype: Precision of the stacked logistic-regression matmul.
+        n_threads: Threads for the tree models (default: one per tree model).
+
+    Attributes:
+        members: (name, kind, preprocessing key, model, weight) per member;
+                 kind is 'bag_lr' (stacked), a TREE_MODELS value or 'generic'.
+        preprocessors: {key: fitted preprocessing steps} (applied once each).
+        stacked: {member name: (W, b)} of the stacked bagged regressions.
+    """
+
+    def __init__(self, ensemble, dtype=np.float32, n_threads=None):
+        if getattr(ensemble, "voting", "soft") != "soft":
+            raise ValueError("Only soft voting averages probabilities")
+        self.dtype = dtype
+        self.n_threads = n_threads
+        self.classes_ = ensemble.classes_
+
+        # 1. Fitted members and their voting weights ('drop' members are skipped)
+        names = [name for name, est in ensemble.estimators if est != "drop"]
+        weights = ensemble.weights
+        if weights is None:
+            weights = [1.0] * len(names)
+        else:
+            weights = [
+                w for (_, est), w in zip(ensemble.estimators, weights) if est != "drop"
+            ]
+
+        # 2. One entry per distinct fitted preprocessor, one kind per model
+        self.members, self.preprocessors, self.stacked = [], {}, {}
+        for name, estimator, weight in zip(names, ensemble.estimators_, weights):
+            prep, model = _split_member(estimator)
+            key = None if prep is None else joblib.hash(prep)
+            if key is not None:
+                self.preprocessors.setdefault(key, prep)
+
+            stacked = _stack_bagged_lr(model, dtype)
+            if stacked is not None:
+                kind = "bag_lr"
+                self.stacked[name] = stacked
+            else:
+                kind = TREE_MODELS.get(type(model).__name__, "generic")
+            self.members.append((name, kind, key, model, float(weight)))
+
+        print(
+            f"Compiled {len(self.members)} members: "
+            f"{len(self.preprocessors)} preprocessor(s), "
+            f"{len(self.stacked)} stacked bagged LR(s)"
+        )
+
+    def _inputs(self, X):
+        from scipy import sparse
+
+        inputs = {None: X}
+        for key, prep in self.preprocessors.items():
+            Xp = prep.transform(X)
+            inputs[key] = Xp.toarray() if sparse.issparse(Xp) else np.asarray(Xp)
+        return inputs
+
+    def predict_member_proba(self, X):
+        """{member name: probability of class 1} for every member."""
+        from scipy.special import expit
+
+        inputs = self._inputs(X)
+        trees = [m for m in self.members if m[1] in TREE_MODELS.values()]
+        n_threads = self.n_threads or max(len(trees), 1)
+
+        probas = {}
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            futures = {
+                name: pool.submit(_predict_tree, kind, model, inputs[key])
+                for name, kind, key, model, _ in trees
+            }
+            # Meanwhile: stacked matmuls and other members on the calling thread
+            for name, kind, key, model, _ in self.members:
+                if kind == "bag_lr":
+                    W, b = self.stacked[name]
+                    logits = np.asarray(inputs[key], dtype=self.dtype) @ W + b
+                    probas[name] = expit(logits).mean(axis=1, dtype=np.float64)
+                elif kind == "generic":
+                    probas[name] = model.predict_proba(inputs[key])[:, 1]
+            for name, future in futures.items():
+                probas[name] = np.asarray(future.result(), dtype=np.float64)
+        return probas
+
+    def predict_proba(self, X):
+        """Same layout as VotingClassifier.predict_proba (binary target)."""
+        probas = self.predict_member_proba(X)
+        weights = np.array([m[4] for m in self.members])
+        stacked = np.column_stack([probas[m[0]] for m in self.members])
+        positive = stacked @ weights / weights.sum()
+        return np.column_stack([1 - positive, positive])
+
+
+def compare_scoring(ensemble, X, compiled=None, n_repeats=3, atol=1e-4):
+    """
+    Times the original ensemble against its compiled version on the same rows
+    and checks the churn probabilities agree.
+
+    Args:
+        ensemble: Fitted VotingClassifier.
+        X: Feature rows (the ensemble's input, before preprocessing).
+        compiled: Existing CompiledEnsemble (default: compiled from 'ensemble').
+        n_repeats: Best-of-n timing.
+        atol: Maximum absolute difference allowed between probabilities.
+
+    Returns a dict with both timings, rows/sec, the speed-up, the largest
+    probability difference and whether it is within 'atol'.
+    """
+    compiled = compiled or CompiledEnsemble(ensemble)
+
+    def best_time(predict):
+        times, proba = [], None
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            proba = predict(X)[:, 1]
+            times.append(time.perf_counter() - start)
+        return min(times), proba
+
+    baseline_sec, expected = best_time(ensemble.predict_proba)
+    compiled_sec, actual = best_time(compiled.predict_proba)
+    max_diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+
+    report = {
+        "n_rows": len(X),
+        "baseline_sec": baseline_sec,
+        "compiled_sec": compiled_sec,
+        "baseline_rows_per_sec": len(X) / baseline_sec,
+        "compiled_rows_per_sec": len(X) / compiled_sec,
+        "speedup": baseline_sec / compiled_sec,
+        "max_abs_diff": max_diff,
+        "match": max_diff <= atol,
+    }
+    status = "✅" if report["match"] else "❌"
+    print(
+        f"{status} Compiled scoring: {report['speedup']:.2f}x faster "
+        f"({report['compiled_rows_per_sec']:.0f} vs "
+        f"{report['baseline_rows_per_sec']:.0f} rows/s), "
+        f"max |diff| = {max_diff:.2e} (tolerance {atol:.0e})"
+    )
+    return report
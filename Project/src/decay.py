@@ -0,0 +1,241 @@
+"""
+Exponentially-decayed activity counters (songs, errors, thumbs down, listen
+time) with several half-lives.
+
+The hard 7/14/30-day windows of aggregate_user_features need one filtered
+groupby each, and an event leaving a window makes the trend ratios jump.
+A decayed sum weighs every event by 2 ** (-age / half_life) instead:
+
+    S(t) = sum over events i <= t of x_i * 2 ** (-(t - t_i) / half_life)
+
+It follows the recursion S_k = S_(k-1) * 2 ** (-(t_k - t_(k-1)) / half_life) + x_k,
+so:
+- decayed_features computes every half-life in one pass over each user's
+  sorted events (JIT-compiled with numba when installed), reading each
+  snapshot's value on the way,
+- DecayedCounters updates the sums in O(1) per new event (streaming, see
+  ingestion.UserAggregates).
+
+'{stat}_decay_trend' compares the shortest and longest half-lives like the
+7d-vs-30d trends: for a constant activity rate it is about 1.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .feature_registry import EVENT_FLAGS, WINDOW_STATS
+
+# Decayed statistics: the additive window statistics (stat -> event column)
+DECAY_SIGNALS = {
+    stat: source for stat, (source, agg) in WINDOW_STATS.items() if agg == "sum"
+}
+DECAY_HALF_LIVES = [1, 7, 30]
+
+DAY_NS = 24 * 3600 * 10**9
+
+_kernel = None
+
+
+def decay_name(stat, half_life):
+    return f"{stat}_decay_{half_life:g}d"
+
+
+def trend_name(stat):
+    return f"{stat}_decay_trend"
+
+
+def _rates(half_lives):
+    """Decay rate per day of each half-life: 2 ** (-age / h) = exp(-rate * age)."""
+    return np.log(2) / np.asarray(half_lives, dtype=float)
+
+
+def _days(values):
+    """Datetimes -> float days since the epoch."""
+    return np.asarray(values).astype("datetime64[ns]").view("int64") / DAY_NS
+
+
+# --- 1. BATCH (One recursive pass per user) ---
+
+
+def _decay_kernel(offsets, t, values, row_user, row_ref, order, rates):
+    """
+    Decayed sums of each row at its reference time.
+
+    offsets: start of each user's events (sorted by time) in t / values.
+    order: rows sorted by (user, reference time), so each user's events are
+           read once while its rows are filled in time order.
+    Returns an (n_rows, n_signals, n_half_lives) array.
+    """
+    n_signals, n_half = values.shape[1], len(rates)
+    out = np.zeros((len(row_user), n_signals, n_half))
+    state = np.zeros((n_signals, n_half))
+    user, i, end, last = -1, 0, 0, 0.0
+
+    for k in range(len(order)):
+        r = order[k]
+        if row_user[r] < 0:
+            continue
+        if row_user[r] != user:
+            user = row_user[r]
+            i, end = offsets[user], offsets[user + 1]
+            state[:, :] = 0.0
+            last = t[i] if i < end else 0.0
+
+        # 1. Recursive update with the events up to the reference time
+        ref = row_ref[r]
+        while i < end and t[i] <= ref:
+            for h in range(n_half):
+                factor = np.exp(-rates[h] * (t[i] - last))
+                for s in range(n_signals):
+                    state[s, h] = state[s, h] * factor + values[i, s]
+            last = t[i]
+            i += 1
+
+        # 2. Decay from the last event to the reference time
+        for h in range(n_half):
+            factor = np.exp(-rates[h] * (ref - last))
+            for s in range(n_signals):
+                out[r, s, h] = state[s, h] * factor
+    return out
+
+
+def _compiled_kernel():
+    """JIT-compiles the kernel on first use (plain Python without numba)."""
+    global _kernel
+    if _kernel is None:
+        from .numba_backend import numba_available
+
+        if numba_available():
+            import numba
+
+            _kernel = numba.njit(cache=True)(_decay_kernel)
+        else:
+            print("⚠️ numba is not installed: decayed counters run in plain Python")
+            _kernel = _decay_kernel
+    return _kernel
+
+
+def _signal_values(events, signals):
+    """(n_events, n_signals) float values, flags built from their raw column."""
+    columns = []
+    for source in signals.values():
+        if source in events.columns:
+            columns.append(events[source].fillna(0).to_numpy(dtype=float))
+        else:
+            raw, value = EVENT_FLAGS[source]
+            columns.append((events[raw] == value).to_numpy(dtype=float))
+    return np.column_stack(columns)
+
+
+def decayed_features(df, index, half_lives=None, signals=None):
+    """
+    Decayed counters of each row of a feature index.
+
+    Args:
+        df: Event log (after extract_user_attributes).
+        index: Feature index: userId (reference time = the user's last event,
+               as 'last_active') or (userId, cutoff_ts) (reference = cutoff).
+        half_lives: Half-lives in days (default: DECAY_HALF_LIVES).
+        signals: {stat: event column} (default: DECAY_SIGNALS).
+
+    Returns a DataFrame indexed like 'index' with '{stat}_decay_{h}d' columns
+    and '{stat}_decay_trend' (shortest vs longest half-life).
+    """
+    from .user_index import get_user_index
+
+    half_lives = list(half_lives or DECAY_HALF_LIVES)
+    signals = dict(signals or DECAY_SIGNALS)
+    events = df[df["userId"].notna() & df["ts"].notna()]
+
+    # 1. Rows: user position and reference time (days)
+    if isinstance(index, pd.MultiIndex):
+        row_users = index.get_level_values("userId")
+        row_ref = _days(index.get_level_values("cutoff_ts"))
+    else:
+        row_users = index
+        row_ref = _days(get_user_index(df)["last_ts"].reindex(index))
+    users = pd.Index(row_users.unique())
+    row_user = users.get_indexer(row_users)
+    order = np.lexsort((row_ref, row_user))
+
+    # 2. Events sorted by (user, ts), CSR offsets per user
+    user = users.get_indexer(events["userId"])
+    t = _days(events["ts"])
+    event_order = np.lexsort((t, user))
+    event_order = event_order[user[event_order] >= 0]
+    offsets = np.zeros(len(users) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(user[event_order], minlength=len(users)), out=offsets[1:])
+    values = _signal_values(events, signals)[event_order]
+
+    out = _compiled_kernel()(
+        offsets, t[event_order], values, row_user, row_ref, order, _rates(half_lives)
+    )
+
+    # 3. One column per (stat, half-life), then the trends
+    columns = {}
+    for s, stat in enumerate(signals):
+        for h, half_life in enumerate(half_lives):
+            columns[decay_name(stat, half_life)] = out[:, s, h]
+    decayed = pd.DataFrame(columns, index=index)
+    short, long = min(half_lives), max(half_lives)
+    for stat in signals:
+        decayed[trend_name(stat)] = decayed[decay_name(stat, short)] / (
+            decayed[decay_name(stat, long)] * short / long + 0.1
+        )
+    return decayed
+
+
+# --- 2. STREAMING (O(1) update per event) ---
+
+
+class DecayedCounters:
+    """
+    Decayed sums of several signals for a growing set of rows (e.g. users).
+
+    Args:
+        n_signals: Number of signals per event.
+        half_lives: Half-lives in days (default: DECAY_HALF_LIVES).
+        capacity: Initial number of rows.
+
+    Attributes:
+        state: (capacity, n_signals, n_half_lives) sums as of last_t.
+        last_t: Time (days since the epoch) each row's sums refer to
+                (NaN = no event yet).
+    """
+
+    def __init__(self, n_signals, half_lives=None, capacity=1024):
+        self.half_lives = list(half_lives or DECAY_HALF_LIVES)
+        self.rates = _rates(self.half_lives)
+        self.state = np.zeros((capacity, n_signals, len(self.half_lives)))
+        self.last_t = np.full(capacity, np.nan)
+
+    def grow(self, capacity):
+        extra = capacity - len(self.last_t)
+        self.state = np.concatenate(
+            [self.state, np.zeros((extra,) + self.state.shape[1:])]
+        )
+        self.last_t = np.r_[self.last_t, np.full(extra, np.nan)]
+
+    def update(self, rows, t, values):
+        """
+        Adds a batch of events: row, time (days) and (n_events, n_signals)
+        values. Each row's sums move to its newest time; events may arrive
+        out of order.
+        """
+        # 1. New reference time of each touched row
+        ref = self.last_t.copy()
+        np.fmax.at(ref, rows, t)
+        touched = np.unique(rows)
+
+        # 2. Decay the current sums, then add the decayed events
+        age = np.nan_to_num(ref[touched] - self.last_t[touched])
+        self.state[touched] *= np.exp(-np.outer(age, self.rates))[:, None, :]
+        weights = np.exp(-np.outer(ref[rows] - t, self.rates))
+        np.add.at(self.state, rows, values[:, :, None] * weights[:, None, :])
+        self.last_t[touched] = ref[touched]
+
+    def value_at(self, t, n_rows=None):
+        """Sums of the first n_rows rows decayed to time t (days)."""
+        n_rows = len(self.last_t) if n_rows is None else n_rows
+        age = np.nan_to_num(t - self.last_t[:n_rows])
+        return self.state[:n_rows] * np.exp(-np.outer(age, self.rates))[:, None, :]
@@ -0,0 +1,413 @@
+"""
+Property-based differential harness for optimized feature paths.
+
+Generates many small random event logs that hit the edge cases the feature
+code is sensitive to (single-event users, same-timestamp ties, users with no
+songs, empty rolling windows, snapshots before the first event, churn at the
+same instant as other events, sessionIds shared between users) and compares a
+candidate implementation column by column, within a tolerance, against the
+pandas reference in src/features.py.
+
+On failure the counterexample is shrunk to the smallest set of users that
+still reproduces it.
+
+Example:
+    from src.differential import differential_check
+    differential_check(my_fast_aggregate, target="aggregate_user_features")
+"""
+
+import numpy as np
+import pandas as pd
+
+PAGES = ["NextSong"] * 8 + [
+    "Thumbs Up",
+    "Thumbs Down",
+    "Roll Advert",
+    "Home",
+    "Error",
+    "Submit Downgrade",
+    "Logout",
+]
+
+# Shapes of user histories the generator draws from
+USER_SHAPES = ["normal", "single", "ties", "burst", "sparse", "no_songs"]
+
+# Reference function -> (input it takes, whether it takes a snapshot_df)
+TARGETS = {
+    "aggregate_user_features": ("events", True),
+    "generate_training_data": ("events", False),
+    "label_churn": ("events", False),
+    "extract_user_attributes": ("raw", False),
+    "clean_data": ("raw", False),
+}
+
+# Outcome of a case the reference itself raises on (nothing to compare)
+SKIPPED = "skipped"
+
+# Warn when more than this share of the cases could not be compared
+MAX_SKIPPED_SHARE = 0.5
+
+
+# --- 1. RANDOM EVENT LOGS ---
+
+
+def _user_timestamps(rng, shape, start_ms, n_days):
+    """Sorted event timestamps (ms) for one user history shape."""
+    day_ms = 24 * 3600 * 1000
+    if shape == "single":
+        return np.array([start_ms + int(rng.integers(0, n_days * day_ms))])
+    n = int(rng.integers(2, 40))
+    if shape == "ties":
+        return np.full(n, start_ms + int(rng.integers(0, n_days * day_ms)))
+    if shape == "burst":
+        first = start_ms + int(rng.integers(0, n_days * day_ms))
+        return np.sort(first + rng.integers(0, day_ms // 4, n))
+    if shape == "sparse":
+        # Two clusters far apart: the 7/14/30d windows of the first are empty
+        first = np.sort(start_ms + rng.integers(0, 2 * day_ms, n // 2 + 1))
+        gap = int(rng.integers(31, 60)) * day_ms
+        second = np.sort(first[-1] + gap + rng.integers(0, day_ms, n - len(first)))
+        return np.r_[first, second]
+    # normal: second resolution, so ties happen naturally
+    return np.sort(start_ms + rng.integers(0, n_days * 86400, n) * 1000)
+
+
+def random_event_log(rng, max_users=12, n_days=60, churn_rate=0.3):
+    """
+    Random raw event log (same columns as the Sparkify parquet files).
+    'ts' is in milliseconds, 'registration' is a datetime.
+    """
+    start_ms = pd.Timestamp("2018-10-01").value // 10**6
+    day_ms = 24 * 3600 * 1000
+
+    frames = []
+    for u in range(int(rng.integers(1, max_users + 1))):
+        shape = USER_SHAPES[int(rng.integers(0, len(USER_SHAPES)))]
+        ts = _user_timestamps(rng, shape, start_ms, n_days).astype("int64")
+        n = len(ts)
+
+        pages = rng.choice(np.array(PAGES, dtype=object), n)
+        if shape == "no_songs":
+            pages[pages == "NextSong"] = "Home"
+        if rng.random() < churn_rate:
+            pages[-1] = "Cancellation Confirmation"
+        is_song = pages == "NextSong"
+
+        # Sessions split on gaps > 1h, numbered from 1 for every user (shared ids)
+        sessions = 1 + np.cumsum(np.r_[0, np.diff(ts) > 3600 * 1000])
+        registration = (
+            ts[0] - int(rng.integers(0, 3)) * int(rng.integers(0, 90)) * day_ms
+        )
+
+        frames.append(
+            pd.DataFrame(
+                {
+                    "userId": str(100 + u),
+                    "ts": ts,
+                    "registration": registration,
+                    "page": pages,
+                    "status": np.where(
+                        pages == "Error", 404, np.where(pages == "Logout", 307, 200)
+                    ),
+                    "level": rng.choice(["free", "paid"], n),
+                    "location": rng.choice(
+                        np.array(["Austin, TX", "Tampa, FL", "Nowhere", None]), n
+                    ),
+                    "userAgent": rng.choice(
+                        np.array(["Mozilla Windows", "Macintosh", "iPhone", None]), n
+                    ),
+                    "sessionId": sessions.astype("int64"),
+                    "length": np.where(is_song, rng.uniform(30, 600, n), np.nan),
+                    "song": np.where(
+                        is_song, [f"s{i}" for i in rng.integers(0, 8, n)], None
+                    ),
+                    "artist": np.where(
+                        is_song, [f"a{i}" for i in rng.integers(0, 4, n)], None
+                    ),
+                    "gender": rng.choice(["M", "F"], n),
+                    "itemInSession": np.arange(n),
+                    "auth": "Logged In",
+                }
+            )
+        )
+
+    df = pd.concat(frames, ignore_index=True)
+    df["registration"] = pd.to_datetime(df["registration"], unit="ms")
+    return df
+
+
+def random_snapshots(rng, events, max_per_user=3):
+    """
+    Random (userId, cutoff_ts) pairs: before the first event, exactly on an
+    event timestamp, between events, and after the last event (dormancy).
+    """
+    day = pd.Timedelta(days=1)
+    rows = []
+    for user_id, ts in events.groupby("userId")["ts"]:
+        for _ in range(int(rng.integers(1, max_per_user + 1))):
+            kind = int(rng.integers(0, 4))
+            if kind == 0:
+                cutoff = ts.min() - day * float(rng.uniform(0, 5))
+            elif kind == 1:
+                cutoff = ts.iloc[int(rng.integers(0, len(ts)))]
+            elif kind == 2:
+                cutoff = ts.min() + (ts.max() - ts.min()) * float(rng.random())
+            else:
+                cutoff = ts.max() + day * float(rng.uniform(0, 45))
+            rows.append({"userId": user_id, "cutoff_ts": cutoff})
+    return pd.DataFrame(rows).drop_duplicates(ignore_index=True)
+
+
+def random_case(rng, max_users=12, with_snapshots=True):
+    """One random test case: raw log, parsed events and (maybe) snapshots."""
+    from .features import extract_user_attributes
+
+    raw = random_event_log(rng, max_users=max_users)
+    events = extract_user_attributes(raw)
+    snapshots = None
+    if with_snapshots and rng.random() < 0.5:
+        snapshots = random_snapshots(rng, events)
+    return {"raw": raw, "events": events, "snapshots": snapshots}
+
+
+# --- 2. COLUMN-BY-COLUMN COMPARISON ---
+
+
+def compare_frames(expected, actual, rtol=1e-7, atol=1e-9, sort_index=False):
+    """
+    Compares two feature frames column by column.
+
+    Numeric columns must match within rtol / atol (NaN == NaN), other columns
+    exactly. Returns a DataFrame of mismatches (empty when equivalent):
+    column, n_mismatch, max_abs_diff, first_index.
+    """
+    if sort_index:
+        expected, actual = expected.sort_index(), actual.sort_index()
+
+    problems = []
+    if list(expected.columns) != list(actual.columns):
+        problems.append(
+            {
+                "column": "<columns>",
+                "n_mismatch": len(set(expected.columns) ^ set(actual.columns)),
+                "max_abs_diff": np.nan,
+                "first_index": f"expected {list(expected.columns)}, "
+                f"got {list(actual.columns)}",
+            }
+        )
+    if len(expected) != len(actual) or not expected.index.equals(actual.index):
+        problems.append(
+            {
+                "column": "<index>",
+                "n_mismatch": abs(len(expected) - len(actual)),
+                "max_abs_diff": np.nan,
+                "first_index": f"{len(expected)} rows expected, {len(actual)} got",
+            }
+        )
+        return pd.DataFrame(problems)
+
+    for col in expected.columns:
+        if col not in actual.columns:
+            continue
+        exp, act = expected[col], actual[col]
+        both_nan = exp.isna().to_numpy() & act.isna().to_numpy()
+        if pd.api.types.is_numeric_dtype(exp) and pd.api.types.is_numeric_dtype(act):
+            e = exp.to_numpy(dtype=float)
+            a = act.to_numpy(dtype=float)
+            close = np.isclose(a, e, rtol=rtol, atol=atol) | both_nan
+            with np.errstate(invalid="ignore"):
+                diff = np.abs(a - e)
+            max_diff = float(np.nanmax(np.where(close, 0.0, diff), initial=0.0))
+        else:
+            close = (exp.to_numpy() == act.to_numpy()) | both_nan
+            max_diff = np.nan
+        if not close.all():
+            problems.append(
+                {
+                    "column": col,
+                    "n_mismatch": int((~close).sum()),
+                    "max_abs_diff": max_diff,
+                    "first_index": expected.index[int(np.argmin(close))],
+                }
+            )
+    return pd.DataFrame(
+        problems, columns=["column", "n_mismatch", "max_abs_diff", "first_index"]
+    )
+
+
+# --- 3. DIFFERENTIAL CHECK ---
+
+
+def _run(func, case, inputs, with_snapshots):
+    args = [case[inputs]]
+    if with_snapshots:
+        args.append(case["snapshots"])
+    return func(*args)
+
+
+def _outcome(candidate, reference, case, inputs, with_snapshots, rtol, atol):
+    """
+    None if both agree, SKIPPED if the reference raises (the candidate may then
+    do anything, nothing is compared), else a mismatch DataFrame / error string.
+    """
+    try:
+        expected = _run(reference, case, inputs, with_snapshots)
+    except Exception:
+        return SKIPPED
+    try:
+        actual = _run(candidate, case, inputs, with_snapshots)
+    except Exception as e:
+        return f"candidate raised {type(e).__name__}: {e}"
+    mismatches = compare_frames(expected, actual, rtol=rtol, atol=atol)
+    return mismatches if len(mismatches) else None
+
+
+def _failed(outcome):
+    return outcome is not None and not (isinstance(outcome, str) and outcome == SKIPPED)
+
+
+def _subset(case, users):
+    """Case restricted to some users (used to shrink counterexamples)."""
+    out = {}
+    for key in ("raw", "events", "snapshots"):
+        frame = case[key]
+        out[key] = None if frame is None else frame[frame["userId"].isin(users)]
+    return out
+
+
+def _shrink(case, fails):
+    """Greedily drops users while the failure still reproduces."""
+    users = list(pd.unique(case["events"]["userId"]))
+    changed = True
+    while changed and len(users) > 1:
+        changed = False
+        for user in list(users):
+            trial = [u for u in users if u != user]
+            if fails(_subset(case, trial)):
+                users = trial
+                changed = True
+    return _subset(case, users)
+
+
+def differential_check(
+    candidate,
+    target="aggregate_user_features",
+    reference=None,
+    n_cases=100,
+    seed=0,
+    max_users=12,
+    rtol=1e-7,
+    atol=1e-9,
+    shrink=True,
+    raise_on_failure=True,
+):
+    """
+    Runs 'candidate' and the pandas reference on 'n_cases' random logs and
+    compares their outputs column by column.
+
+    Args:
+        candidate: Fast path with the same signature as the reference
+                   (events[, snapshot_df]) -> DataFrame.
+        target: Name of the reference in TARGETS (e.g. "label_churn").
+        reference: Optional callable overriding the reference function.
+        rtol, atol: Tolerance for numeric columns.
+        shrink: Reduce the first counterexample to the fewest users.
+
+    Cases the reference raises on are skipped and counted in n_skipped; the
+    check fails when no case could be compared, and warns when more than
+    MAX_SKIPPED_SHARE of them were skipped.
+
+    Returns a dict: n_cases, n_failed, n_skipped, counterexample (case dict or
+    None), mismatches (DataFrame / error of the counterexample).
+    """
+    from . import cleaning, features
+
+    inputs, with_snapshots = TARGETS[target]
+    if reference is None:
+        module = cleaning if target == "clean_data" else features
+        reference = getattr(module, target)
+
+    rng = np.random.default_rng(seed)
+    n_failed, n_skipped, first = 0, 0, None
+    for _ in range(n_cases):
+        case = random_case(rng, max_users=max_users, with_snapshots=with_snapshots)
+        outcome = _outcome(
+            candidate, reference, case, inputs, with_snapshots, rtol, atol
+        )
+        if outcome is None:
+            continue
+        if not _failed(outcome):
+            n_skipped += 1
+            continue
+        n_failed += 1
+        if first is None:
+            first = case
+
+    mismatches = None
+    if first is not None:
+        if shrink:
+            first = _shrink(
+                first,
+                lambda c: _failed(
+                    _outcome(
+                        candidate, reference, c, inputs, with_snapshots, rtol, atol
+                    )
+                ),
+            )
+        mismatches = _outcome(
+            candidate, reference, first, inputs, with_snapshots, rtol, atol
+        )
+
+    result = {
+        "n_cases": n_cases,
+        "n_failed": n_failed,
+        "n_skipped": n_skipped,
+        "counterexample": first,
+        "mismatches": mismatches,
+    }
+    n_compared = n_cases - n_skipped
+    if n_skipped:
+        print(f"⚠️ {target}: the reference raised on {n_skipped}/{n_cases} cases")
+    if n_compared == 0:
+        print(f"❌ {target}: no case could be compared with the reference")
+        if raise_on_failure:
+            raise AssertionError(
+                f"{target}: the reference raised on all {n_cases} cases, "
+                "nothing was compared"
+            )
+    elif n_failed == 0:
+        print(f"✅ {target}: {n_compared} random cases match the reference")
+        if n_skipped > MAX_SKIPPED_SHARE * n_cases:
+            print(
+                f"⚠️ {target}: most cases were skipped, check the reference "
+                "accepts the generated inputs"
+            )
+    else:
+        print(f"❌ {target}: {n_failed}/{n_compared} compared cases differ")
+        print(mismatches)
+        if raise_on_failure:
+            raise AssertionError(
+                f"{target}: candidate differs from the reference on "
+                f"{n_failed}/{n_compared} compared cases "
+                "(see result['counterexample'])"
+            )
+    return result
+
+
+if __name__ == "__main__":
+    import joblib
+
+    from .features import aggregate_user_features
+    from .utils import PROJECT_ROOT
+
+    # Self-check: the pruned feature list must match the full computation
+    names = list(joblib.load(PROJECT_ROOT / "models/feature_names.joblib"))
+
+    def pruned(events, snapshot_df=None):
+        return aggregate_user_features(events, snapshot_df, features=names)
+
+    def full(events, snapshot_df=None):
+        out = aggregate_user_features(events, snapshot_df)
+        return out[names + (["target"] if snapshot_df is None else [])]
+
+    differential_check(pruned, reference=full)
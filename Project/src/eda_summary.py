@@ -0,0 +1,192 @@
+"""
+Out-of-core user-level summaries for the EDA plots (visualization.py).
+
+The churn plots only need one row per user (last category, mean of numerical
+columns, churn status) and the number of events per (user, page). EDASummary
+streams the event log once, in record batches, and keeps only:
+
+- 'users': a compact user-level table,
+- 'page_counts': a sparse (n_users x n_pages) CSR matrix of page visits,
+
+so the full parquet file never has to fit in memory. The plot functions
+accept either an EDASummary or an event DataFrame (summarised on the fly).
+"""
+
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from .user_index import CHURN_PAGE
+
+# User-level columns kept by default (when present in the log)
+CATEGORICAL_COLUMNS = ["level", "gender", "location", "userAgent", "state", "platform"]
+NUMERICAL_COLUMNS = ["length", "itemInSession", "account_age_days"]
+
+# Users with only null values get this category (as in the baseline EDA plots)
+UNKNOWN_COLUMNS = ["location", "userAgent"]
+UNKNOWN = "Unknown"
+
+
+def _partial(batch, categorical, numerical):
+    """Per-user partial aggregates of one record batch."""
+    batch = batch[batch["userId"].notna()]
+    events = pd.DataFrame(
+        {
+            "userId": batch["userId"],
+            "n_events": 1,
+            "first_ts": batch["ts"],
+            "last_ts": batch["ts"],
+            "churn_ts": batch["ts"].where(batch["page"] == CHURN_PAGE),
+        }
+    )
+    aggs = {"n_events": "sum", "first_ts": "min", "last_ts": "max", "churn_ts": "min"}
+    for col in categorical:
+        events[col] = batch[col]
+        aggs[col] = "last"
+    for col in numerical:
+        events[f"{col}_sum"] = batch[col]
+        events[f"{col}_count"] = batch[col].notna().astype(int)
+        aggs[f"{col}_sum"] = "sum"
+        aggs[f"{col}_count"] = "sum"
+    users = events.groupby("userId").agg(aggs)
+    pages = batch.groupby(["userId", "page"]).size()
+    return users, pages, aggs
+
+
+class EDASummary:
+    """
+    User-level table + sparse user x page counts built in one streaming pass.
+
+    Attributes:
+        users: DataFrame indexed by userId (sorted): n_events, first_ts,
+               last_ts, churn_ts, is_churner, the last non-null value of each
+               categorical column ("Unknown" for location / userAgent if all
+               are null) and the mean of each numerical column.
+        pages: Page names (columns of page_counts, sorted).
+        page_counts: scipy.sparse CSR matrix (n_users x n_pages) of events.
+    """
+
+    def __init__(self, users, pages, page_counts):
+        self.users = users
+        self.pages = pd.Index(pages, name="page")
+        self.page_counts = page_counts
+
+    # --- 1. BUILD (One pass over the record batches) ---
+
+    @classmethod
+    def from_batches(cls, batches, categorical=None, numerical=None):
+        """
+        Summarises an iterable of event DataFrames (in log order).
+
+        Args:
+            categorical: Columns summarised by their last non-null value.
+            numerical: Columns summarised by their mean.
+        """
+        from scipy import sparse
+
+        categorical = CATEGORICAL_COLUMNS if categorical is None else categorical
+        numerical = NUMERICAL_COLUMNS if numerical is None else numerical
+
+        users, pages, aggs = None, None, None
+        for batch in batches:
+            cat = [c for c in categorical if c in batch]
+            num = [c for c in numerical if c in batch]
+            part_users, part_pages, aggs = _partial(batch, cat, num)
+
+            # Running totals: later batches override 'last', sums add up
+            if users is None:
+                users, pages = part_users, part_pages
+            else:
+                users = pd.concat([users, part_users]).groupby(level=0).agg(aggs)
+                pages = pd.concat([pages, part_pages]).groupby(level=[0, 1]).sum()
+
+        if users is None:
+            raise ValueError("No events to summarise")
+
+        # 1. Means of the numerical columns, churn status, datetimes, unknowns
+        for col in [c for c in UNKNOWN_COLUMNS if c in users.columns]:
+            users[col] = users[col].fillna(UNKNOWN)
+        for col in [c[: -len("_sum")] for c in aggs if c.endswith("_sum")]:
+            users[col] = users.pop(f"{col}_sum") / users.pop(f"{col}_count")
+        for col in ["first_ts", "last_ts", "churn_ts"]:
+            if pd.api.types.is_numeric_dtype(users[col]):
+                # 'ts' is in milliseconds in the raw parquet files
+                users[col] = pd.to_datetime(users[col], unit="ms")
+        users["is_churner"] = users["churn_ts"].notna().astype(int)
+
+        # 2. Sparse user x page matrix
+        page_names = pages.index.get_level_values("page").unique().sort_values()
+        rows = users.index.get_indexer(pages.index.get_level_values("userId"))
+        cols = page_names.get_indexer(pages.index.get_level_values("page"))
+        page_counts = sparse.csr_matrix(
+            (pages.to_numpy(), (rows, cols)), shape=(len(users), len(page_names))
+        )
+        return cls(users, page_names, page_counts)
+
+    @classmethod
+    def from_frame(cls, df, categorical=None, numerical=None):
+        """Summary of an in-memory event DataFrame."""
+        return cls.from_batches([df], categorical, numerical)
+
+    @classmethod
+    def from_parquet(cls, path, batch_size=500_000, categorical=None, numerical=None):
+        """
+        Streams a parquet file in record batches of 'batch_size' rows: only the
+        needed columns are read and at most one batch is in memory at a time.
+        """
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        available = set(parquet.schema_arrow.names)
+        wanted = ["userId", "ts", "page"]
+        wanted += CATEGORICAL_COLUMNS if categorical is None else list(categorical)
+        wanted += NUMERICAL_COLUMNS if numerical is None else list(numerical)
+        columns = [c for c in dict.fromkeys(wanted) if c in available]
+
+        batches = (
+            batch.to_pandas()
+            for batch in parquet.iter_batches(batch_size=batch_size, columns=columns)
+        )
+        summary = cls.from_batches(batches, categorical, numerical)
+        print(
+            f"✅ Summarised {summary.users['n_events'].sum()} events: "
+            f"{len(summary.users)} users x {len(summary.pages)} pages"
+        )
+        return summary
+
+    # --- 2. READ-OUT ---
+
+    def page_proportions(self):
+        """Sparse matrix of each user's share of events per page (rows sum to 1)."""
+        proportions = self.page_counts.astype(float)
+        totals = np.asarray(proportions.sum(axis=1)).ravel()
+        proportions.data /= np.repeat(totals, np.diff(proportions.indptr))
+        return proportions
+
+    # --- 3. PERSISTENCE ---
+
+    def save(self, directory):
+        """Writes users.parquet + page_counts.npz (+ the page names)."""
+        from scipy import sparse
+
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.users.to_parquet(directory / "users.parquet")
+        sparse.save_npz(directory / "page_counts.npz", self.page_counts)
+        pd.Series(self.pages, name="page").to_frame().to_parquet(
+            directory / "pages.parquet"
+        )
+        print(f"-> Saved EDA summary to {directory}")
+        return directory
+
+    @classmethod
+    def load(cls, directory):
+        from scipy import sparse
+
+        directory = pathlib.Path(directory)
+        return cls(
+            pd.read_parquet(directory / "users.parquet"),
+            pd.read_parquet(directory / "pages.parquet")["page"],
+            sparse.load_npz(directory / "page_counts.npz").tocsr(),
+        )
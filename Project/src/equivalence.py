@@ -0,0 +1,237 @@
+"""
+Equivalence checks for the feature engine.
+
+Each feature-set version (see feature_registry.VERSIONS) must reproduce the
+output of the implementation it was consolidated from. The reference outputs
+were computed once with the original code (src/features.py before the registry
+refactor for "current", experiment_reports/all-time-high/old_features.py for
+"all_time_high") on the deterministic synthetic log below, and stored as
+parquet files in experiment_reports/golden/. The original all-time-high
+module is kept unchanged and also compared live (build_original_cases).
+
+Anchoring of the golden files to the pre-refactor code:
+- full / snapshot (both versions): written by the original code, unchanged.
+- train (both versions): regenerated when training_snapshots moved to
+  counter-based random cutoffs (sampling.py). They were computed with the
+  original aggregate_user_features and target join on the new cutoffs, so
+  only the snapshot sampling is new code. Same rows per user and targets,
+  only the random cutoffs changed.
+
+Run: python -m src.equivalence
+"""
+
+import numpy as np
+import pandas as pd
+
+from .utils import PROJECT_ROOT
+
+GOLDEN_DIR = PROJECT_ROOT / "experiment_reports/golden/"
+
+# Original implementations still in the tree, also compared live
+ORIGINAL_MODULES = {
+    "all_time_high": PROJECT_ROOT / "experiment_reports/all-time-high/old_features.py",
+}
+
+PAGES = ["NextSong"] * 12 + [
+    "Thumbs Up",
+    "Thumbs Down",
+    "Roll Advert",
+    "Home",
+    "Help",
+    "Error",
+    "Submit Downgrade",
+    "Add to Playlist",
+    "Logout",
+]
+
+
+# --- 1. SYNTHETIC EVENT LOG ---
+
+
+def make_synthetic_events(n_users=60, seed=0, n_days=50):
+    """
+    Builds a small raw event log with the columns of the Sparkify parquet files.
+
+    - 'ts' in milliseconds (as in the raw files), 'registration' as datetime
+    - every 4th user churns (last event = Cancellation Confirmation)
+    - every 7th user has all events at the same timestamp (ties)
+    - sessions are split on gaps > 1 hour
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2018-10-01").value // 10**6
+    day_ms = 24 * 3600 * 1000
+
+    frames = []
+    next_session = 0
+    for u in range(n_users):
+        n = int(rng.integers(1, 300))
+        registration = start - int(rng.integers(0, 90)) * day_ms
+        ts = np.sort(start + rng.integers(0, n_days * day_ms, n))
+        if u % 7 == 0:
+            ts[:] = ts[0]
+        sessions = np.cumsum(np.r_[0, np.diff(ts) > 3600 * 1000]) + next_session
+        next_session = sessions.max() + 1
+
+        pages = rng.choice(np.array(PAGES, dtype=object), n)
+        if u % 4 == 0:
+            pages[-1] = "Cancellation Confirmation"
+        is_song = pages == "NextSong"
+
+        frames.append(
+            pd.DataFrame(
+                {
+                    "userId": str(1000 + u),
+                    "ts": ts.astype("int64"),
+                    "registration": registration,
+                    "page": pages,
+                    "status": np.where(
+                        pages == "Error", 404, np.where(pages == "Logout", 307, 200)
+                    ),
+                    "level": rng.choice(["free", "paid"], n),
+                    "location": rng.choice(["Austin, TX", "Tampa, FL", "Nowhere"], n),
+                    "userAgent": rng.choice(
+                        np.array(["Mozilla Windows", "Macintosh", "iPhone", None]), n
+                    ),
+                    "sessionId": sessions.astype("int64"),
+                    "length": np.where(is_song, rng.uniform(100, 300, n), np.nan),
+                    "song": np.where(
+                        is_song, [f"s{i}" for i in rng.integers(0, 40, n)], None
+                    ),
+                    "artist": np.where(
+                        is_song, [f"a{i}" for i in rng.integers(0, 15, n)], None
+                    ),
+                    "gender": rng.choice(["M", "F"], n),
+                    "itemInSession": np.arange(n),
+                }
+            )
+        )
+
+    df = pd.concat(frames, ignore_index=True)
+    df["registration"] = pd.to_datetime(df["registration"], unit="ms")
+    return df
+
+
+# --- 2. CASES ---
+
+
+def build_cases(version, events=None):
+    """
+    Computes the outputs compared against the golden files:
+    - full: aggregate_user_features without snapshots (legacy target)
+    - snapshot: one snapshot per user at the global max timestamp (test set)
+    - train: generate_training_data (random snapshots + target)
+    """
+    from .features import (
+        aggregate_user_features,
+        extract_user_attributes,
+        generate_training_data,
+    )
+
+    if events is None:
+        events = make_synthetic_events()
+    events = extract_user_attributes(events)
+    snapshot_df = pd.DataFrame(
+        {"userId": events["userId"].unique(), "cutoff_ts": events["ts"].max()}
+    )
+    return {
+        "full": aggregate_user_features(events, version=version),
+        "snapshot": aggregate_user_features(events, snapshot_df, version=version),
+        "train": generate_training_data(events, version=version),
+    }
+
+
+def _load_original(version):
+    """Imports the pinned original implementation of a version (by file path)."""
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(
+        f"original_{version}", ORIGINAL_MODULES[version]
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_original_cases(version, events=None):
+    """
+    Same cases computed with the original implementation of a version.
+
+    The original generate_training_data draws its cutoffs with np.random, so
+    'train' runs the original aggregation and target join on the cutoffs of
+    features.training_snapshots: only the sampling is shared with the engine.
+    """
+    from .features import training_snapshots
+
+    original = _load_original(version)
+    if events is None:
+        events = make_synthetic_events()
+    events = original.extract_user_attributes(events)
+    snapshot_df = pd.DataFrame(
+        {"userId": events["userId"].unique(), "cutoff_ts": events["ts"].max()}
+    )
+    train_snapshots = training_snapshots(events)
+    train = original.aggregate_user_features(events, train_snapshots)
+    train = train.join(train_snapshots.set_index(["userId", "cutoff_ts"])[["target"]])
+    return {
+        "full": original.aggregate_user_features(events),
+        "snapshot": original.aggregate_user_features(events, snapshot_df),
+        "train": train.reset_index(),
+    }
+
+
+def golden_path(version, case):
+    return GOLDEN_DIR / f"{version}_{case}.parquet"
+
+
+# --- 3. CHECK ---
+
+
+def check_version_equivalence(versions=None, rtol=1e-9):
+    """
+    Recomputes every case for each version and compares it column by column
+    with its golden file (same columns, order, index and values within rtol),
+    and with the original implementation when it is still in the tree
+    (ORIGINAL_MODULES, case names suffixed with '/original').
+
+    Returns a DataFrame (version, case, n_rows, n_cols, status).
+    Raises AssertionError if any version drifted from its original output.
+    """
+    from .feature_registry import VERSIONS
+
+    rows, failures = [], []
+    for version in versions or list(VERSIONS):
+        results = build_cases(version)
+        references = {
+            case: pd.read_parquet(golden_path(version, case)) for case in results
+        }
+        if version in ORIGINAL_MODULES:
+            for case, expected in build_original_cases(version).items():
+                references[f"{case}/original"] = expected
+        for case, expected in references.items():
+            result = results[case.split("/")[0]]
+            try:
+                pd.testing.assert_frame_equal(
+                    result, expected, check_exact=False, rtol=rtol
+                )
+                status = "OK"
+            except AssertionError as e:
+                status = "FAILED"
+                failures.append(f"{version}/{case}: {e}")
+            rows.append(
+                {
+                    "version": version,
+                    "case": case,
+                    "n_rows": len(result),
+                    "n_cols": result.shape[1],
+                    "status": status,
+                }
+            )
+            print(f"{'✅' if status == 'OK' else '❌'} {version}/{case}: {status}")
+
+    if failures:
+        raise AssertionError("\n\n".join(failures))
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    check_version_equivalence()
@@ -0,0 +1,506 @@
+"""
+Declarative registry of the user-level features built by aggregate_user_features.
+
+Every column is a FeatureSpec that declares what it needs:
+- "base" columns come from the single per-user groupby (step 4),
+- "window" columns from the rolling-window groupbys (step 5),
+- "sessions", "last_event" and "last_session" columns from event-level passes,
+- "derived" columns are computed from other columns (ratios, logs, trends).
+
+Asking for a subset of features (e.g. the pruned list in feature_names.joblib)
+only computes the aggregations that subset depends on.
+"""
+
+import numpy as np
+
+
+class FeatureSpec:
+    """
+    One user-level column.
+
+    Args:
+        name: Column name.
+        kind: "base", "window", "sessions", "last_event", "last_session",
+              "target", "derived" or "fitted" (FITTED_STATS).
+        requires: Names of the columns it is computed from.
+        stage: Execution stage. Missing values are filled with 0 at the end of
+               stages 1 and 2 (same behaviour as the original pipeline).
+        source, agg: Event column and aggregation (base / window / last_session).
+        days: Window length (window columns).
+        compute: Function (user_features, ctx) -> Series (derived columns),
+                 or (user_features) -> learned value (fitted statistics).
+    """
+
+    def __init__(
+        self,
+        name,
+        kind,
+        requires=(),
+        stage=2,
+        source=None,
+        agg=None,
+        days=None,
+        compute=None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.requires = tuple(requires)
+        self.stage = stage
+        self.source = source
+        self.agg = agg
+        self.days = days
+        self.compute = compute
+
+    def __repr__(self):
+        return (
+            f"FeatureSpec({self.name!r}, kind={self.kind!r}, requires={self.requires})"
+        )
+
+
+# Registration order = execution order inside a stage
+FEATURES = {}
+
+
+def _add(spec):
+    FEATURES[spec.name] = spec
+    return spec
+
+
+def derived(name, requires, stage=2):
+    """Decorator registering a derived feature computed from other columns."""
+
+    def decorator(func):
+        _add(FeatureSpec(name, "derived", requires, stage, compute=func))
+        return func
+
+    return decorator
+
+
+# Statistics of the whole frame a derived column depends on (batch-dependent):
+# name -> FeatureSpec whose compute(user_features) returns the learned value
+FITTED_STATS = {}
+
+
+def fitted(name, requires):
+    """Decorator registering a statistic learned once by FeatureTransformer.fit."""
+
+    def decorator(func):
+        FITTED_STATS[name] = FeatureSpec(name, "fitted", requires, compute=func)
+        return func
+
+    return decorator
+
+
+def _per_day(uf, col):
+    """Log-transformed rate per day of account lifetime."""
+    return np.log1p(uf[col] / (uf["account_lifetime"] + 1))
+
+
+# Event-level flags created when missing: flag -> (raw column, value)
+EVENT_FLAGS = {
+    "is_error": ("status", 404),
+    "is_song": ("page", "NextSong"),
+    "is_thumbs_up": ("page", "Thumbs Up"),
+    "is_thumbs_down": ("page", "Thumbs Down"),
+    "is_ad": ("page", "Roll Advert"),
+    "downgrade": ("page", "Submit Downgrade"),
+}
+
+
+# --- 1. Base Aggregation (Static & Total Counts) ---
+
+BASE_AGGS = {
+    "gender": ("gender", "first"),  # all_time_high only
+    "level": ("level", "last"),  # Current level
+    "registration": ("registration", "first"),
+    "platform": ("platform", "first"),  # all_time_high only
+    "state": ("state", "first"),  # Kept for Frequency Encoding
+    "last_active": ("last_active", "max"),  # This will be the cutoff_ts if provided
+    "is_thumbs_up": ("is_thumbs_up", "sum"),
+    "is_thumbs_down": ("is_thumbs_down", "sum"),
+    "is_ad": ("is_ad", "sum"),
+    "is_error": ("is_error", "sum"),
+    "is_song": ("is_song", "sum"),
+    "length": ("length", "sum"),  # Total listening time
+    "downgrade": ("downgrade", "max"),  # Has ever downgraded
+}
+
+for _name, (_source, _agg) in BASE_AGGS.items():
+    _add(FeatureSpec(_name, "base", stage=1, source=_source, agg=_agg))
+
+
+# --- 2. Rolling Window Aggregations ---
+
+WINDOW_STATS = {
+    "songs": ("is_song", "sum"),
+    "errors": ("is_error", "sum"),
+    "thumbs_down": ("is_thumbs_down", "sum"),
+    "listen_time": ("length", "sum"),
+    "unique_artists": ("artist", "nunique"),  # Diversity
+    "unique_songs": ("song", "nunique"),  # Diversity
+}
+
+# PRUNING: Dropped 1d and 3d windows to reduce noise
+WINDOWS = [7, 14, 30]
+# The all_time_high feature set still uses them
+ALL_WINDOWS = [1, 3, 7, 14, 30]
+
+
+def window_name(stat, days):
+    return f"{stat}_last_{days}d"
+
+
+for _days in ALL_WINDOWS:
+    for _stat, (_source, _agg) in WINDOW_STATS.items():
+        _add(
+            FeatureSpec(
+                window_name(_stat, _days),
+                "window",
+                stage=1,
+                source=_source,
+                agg=_agg,
+                days=_days,
+            )
+        )
+
+
+# --- 3. Derived Ratios, Trends, Gaps & Session Quality (stage 2) ---
+
+
+@derived("account_lifetime", ["last_active", "registration"])
+def _account_lifetime(uf, ctx):
+    return (uf["last_active"] - uf["registration"]).dt.total_seconds() / (24 * 3600)
+
+
+@derived("avg_songs_per_day", ["is_song", "account_lifetime"])
+def _avg_songs_per_day(uf, ctx):
+    # Log version (the raw ratio was overwritten by it in the original pipeline)
+    return _per_day(uf, "is_song")
+
+
+@derived("thumbs_ratio", ["is_thumbs_up", "is_thumbs_down"])
+def _thumbs_ratio(uf, ctx):
+    return uf["is_thumbs_up"] / (uf["is_thumbs_up"] + uf["is_thumbs_down"] + 1)
+
+
+# Clipped to handle extreme outliers (REMOVED from "current" IN EXP 17: High divergence)
+@derived("errors_per_song", ["is_error", "is_song"])
+def _errors_per_song(uf, ctx):
+    return (uf["is_error"] / (uf["is_song"] + 1)).clip(upper=5.0)
+
+
+# A. Trends (7d vs 30d)
+@derived("trend_songs_7d_vs_30d", ["songs_last_7d", "songs_last_30d"])
+def _trend_songs(uf, ctx):
+    return uf["songs_last_7d"] / ((uf["songs_last_30d"] / 4) + 0.1)
+
+
+@derived("trend_listen_time_7d_vs_30d", ["listen_time_last_7d", "listen_time_last_30d"])
+def _trend_listen_time(uf, ctx):
+    return uf["listen_time_last_7d"] / ((uf["listen_time_last_30d"] / 4) + 0.1)
+
+
+@derived("trend_errors_7d_vs_30d", ["errors_last_7d", "errors_last_30d"])
+def _trend_errors(uf, ctx):
+    return uf["errors_last_7d"] / ((uf["errors_last_30d"] / 4) + 0.01)
+
+
+# B. Gap Analysis (Recency & Regularity)
+_add(FeatureSpec("total_sessions", "sessions", stage=2, source="sessionId"))
+
+
+@derived("avg_days_between_sessions", ["account_lifetime", "total_sessions"])
+def _avg_days_between_sessions(uf, ctx):
+    return uf["account_lifetime"] / uf["total_sessions"]
+
+
+# Rate Features (Log-Transformed, time-invariant between Train Snapshots and Test)
+for _name, _col in [
+    ("sessions_per_day", "total_sessions"),
+    ("thumbs_up_per_day", "is_thumbs_up"),
+    ("thumbs_down_per_day", "is_thumbs_down"),
+    ("ads_per_day", "is_ad"),
+    ("errors_per_day", "is_error"),
+    ("listen_time_per_day", "length"),
+]:
+    derived(_name, [_col, "account_lifetime"])(
+        lambda uf, ctx, _col=_col: _per_day(uf, _col)
+    )
+
+# EXP 21: Log-Transformed Volume Features
+for _days in WINDOWS:
+    for _stat in ["songs", "errors", "listen_time"]:
+        _src = window_name(_stat, _days)
+        derived(f"log_{_src}", [_src])(lambda uf, ctx, _src=_src: np.log1p(uf[_src]))
+
+# Recency: actual last event before the cutoff
+_add(FeatureSpec("last_event_ts", "last_event", stage=2, source="ts"))
+
+
+@derived("days_since_last_session", ["last_active", "last_event_ts"])
+def _days_since_last_session(uf, ctx):
+    days = (uf["last_active"] - uf["last_event_ts"]).dt.total_seconds() / (24 * 3600)
+    return days.fillna(0)
+
+
+# C. Session Quality
+@derived("avg_songs_per_session", ["is_song", "total_sessions"])
+def _avg_songs_per_session(uf, ctx):
+    return uf["is_song"] / uf["total_sessions"]
+
+
+@derived("avg_session_duration", ["length", "total_sessions"])
+def _avg_session_duration(uf, ctx):
+    return uf["length"] / uf["total_sessions"]
+
+
+@derived("songs_per_minute", ["is_song", "length"])
+def _songs_per_minute(uf, ctx):
+    return uf["is_song"] / ((uf["length"] / 60) + 1)
+
+
+# D. Last Session Metrics
+LAST_SESSION_AGGS = {
+    "last_session_errors": ("is_error", "sum"),
+    "last_session_songs": ("is_song", "sum"),
+    "last_session_length": ("length", "sum"),
+    "last_session_downgrade": ("downgrade", "max"),
+}
+
+for _name, (_source, _agg) in LAST_SESSION_AGGS.items():
+    _add(FeatureSpec(_name, "last_session", stage=2, source=_source, agg=_agg))
+
+
+# --- 4. Quality of Engagement Ratios & Interactions (stage 3, not zero-filled) ---
+
+
+# E. Activity Slope: (Avg Daily Songs Last 7d) - (Avg Daily Songs Last 30d)
+# REMOVED from "current" IN EXP 17: Caused Covariate Shift (Flipped sign between Train/Test)
+@derived("activity_trend", ["songs_last_7d", "songs_last_30d"], 3)
+def _activity_trend(uf, ctx):
+    return uf["songs_last_7d"] / 7.0 - uf["songs_last_30d"] / 30.0
+
+
+# Boredom Ratio: Last session length vs Average session length
+@derived("boredom_ratio", ["last_session_length", "avg_session_duration"], 3)
+def _boredom_ratio(uf, ctx):
+    return uf["last_session_length"] / (uf["avg_session_duration"] + 1)
+
+
+@derived("exploration_ratio", ["unique_artists_last_7d", "unique_artists_last_30d"], 3)
+def _exploration_ratio(uf, ctx):
+    return uf["unique_artists_last_7d"] / ((uf["unique_artists_last_30d"] / 4) + 0.1)
+
+
+@derived("diversity_ratio_30d", ["unique_songs_last_30d", "songs_last_30d"], 3)
+def _diversity_ratio_30d(uf, ctx):
+    return uf["unique_songs_last_30d"] / (uf["songs_last_30d"] + 1)
+
+
+# Same formula as diversity_ratio_30d: kept as a copy for models trained with it
+@derived("exploration_rate", ["diversity_ratio_30d"], 3)
+def _exploration_rate(uf, ctx):
+    return uf["diversity_ratio_30d"]
+
+
+@derived("hate_ratio_7d", ["thumbs_down_last_7d", "songs_last_7d"], 3)
+def _hate_ratio_7d(uf, ctx):
+    return uf["thumbs_down_last_7d"] / (uf["songs_last_7d"] + 1)
+
+
+@derived("frustration_score", ["errors_per_day", "thumbs_down_per_day"], 3)
+def _frustration_score(uf, ctx):
+    return uf["errors_per_day"] * uf["thumbs_down_per_day"]
+
+
+@derived("recency_frequency_ratio", ["days_since_last_session", "total_sessions"], 3)
+def _recency_frequency_ratio(uf, ctx):
+    return uf["days_since_last_session"] / (uf["total_sessions"] + 1)
+
+
+@derived("session_velocity", ["songs_last_7d", "songs_last_30d"], 3)
+def _session_velocity(uf, ctx):
+    return uf["songs_last_7d"] / (uf["songs_last_30d"] / 4 + 0.01)
+
+
+# Legacy "Ever Churned" target (only when no snapshot_df is given)
+_add(FeatureSpec("target", "target", stage=3))
+
+
+# Frequency Encoding for State: learned once on the training rows when
+# fitted statistics are given (FeatureTransformer), else relative to this frame
+@fitted("state_freq", ["state"])
+def _fit_state_freq(uf):
+    return uf["state"].value_counts(normalize=True)
+
+
+@derived("state_freq", ["state"], 3)
+def _state_freq(uf, ctx):
+    if "state_freq" in ctx["stats"]:
+        # States never seen in training have a frequency of 0
+        return uf["state"].map(ctx["stats"]["state_freq"]).fillna(0.0)
+    return uf["state"].map(_fit_state_freq(uf))
+
+
+# --- 5. Feature Sets ---
+
+# Output of aggregate_user_features when no feature list is given (column order kept)
+DEFAULT_FEATURES = (
+    [
+        "level",
+        "downgrade",
+        "account_lifetime",
+        "avg_songs_per_day",
+        "thumbs_ratio",
+        "trend_songs_7d_vs_30d",
+        "trend_listen_time_7d_vs_30d",
+        "trend_errors_7d_vs_30d",
+        "avg_days_between_sessions",
+        "sessions_per_day",
+        "thumbs_up_per_day",
+        "thumbs_down_per_day",
+        "ads_per_day",
+        "errors_per_day",
+        "listen_time_per_day",
+    ]
+    + [
+        f"log_{window_name(stat, days)}"
+        for days in WINDOWS
+        for stat in ["songs", "errors", "listen_time"]
+    ]
+    + [
+        "days_since_last_session",
+        "avg_songs_per_session",
+        "avg_session_duration",
+        "songs_per_minute",
+        "last_session_errors",
+        "last_session_songs",
+        "last_session_length",
+        "last_session_downgrade",
+        "exploration_ratio",
+        "diversity_ratio_30d",
+        "exploration_rate",
+        "hate_ratio_7d",
+        "frustration_score",
+        "recency_frequency_ratio",
+        "session_velocity",
+        "target",
+        "state_freq",
+    ]
+)
+
+
+# Feature set behind the best leaderboard score (experiment_reports/all-time-high)
+ALL_TIME_HIGH_FEATURES = (
+    [
+        "gender",
+        "level",
+        "platform",
+        "is_thumbs_up",
+        "is_thumbs_down",
+        "is_ad",
+        "is_error",
+        "is_song",
+        "length",
+        "downgrade",
+    ]
+    + [window_name(stat, days) for days in ALL_WINDOWS for stat in WINDOW_STATS]
+    + [
+        "account_lifetime",
+        "avg_songs_per_day",
+        "thumbs_ratio",
+        "errors_per_song",
+        "trend_songs_7d_vs_30d",
+        "trend_listen_time_7d_vs_30d",
+        "total_sessions",
+        "avg_days_between_sessions",
+        "days_since_last_session",
+        "avg_songs_per_session",
+        "avg_session_duration",
+        "last_session_errors",
+        "last_session_songs",
+        "last_session_length",
+        "last_session_downgrade",
+        "activity_trend",
+        "boredom_ratio",
+        "exploration_ratio",
+        "hate_ratio_7d",
+        "target",
+        "state_freq",
+    ]
+)
+
+# Version -> default output columns + specs that differ from the registry
+VERSIONS = {
+    "current": {"features": DEFAULT_FEATURES, "overrides": {}},
+    "all_time_high": {
+        "features": ALL_TIME_HIGH_FEATURES,
+        "overrides": {
+            # Raw ratio (before the EXP 21 log transform)
+            "avg_songs_per_day": FeatureSpec(
+                "avg_songs_per_day",
+                "derived",
+                ["is_song", "account_lifetime"],
+                compute=lambda uf, ctx: uf["is_song"] / (uf["account_lifetime"] + 1),
+            ),
+        },
+    },
+}
+
+
+def _check_version(version):
+    if version not in VERSIONS:
+        raise ValueError(f"Unknown version '{version}'. Choose from {list(VERSIONS)}")
+
+
+def default_features(version="current"):
+    """Output columns of aggregate_user_features for a feature-set version."""
+    _check_version(version)
+    return list(VERSIONS[version]["features"])
+
+
+def get_spec(name, version="current"):
+    return VERSIONS[version]["overrides"].get(name, FEATURES[name])
+
+
+def resolve(features, version="current"):
+    """
+    Returns the set of columns needed to compute 'features' (dependency closure).
+    Raises ValueError on unknown feature names.
+    """
+    _check_version(version)
+    unknown = [f for f in features if f not in FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown features: {unknown}")
+
+    needed = set()
+    stack = list(features)
+    while stack:
+        name = stack.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        stack.extend(get_spec(name, version).requires)
+    return needed
+
+
+def specs_of(needed, kind=None, stage=None, version="current"):
+    """Needed specs in registration order, optionally filtered by kind / stage."""
+    specs = [get_spec(name, version) for name in FEATURES if name in needed]
+    return [
+        spec
+        for spec in specs
+        if (kind is None or spec.kind == kind)
+        and (stage is None or spec.stage == stage)
+    ]
+
+
+def event_columns(needed, version="current"):
+    """Event-level columns the needed aggregations read."""
+    cols = {"userId", "ts"}
+    for spec in specs_of(needed, version=version):
+        if spec.kind in ("base", "window", "last_session") and spec.source:
+            cols.add(spec.source)
+    if specs_of(needed, kind="sessions") or specs_of(needed, kind="last_session"):
+        cols.add("sessionId")
+    return cols
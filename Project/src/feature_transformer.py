@@ -0,0 +1,142 @@
+"""
+Fit / transform wrapper around aggregate_user_features.
+
+A few columns depend on the whole frame they are computed on (state_freq is
+the share of rows in the same state, see feature_registry.FITTED_STATS), so
+scoring users in batches, or one by one, changed their values. The transformer
+learns these statistics once on the training rows and reuses them: transform
+is then a per-user map and chunked / online scoring gives the same answers as
+full-batch scoring.
+
+It is saved next to the preprocessor (models/feature_transformer.joblib).
+"""
+
+import pathlib
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from .feature_registry import FITTED_STATS, default_features, resolve
+from .utils import PROJECT_ROOT
+
+MODELS_DIR = PROJECT_ROOT / "models"
+TRANSFORMER_PATH = MODELS_DIR / "feature_transformer.joblib"
+
+
+def iter_user_batches(df, snapshot_df=None, batch_size=1000):
+    """
+    Yields (events, snapshots) for 'batch_size' users at a time (sorted by
+    userId). Events are grouped once, so each batch is a slice, not a scan.
+    """
+    codes, users = pd.factorize(df["userId"], sort=True)
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    offsets = np.zeros(len(users) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[order], minlength=len(users)), out=offsets[1:])
+
+    for first in range(0, len(users), batch_size):
+        last = min(first + batch_size, len(users))
+        events = df.iloc[np.sort(order[offsets[first] : offsets[last]])]
+        snapshots = None
+        if snapshot_df is not None:
+            snapshots = snapshot_df[snapshot_df["userId"].isin(users[first:last])]
+        yield events, snapshots
+
+
+class FeatureTransformer:
+    """
+    Builds the user-level feature matrix with statistics learned at fit time.
+
+    Args:
+        features: Output columns (e.g. models/feature_names.joblib). Defaults
+                  to the full feature set of 'version' (without 'target').
+        version: Feature-set version (see feature_registry.VERSIONS).
+        backend: Execution backend of aggregate_user_features.
+
+    Attributes:
+        stats_: Dict {statistic name: learned value} (e.g. state frequencies).
+        fitted_stats: Names of the statistics fit() learns for these features.
+    """
+
+    def __init__(self, features=None, version="current", backend="pandas"):
+        if features is None:
+            features = [f for f in default_features(version) if f != "target"]
+        self.features = list(features)
+        self.version = version
+        self.backend = backend
+        self.stats_ = None
+
+    @property
+    def fitted_stats(self):
+        needed = resolve(self.features, self.version)
+        return [name for name in FITTED_STATS if name in needed]
+
+    def fit(self, df, snapshot_df=None):
+        """
+        Learns the batch-dependent statistics on the training rows
+        (same rows as the training features: one per user, or per snapshot).
+        """
+        from .features import aggregate_user_features
+
+        names = self.fitted_stats
+        inputs = sorted({col for name in names for col in FITTED_STATS[name].requires})
+        self.stats_ = {}
+        if names:
+            user_features = aggregate_user_features(
+                df,
+                snapshot_df,
+                features=inputs,
+                version=self.version,
+                backend=self.backend,
+            )
+            for name in names:
+                self.stats_[name] = FITTED_STATS[name].compute(user_features)
+        return self
+
+    def transform(self, df, snapshot_df=None, batch_size=None):
+        """
+        Feature matrix of the given events (relative to snapshot_df if given).
+
+        Args:
+            batch_size: Optional number of users per aggregate_user_features
+                        call (bounded memory). Same output as a single call.
+        """
+        from .features import aggregate_user_features
+
+        if self.stats_ is None:
+            raise ValueError("FeatureTransformer is not fitted: call fit() first")
+
+        def run(events, snapshots):
+            return aggregate_user_features(
+                events,
+                snapshots,
+                features=self.features,
+                version=self.version,
+                backend=self.backend,
+                stats=self.stats_,
+            )
+
+        if batch_size is None:
+            return run(df, snapshot_df)
+        return pd.concat(
+            run(events, snapshots)
+            for events, snapshots in iter_user_batches(df, snapshot_df, batch_size)
+        )
+
+    def fit_transform(self, df, snapshot_df=None):
+        return self.fit(df, snapshot_df).transform(df, snapshot_df)
+
+    # --- PERSISTENCE ---
+
+    def save(self, path=None):
+        """Saves the transformer (default: models/feature_transformer.joblib)."""
+        path = pathlib.Path(path or TRANSFORMER_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(self, path)
+        print(f"-> Saved feature transformer to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        return joblib.load(pathlib.Path(path or TRANSFORMER_PATH))
@@ -1,25 +1,52 @@
+from functools import partial
+
 import pandas as pd
 import numpy as np
 
+from .feature_registry import (
+    EVENT_FLAGS,
+    default_features,
+    event_columns,
+    resolve,
+    specs_of,
+)
+from .memory_guard import format_bytes, guarded_merge, plan_partitions, spill_by_user
+from .sampling import integers, user_keys
+from .user_index import churner_users, get_user_index, share_user_index
+
+# Execution backends (see polars_backend.py / numba_backend.py)
+BACKENDS = ("pandas", "polars")
+AGGREGATION_BACKENDS = BACKENDS + ("numba",)
+
+
+def _check_backend(backend, choices=BACKENDS):
+    if backend not in choices:
+        raise ValueError(f"Unknown backend '{backend}'. Choose from {list(choices)}")
 
-def label_churn(df, window_days=10):
+
+def label_churn(df, window_days=10, backend="pandas", memory_budget=None):
     """
     Adds a 'churn' column to the dataframe.
     churn = 1 if the event occurred within 'window_days' before the user's Cancellation Confirmation.
     churn = 0 otherwise.
+
+    backend: "pandas" (default) or "polars" (see polars_backend.py).
+    memory_budget: Optional budget (bytes) of the churn-time merge: over it,
+                   the merge runs per user partition (see memory_guard.py).
     """
+    _check_backend(backend)
+    if backend == "polars":
+        from . import polars_backend
+
+        return polars_backend.label_churn(df, window_days)
+
+    source = df
     df = df.copy()
-    # Identify Churn Timestamp
-    churn_events = (
-        df[df["page"] == "Cancellation Confirmation"]
-        .groupby("userId")["ts"]
-        .min()
-        .reset_index()
-    )
-    churn_events.columns = ["userId", "churn_ts"]
+    # Identify Churn Timestamp (shared per-user index, see user_index.py)
+    churn_events = get_user_index(source)["churn_ts"].dropna().reset_index()
 
     # Merge
-    df = df.merge(churn_events, on="userId", how="left")
+    df = guarded_merge(df, churn_events, memory_budget, on="userId", how="left")
 
     # Define Window
     churn_window_delta = pd.Timedelta(days=window_days)
@@ -33,7 +60,8 @@ def label_churn(df, window_days=10):
     )
     df.loc[mask_churn_window, "churn"] = 1
 
-    return df
+    # Same users, 'ts' and 'page': later calls on the labelled frame reuse the index
+    return share_user_index(source, df)
 
 
 def extract_seasonality(df):
@@ -50,13 +78,21 @@ def extract_seasonality(df):
     return df
 
 
-def extract_user_attributes(df):
+def extract_user_attributes(df, backend="pandas"):
     """
     Extracts user-level attributes:
     - account_age_days
     - platform (from userAgent)
     - state (from location)
+
+    backend: "pandas" (default) or "polars" (vectorized string parsing).
     """
+    _check_backend(backend)
+    if backend == "polars":
+        from . import polars_backend
+
+        return polars_backend.extract_user_attributes(df)
+
     df = df.copy()
 
     # Ensure datetime types
@@ -132,21 +168,84 @@ def aggregate_session_metrics(df):
     return df
 
 
-def aggregate_user_features(df, snapshot_df=None):
+# Stage-2 columns computed from events (not from other user-level columns)
+EVENT_KINDS = ("sessions", "last_event", "last_session")
+
+
+def _requested_features(features, snapshot_df, version):
+    """Output columns: the version's default set or the given list (+ legacy target)."""
+    if features is None:
+        features = default_features(version)
+    else:
+        features = list(features)
+    if snapshot_df is None and "target" not in features:
+        features.append("target")
+    if snapshot_df is not None and "target" in features:
+        # Snapshot targets are joined from snapshot_df (see generate_training_data)
+        features.remove("target")
+    return features
+
+
+def _input_columns(columns, needed, version):
     """
-    Aggregates event-level data into a single row per user.
-    Includes rolling window features (last 1, 3, 7 days).
+    Returns (columns to read from the event log, flags to create).
+    Only the event columns the needed aggregations read are kept.
+    """
+    cols = event_columns(needed, version)
+    flag_cols = [c for c in cols if c not in columns]
+    raw_cols = {EVENT_FLAGS[c][0] for c in flag_cols if c in EVENT_FLAGS}
+    if "target" in needed:
+        raw_cols.add("page")
+    keep = [c for c in columns if c in cols | raw_cols]
+    return keep, flag_cols
+
+
+def _add_event_flags(df, columns):
+    """Creates the is_* / downgrade flags the aggregations read (if missing)."""
+    for col in columns:
+        if col in EVENT_FLAGS and col not in df.columns:
+            source, value = EVENT_FLAGS[col]
+            df[col] = (df[source] == value).astype(int)
+    return df
 
-    Args:
-        df: Event log dataframe.
-        snapshot_df: Optional dataframe with ['userId', 'cutoff_ts'].
-                     If provided, features are calculated relative to 'cutoff_ts'.
-                     If None, features are calculated relative to the user's last event.
+
+def _agg_by_source(df, group_keys, specs):
+    """One groupby computing every spec (source column + agg), renamed to spec names."""
+    agg = {spec.source: spec.agg for spec in specs}
+    names = {spec.source: spec.name for spec in specs}
+    return df.groupby(group_keys).agg(agg).rename(columns=names)
+
+
+def _event_aggregates(df, snapshot_df, needed, version, memory_budget=None):
     """
-    df = df.copy()
+    Event-level part of aggregate_user_features (pandas backend).
+
+    With a memory_budget (bytes), the output of the cutoff merge is estimated
+    first; over budget, the whole computation runs per user partition with the
+    inputs spilled to parquet (see memory_guard.py).
 
+    Returns:
+        user_features: Base + rolling window columns, one row per group key.
+        event_features: Stage-2 event columns (sessions, last event, last session).
+        churn_users: Users with a Cancellation Confirmation (None if not needed).
+    """
     # 1. Identify Churn Target (Global - for reference, but target generation should be external for snapshots)
-    churn_users = df[df["page"] == "Cancellation Confirmation"]["userId"].unique()
+    churn_users = None
+    if "target" in needed:
+        churn_users = churner_users(df)
+
+    keep, flag_cols = _input_columns(df.columns, needed, version)
+
+    # Memory guard: the merges below (cutoffs, last session) fit in the budget?
+    if memory_budget is not None:
+        n_parts = _merge_partitions(df, keep, snapshot_df, memory_budget)
+        if n_parts > 1:
+            user_features, event_features = _partitioned_event_aggregates(
+                df[keep], snapshot_df, needed, version, n_parts
+            )
+            return user_features, event_features, churn_users
+
+    df = df[keep].copy()
 
     # 2. Determine Cutoff Time
     if snapshot_df is not None:
@@ -166,221 +265,90 @@ def aggregate_user_features(df, snapshot_df=None):
         )
         df = df.merge(user_max_ts, on="userId")
 
-    # 3. Calculate Time Delta for Rolling Windows
-    df["days_from_end"] = (df["last_active"] - df["ts"]).dt.total_seconds() / (
-        24 * 3600
-    )
-
-    # 4. Base Aggregation (Static & Total Counts)
-    # Ensure we have the necessary columns from previous steps
-    if "is_error" not in df.columns:
-        df["is_error"] = (df["status"] == 404).astype(int)
-    if "is_song" not in df.columns:
-        df["is_song"] = (df["page"] == "NextSong").astype(int)
-    if "is_thumbs_up" not in df.columns:
-        df["is_thumbs_up"] = (df["page"] == "Thumbs Up").astype(int)
-    if "is_thumbs_down" not in df.columns:
-        df["is_thumbs_down"] = (df["page"] == "Thumbs Down").astype(int)
-    if "is_ad" not in df.columns:
-        df["is_ad"] = (df["page"] == "Roll Advert").astype(int)
-    if "downgrade" not in df.columns:
-        df["downgrade"] = (df["page"] == "Submit Downgrade").astype(int)
+    # 3. Ensure we have the necessary flag columns from previous steps
+    df = _add_event_flags(df, flag_cols)
 
     # Determine GroupBy Keys
     group_keys = ["userId"]
     if snapshot_df is not None:
         group_keys = ["userId", "cutoff_ts"]
 
-    g = df.groupby(group_keys)
-    user_features = g.agg(
-        {
-            "level": "last",  # Current level
-            "registration": "first",
-            "state": "first",  # Kept for Frequency Encoding
-            "last_active": "max",  # This will be the cutoff_ts if provided
-            "is_thumbs_up": "sum",
-            "is_thumbs_down": "sum",
-            "is_ad": "sum",
-            "is_error": "sum",
-            "is_song": "sum",
-            "length": "sum",  # Total listening time
-            "downgrade": "max",  # Has ever downgraded
-        }
+    # 4. Base Aggregation (Static & Total Counts)
+    user_features = _agg_by_source(
+        df, group_keys, specs_of(needed, kind="base", version=version)
     )
 
-    # 5. Rolling Window Aggregations
-    # PRUNING: Dropped 1d and 3d windows to reduce noise
-    for days in [7, 14, 30]:
+    # 5. Rolling Window Aggregations (only the needed windows / stats)
+    window_specs = specs_of(needed, kind="window", version=version)
+    if window_specs:
+        # Time Delta for Rolling Windows
+        days_from_end = (df["last_active"] - df["ts"]).dt.total_seconds() / (24 * 3600)
+    for days in sorted({spec.days for spec in window_specs}):
         # Filter events within the window
-        window_mask = df["days_from_end"] <= days
-        window_df = df[window_mask]
-
-        # Group and aggregate
-        window_agg = (
-            window_df.groupby(group_keys)
-            .agg(
-                {
-                    "is_song": "sum",
-                    "is_error": "sum",
-                    "is_thumbs_down": "sum",
-                    "length": "sum",
-                    "artist": "nunique",  # Diversity
-                    "song": "nunique",  # Diversity
-                }
-            )
-            .rename(
-                columns={
-                    "is_song": f"songs_last_{days}d",
-                    "is_error": f"errors_last_{days}d",
-                    "is_thumbs_down": f"thumbs_down_last_{days}d",
-                    "length": f"listen_time_last_{days}d",
-                    "artist": f"unique_artists_last_{days}d",
-                    "song": f"unique_songs_last_{days}d",
-                }
-            )
+        window_df = df[days_from_end <= days]
+        window_agg = _agg_by_source(
+            window_df, group_keys, [s for s in window_specs if s.days == days]
+        )
+        user_features = user_features.join(window_agg)
+
+    # 6. Session Counts, Recency & Last Session
+    event_features = pd.DataFrame(index=user_features.index)
+    for spec in specs_of(needed, stage=2, version=version):
+        if spec.kind == "sessions":
+            event_features[spec.name] = df.groupby(group_keys)["sessionId"].nunique()
+        elif spec.kind == "last_event":
+            event_features[spec.name] = df.groupby(group_keys)["ts"].max()
+    last_session_specs = specs_of(needed, kind="last_session", version=version)
+    if last_session_specs:
+        event_features = event_features.join(
+            _aggregate_last_session(df, group_keys, last_session_specs)
         )
 
-        # Merge back (fill NaN with 0 for users with no activity in window)
-        user_features = user_features.join(window_agg).fillna(0)
-
-    # 6. Derived Ratios & Features
-    user_features["account_lifetime"] = (
-        user_features["last_active"] - user_features["registration"]
-    ).dt.total_seconds() / (24 * 3600)
-    user_features["avg_songs_per_day"] = user_features["is_song"] / (
-        user_features["account_lifetime"] + 1
-    )
-    user_features["thumbs_ratio"] = user_features["is_thumbs_up"] / (
-        user_features["is_thumbs_up"] + user_features["is_thumbs_down"] + 1
-    )
-    # Clip errors_per_song to handle extreme outliers (e.g. users with 0 songs and many errors)
-    # REMOVED IN EXP 17: High divergence (-131%)
-    # user_features["errors_per_song"] = (
-    #     user_features["is_error"] / (user_features["is_song"] + 1)
-    # ).clip(upper=5.0)
-
-    # --- Advanced Features (Trends, Gaps, Session Quality) ---
-
-    # A. Trends (7d vs 30d)
-    # Avoid division by zero by adding small epsilon or checking for 0
-    user_features["trend_songs_7d_vs_30d"] = user_features["songs_last_7d"] / (
-        (user_features["songs_last_30d"] / 4) + 0.1
-    )
-    user_features["trend_listen_time_7d_vs_30d"] = user_features[
-        "listen_time_last_7d"
-    ] / ((user_features["listen_time_last_30d"] / 4) + 0.1)
-
-    # NEW: Error Trend (Are errors increasing recently?)
-    user_features["trend_errors_7d_vs_30d"] = user_features["errors_last_7d"] / (
-        (user_features["errors_last_30d"] / 4) + 0.01
-    )
-
-    # B. Gap Analysis (Recency & Regularity)
-    # Calculate average gap between sessions (approximate by days with activity)
-    # We need to go back to event level for this, or approximate.
-    # Approximation: Account Lifetime / Total Sessions (sessionId count)
-    # Let's get total sessions first
-    total_sessions = df.groupby(group_keys)["sessionId"].nunique()
-    user_features = user_features.join(total_sessions.rename("total_sessions"))
-
-    user_features["avg_days_between_sessions"] = (
-        user_features["account_lifetime"] / user_features["total_sessions"]
-    )
-
-    # NEW: Detailed Gap Analysis (Std and Max Gap)
-    # REMOVED IN EXP 17: Caused Covariate Shift (Test set has larger gaps than Train)
-    # We revert to simple avg_days_between_sessions
-    # (Code removed to prevent UnboundLocalError)
+    return user_features, event_features, churn_users
 
-    # --- NORMALIZATION FIX (Time-Invariant Features) ---
-    # Convert Total Counts to Rates per Day to handle observation window differences
-    # (Train Snapshots vs Test Full History)
-    # AND Apply Log-Transformation to handle extreme outliers in Test Set (e.g. Rate=50 vs Rate=0.1)
 
-    # 1. Create Rate Features (Log-Transformed)
-    user_features["sessions_per_day"] = np.log1p(
-        user_features["total_sessions"] / (user_features["account_lifetime"] + 1)
-    )
-    user_features["thumbs_up_per_day"] = np.log1p(
-        user_features["is_thumbs_up"] / (user_features["account_lifetime"] + 1)
-    )
-    user_features["thumbs_down_per_day"] = np.log1p(
-        user_features["is_thumbs_down"] / (user_features["account_lifetime"] + 1)
-    )
-    user_features["ads_per_day"] = np.log1p(
-        user_features["is_ad"] / (user_features["account_lifetime"] + 1)
-    )
-    user_features["errors_per_day"] = np.log1p(
-        user_features["is_error"] / (user_features["account_lifetime"] + 1)
-    )
-    user_features["listen_time_per_day"] = np.log1p(
-        user_features["length"] / (user_features["account_lifetime"] + 1)
-    )
-
-    # Overwrite avg_songs_per_day with log version
-    user_features["avg_songs_per_day"] = np.log1p(
-        user_features["is_song"] / (user_features["account_lifetime"] + 1)
+def _merge_partitions(df, keep, snapshot_df, memory_budget):
+    """
+    Number of user partitions keeping the cutoff merge under the budget. The
+    last-session merge reads a subset of its output, so it is bounded by it.
+    """
+    if snapshot_df is not None:
+        cutoffs = snapshot_df[["userId", "cutoff_ts"]]
+    else:
+        cutoffs = get_user_index(df)[["last_ts"]].reset_index()
+    rows, n_bytes, n_parts = plan_partitions(
+        df[keep], cutoffs, memory_budget, on="userId"
     )
-
-    # EXP 21: Log-Transformed Volume Features
-    # We bring back volume features but apply log1p to reduce the impact of outliers
-    # and the scale difference between Train (Snapshots) and Test (Full History).
-    for days in [7, 14, 30]:
-        user_features[f"log_songs_last_{days}d"] = np.log1p(
-            user_features[f"songs_last_{days}d"]
-        )
-        user_features[f"log_errors_last_{days}d"] = np.log1p(
-            user_features[f"errors_last_{days}d"]
+    if n_parts > 1:
+        print(
+            f"💾 Cutoff merge of ~{rows} rows ({format_bytes(n_bytes)}) over the "
+            f"{format_bytes(memory_budget)} budget: {n_parts} user partitions"
         )
-        user_features[f"log_listen_time_last_{days}d"] = np.log1p(
-            user_features[f"listen_time_last_{days}d"]
+    return n_parts
+
+
+def _partitioned_event_aggregates(df, snapshot_df, needed, version, n_parts):
+    """_event_aggregates run on each user partition (spilled to parquet)."""
+    # Every aggregate is per user: the partition results are disjoint
+    needed = needed - {"target"}
+    user_parts, event_parts = [], []
+    for events, snapshots in spill_by_user([df, snapshot_df], n_parts):
+        if events.empty:
+            continue
+        user_features, event_features, _ = _event_aggregates(
+            events, snapshots, needed, version
         )
+        user_parts.append(user_features)
+        event_parts.append(event_features)
+    return pd.concat(user_parts).sort_index(), pd.concat(event_parts).sort_index()
 
-    # 2. Drop Raw Count Columns (Prevent Bias/Leakage)
-    # We keep 'is_song' only if it's used for other ratios, but generally we should drop it.
-    # However, 'is_song' is used in 'errors_per_song' (line 273) and 'songs_per_minute' (line 328).
-    # We must ensure we don't break those calculations.
-    # Strategy: Keep them for calculation, drop them at the very end (Step 9).
-
-    # Recency: Days since last session (relative to cutoff)
-    # Since we filtered df to <= cutoff, the max(ts) IS the last session time.
-    # And last_active IS the cutoff.
-    # So days_since_last_session = (cutoff - max(ts)).
-    # Wait, in step 2, we set last_active = cutoff_ts.
-    # But we need the ACTUAL last event time to calculate recency.
-    # Let's recalculate actual last event time.
-    actual_last_event = df.groupby(group_keys)["ts"].max()
-    user_features["days_since_last_session"] = (
-        user_features["last_active"] - actual_last_event
-    ).dt.total_seconds() / (24 * 3600)
-    # Fill NaNs (if any) with 0 or lifetime? If they have events, it shouldn't be NaN.
-    user_features["days_since_last_session"] = user_features[
-        "days_since_last_session"
-    ].fillna(0)
-
-    # C. Session Quality
-    user_features["avg_songs_per_session"] = (
-        user_features["is_song"] / user_features["total_sessions"]
-    )
-    user_features["avg_session_duration"] = (
-        user_features["length"] / user_features["total_sessions"]
-    )
-
-    # NEW: Session Density (Songs per minute of listening time)
-    # High density = intense listening. Low density = lots of pauses or long songs.
-    user_features["songs_per_minute"] = user_features["is_song"] / (
-        (user_features["length"] / 60) + 1
-    )
 
-    # --- Phase 1: Advanced Features (Last Session & Trends) ---
-
-    # D. Last Session Metrics
-    # We need to isolate the last session for each user (relative to cutoff)
+def _aggregate_last_session(df, group_keys, specs):
+    """Aggregates the needed metrics over each user's last session (relative to cutoff)."""
     # 1. Find the sessionId of the last event
     last_session_map = df.sort_values("ts").groupby(group_keys)["sessionId"].last()
 
     # 2. Filter original df to get only events from these sessions
-    # This is a bit tricky with GroupBy. Let's use a merge.
     last_session_df = df.merge(
         last_session_map.rename("last_sessionId"),
         left_on=group_keys + ["sessionId"],
@@ -388,143 +356,121 @@ def aggregate_user_features(df, snapshot_df=None):
     )
 
     # 3. Aggregate metrics for this last session
-    last_session_agg = (
-        last_session_df.groupby(group_keys)
-        .agg({"is_error": "sum", "is_song": "sum", "length": "sum", "downgrade": "max"})
-        .rename(
-            columns={
-                "is_error": "last_session_errors",
-                "is_song": "last_session_songs",
-                "length": "last_session_length",
-                "downgrade": "last_session_downgrade",
-            }
-        )
-    )
+    return _agg_by_source(last_session_df, group_keys, specs)
 
-    user_features = user_features.join(last_session_agg).fillna(0)
 
-    # E. Activity Slope (Trend)
-    # REMOVED IN EXP 17: Caused Covariate Shift (Flipped sign between Train/Test)
-    # user_features["daily_songs_7d"] = user_features["songs_last_7d"] / 7.0
-    # ... (Trend calculation removed) ...
+def _derive_features(
+    user_features, event_features, churn_users, needed, features, version, stats=None
+):
+    """Derived ratios, trends, target and encodings from the per-user aggregates."""
+    # Fill NaN with 0 for users with no activity in window
+    user_features = user_features.fillna(0)
 
-    # --- Phase 3: Quality of Engagement Ratios ---
+    # Derived Ratios, Gaps & Session Quality
+    ctx = {"group_keys": list(user_features.index.names), "stats": stats or {}}
+    for spec in specs_of(needed, stage=2, version=version):
+        if spec.kind in EVENT_KINDS:
+            user_features[spec.name] = event_features[spec.name]
+        else:
+            user_features[spec.name] = spec.compute(user_features, ctx)
 
-    # 2. Exploration Ratio: Diversity in last 7 days vs last 30 days
-    # Low ratio -> Stopped discovering new music -> Stagnation
-    user_features["exploration_ratio"] = user_features["unique_artists_last_7d"] / (
-        (user_features["unique_artists_last_30d"] / 4) + 0.1
-    )
+    user_features = user_features.fillna(0)
 
-    # NEW: Diversity Ratio (30d) - Unique songs vs Total songs
-    # Low ratio = Repetitive listening. High ratio = Exploration.
-    user_features["diversity_ratio_30d"] = user_features["unique_songs_last_30d"] / (
-        user_features["songs_last_30d"] + 1
-    )
+    # Quality of Engagement Ratios, Target & Frequency Encoding
+    for spec in specs_of(needed, stage=3, version=version):
+        if spec.kind == "target":
+            # Legacy "Ever Churned" logic for backward compatibility
+            user_features[spec.name] = user_features.index.isin(churn_users).astype(int)
+        else:
+            user_features[spec.name] = spec.compute(user_features, ctx)
+
+    # Cleanup for Modeling
+    # Intermediates (raw timestamps, state, raw counts biased by observation
+    # window length) are dropped: only the requested columns are returned
+    return user_features[features]
+
+
+def aggregate_user_features(
+    df,
+    snapshot_df=None,
+    features=None,
+    version="current",
+    backend="pandas",
+    stats=None,
+    transitions=False,
+    decay=False,
+    memory_budget=None,
+):
+    """
+    Aggregates event-level data into a single row per user.
+    Includes rolling window features (last 7, 14, 30 days).
 
-    # NEW: Exploration Rate (Discovery)
-    # Unique songs vs Total songs in last 30 days
-    # High rate = Discovery. Low rate = Repetition.
-    user_features["exploration_rate"] = user_features["unique_songs_last_30d"] / (
-        user_features["songs_last_30d"] + 1
-    )
+    Every column is declared in src/feature_registry.py with the columns /
+    windows it needs, so only the aggregations required by 'features' run.
 
-    # 3. Hate Ratio (7d): Thumbs down per song in last 7 days
-    # High ratio -> Frustration
-    user_features["hate_ratio_7d"] = user_features["thumbs_down_last_7d"] / (
-        user_features["songs_last_7d"] + 1
-    )
-
-    # NEW: Frustration Score (Interaction)
-    # Interaction between Errors and Thumbs Down (both are log-rates)
-    user_features["frustration_score"] = (
-        user_features["errors_per_day"] * user_features["thumbs_down_per_day"]
-    )
+    Args:
+        df: Event log dataframe.
+        snapshot_df: Optional dataframe with ['userId', 'cutoff_ts'].
+                     If provided, features are calculated relative to 'cutoff_ts'.
+                     If None, features are calculated relative to the user's last event.
+        features: Optional list of output columns (e.g. the pruned list saved in
+                  models/feature_names.joblib). Defaults to the full feature set
+                  of 'version'. 'target' is always added when snapshot_df is None.
+        version: Feature-set version (see feature_registry.VERSIONS):
+                 "current" or "all_time_high" (1/3/7/14/30d windows, raw counts).
+        backend: "pandas" (default), "polars" (multithreaded lazy engine for the
+                 event-level groupbys, see polars_backend.py) or "numba" (one
+                 compiled pass per user, see numba_backend.py). Same output.
+        stats: Optional statistics learned on the training rows (e.g. the state
+               frequencies of FeatureTransformer). By default they are computed
+               on this frame, so they depend on which users it contains.
+        transitions: Also attach the page-to-page transition counts as sparse
+                     columns (see transitions.py). True uses the pages of df,
+                     a list of pages fixes the vocabulary (same columns for
+                     train and test).
+        decay: Also attach exponentially-decayed counters and their trends
+               (see decay.py). True uses decay.DECAY_HALF_LIVES, a list sets
+               the half-lives in days.
+        memory_budget: Optional budget (bytes) of the event-level merges
+                       (pandas backend): over it, the aggregation runs per user
+                       partition spilled to parquet (see memory_guard.py).
+    """
+    _check_backend(backend, AGGREGATION_BACKENDS)
+    features = _requested_features(features, snapshot_df, version)
 
-    # --- FEATURE ENGINEERING BOOST (Moved from Notebook) ---
-    # Add ratio features to capture trends (Velocity)
-    if (
-        "songs_last_7d" in user_features.columns
-        and "songs_last_28d" in user_features.columns
-    ):  # Note: songs_last_28d might not exist, check window aggregations
-        # Based on existing code, we have 30d, not 28d. Adjusting to 30d for consistency or adding 28d if needed.
-        # The notebook used 'sessions_last_28d' which likely didn't exist in features.py output unless added.
-        # Let's stick to what we have: 7d vs 30d is already in 'trend_songs_7d_vs_30d'
-        pass
-
-    # Interaction: Recency vs Frequency
-    if (
-        "days_since_last_session" in user_features.columns
-        and "total_sessions" in user_features.columns
-    ):
-        user_features["recency_frequency_ratio"] = user_features[
-            "days_since_last_session"
-        ] / (user_features["total_sessions"] + 1)
-
-    # Session Velocity (using 7d vs 30d as proxy for 28d)
-    if (
-        "songs_last_7d" in user_features.columns
-        and "songs_last_30d" in user_features.columns
-    ):
-        user_features["session_velocity"] = user_features["songs_last_7d"] / (
-            user_features["songs_last_30d"] / 4 + 0.01
-        )
+    # 'last_active' is the per-user reference time: always computed
+    needed = resolve(features + ["last_active"], version)
 
-    # 7. Set Target (Legacy / Default Behavior)
-    # If snapshot_df is provided, the target should be in it, or calculated externally.
-    # If not provided, we assume standard "Ever Churned" logic for backward compatibility.
-    if snapshot_df is None:
-        user_features["target"] = 0
-        user_features.loc[user_features.index.isin(churn_users), "target"] = 1
-
-    # 8. Frequency Encoding for State
-    # Calculate frequency of each state
-    state_freq = user_features["state"].value_counts(normalize=True)
-    # Map frequency to a new column
-    user_features["state_freq"] = user_features["state"].map(state_freq)
-
-    # 9. Cleanup for Modeling
-    # Drop raw timestamps and high-cardinality categoricals (original state)
-    # Also drop Raw Count Columns that are biased by observation window length
-
-    # Define raw count columns to drop (generated in Step 5)
-    raw_count_cols = []
-    for days in [7, 14, 30]:
-        raw_count_cols.extend(
-            [
-                f"songs_last_{days}d",
-                f"errors_last_{days}d",
-                f"thumbs_down_last_{days}d",
-                f"listen_time_last_{days}d",
-                f"unique_artists_last_{days}d",
-                f"unique_songs_last_{days}d",
-            ]
-        )
+    if backend == "polars":
+        from .polars_backend import event_aggregates
+    elif backend == "numba":
+        from .numba_backend import event_aggregates
+    else:
+        event_aggregates = partial(_event_aggregates, memory_budget=memory_budget)
 
-    cols_to_drop = [
-        "registration",
-        "last_active",
-        "state",
-        "is_thumbs_up",
-        "is_thumbs_down",
-        "is_ad",
-        "is_error",
-        "is_song",
-        "length",
-        "total_sessions",
-    ] + raw_count_cols
-
-    user_features = user_features.drop(
-        columns=[c for c in cols_to_drop if c in user_features.columns]
+    user_features, event_features, churn_users = event_aggregates(
+        df, snapshot_df, needed, version
     )
+    features_df = _derive_features(
+        user_features, event_features, churn_users, needed, features, version, stats
+    )
+    if transitions is not False:
+        from .transitions import attach_transitions
 
-    return user_features
+        pages = None if transitions is True else transitions
+        features_df = attach_transitions(features_df, df, pages)
+    if decay is not False:
+        from .decay import decayed_features
 
+        half_lives = None if decay is True else decay
+        decayed = decayed_features(df, features_df.index, half_lives)
+        features_df = pd.concat([features_df, decayed], axis=1)
+    return features_df
 
-def generate_training_data(df, train_end_date=None):
+
+def training_snapshots(df, train_end_date=None, seed=42):
     """
-    Generates training data using the Snapshot approach with Random Sampling.
-    Creates multiple training examples per user at different points in time.
+    Samples the training snapshots (userId, cutoff_ts, target).
 
     Strategy:
     - Churners:
@@ -534,79 +480,76 @@ def generate_training_data(df, train_end_date=None):
         - Target 0: Random points during active history.
         - Target 0: Random points AFTER last event (simulating dormancy/gaps).
 
+    The random cutoffs of a user depend only on (seed, userId) (counter-based
+    draws, see sampling.py): they do not change with the other users, their
+    order or the shard the user is sampled in.
+
     Args:
         df: Raw event log dataframe.
         train_end_date: Optional date to split train/validation.
+        seed: Seed of the random cutoffs.
     """
-    df = df.copy()
-    np.random.seed(42)  # For reproducibility
-
-    # 1. Identify Churners and Churn Dates
-    churn_data = df[df["page"] == "Cancellation Confirmation"][
-        ["userId", "ts"]
-    ].drop_duplicates()
-    churn_data.columns = ["userId", "churn_ts"]
-    churn_map = churn_data.set_index("userId")["churn_ts"]
-
-    # 2. Define Snapshots
-    snapshots = []
-
-    # Get all users and their min/max timestamps
-    user_stats = df.groupby("userId")["ts"].agg(["min", "max"])
-
-    for userId, stats in user_stats.iterrows():
-        min_ts = stats["min"]
-        max_ts = stats["max"]
-        is_churner = userId in churn_map.index
-        churn_ts = churn_map.get(userId)
-
-        if is_churner:
-            # A. Positive Samples (Approaching Churn)
-            # Take snapshots 1, 3, 7 days before churn
-            for days_before in [1, 3, 7]:
-                cutoff = churn_ts - pd.Timedelta(days=days_before)
-                if cutoff > min_ts:
-                    snapshots.append(
-                        {"userId": userId, "cutoff_ts": cutoff, "target": 1}
-                    )
-
-            # B. Negative Samples (Long before churn)
-            # Take snapshots 30, 60 days before churn (if account is old enough)
-            for days_before in [30, 60]:
-                cutoff = churn_ts - pd.Timedelta(days=days_before)
-                if cutoff > min_ts:
-                    snapshots.append(
-                        {"userId": userId, "cutoff_ts": cutoff, "target": 0}
-                    )
-        else:
-            # C. Non-Churners (Negative Samples)
-
-            # 1. Random Historical Snapshots (Active periods)
-            # Pick 2 random points between min_ts and max_ts
-            # This teaches the model what "normal activity" looks like
-            if (max_ts - min_ts).total_seconds() > 3600:  # At least 1 hour history
-                random_seconds = np.random.randint(
-                    0, int((max_ts - min_ts).total_seconds()), 2
-                )
-                for sec in random_seconds:
-                    cutoff = min_ts + pd.Timedelta(seconds=sec)
-                    snapshots.append(
-                        {"userId": userId, "cutoff_ts": cutoff, "target": 0}
-                    )
-            else:
-                # Fallback for very short history
-                snapshots.append({"userId": userId, "cutoff_ts": max_ts, "target": 0})
-
-            # 2. "Dormancy" Snapshots (The Fix for Test Set Distribution)
-            # Add snapshots AFTER the last event to simulate inactivity gaps.
-            # The Test Set has gaps up to ~50 days. We sample from 1 to 45 days.
-            # We add 3 such snapshots per user to heavily weight this "safe gap" concept.
-            random_gaps = np.random.randint(1, 45, 3)
-            for gap in random_gaps:
-                cutoff = max_ts + pd.Timedelta(days=gap)
-                snapshots.append({"userId": userId, "cutoff_ts": cutoff, "target": 0})
-
-    snapshot_df = pd.DataFrame(snapshots)
+    # 1. Identify Churners, Churn Dates and min/max timestamps (shared index)
+    user_stats = get_user_index(df)
+    users = user_stats.index.to_numpy()
+    min_ts, max_ts = user_stats["first_ts"], user_stats["last_ts"]
+    churn_ts = user_stats["churn_ts"]
+    is_churner = churn_ts.notna().to_numpy()
+    keys = user_keys(users, seed)
+
+    # 2. Define Snapshots: (user position, slot, cutoff, target) per rule,
+    # sorted by (user, slot) at the end as in a per-user loop
+    pieces = []
+
+    def add(mask, slot, cutoff, target):
+        positions = np.flatnonzero(mask)
+        pieces.append(
+            pd.DataFrame(
+                {
+                    "position": positions,
+                    "slot": slot,
+                    "cutoff_ts": np.asarray(cutoff)[positions],
+                    "target": target,
+                }
+            )
+        )
+
+    # A. Positive Samples (Approaching Churn): 1, 3, 7 days before churn
+    # B. Negative Samples (Long before churn): 30, 60 days before churn
+    # (only if the account is old enough)
+    for slot, (days_before, target) in enumerate(
+        [(1, 1), (3, 1), (7, 1), (30, 0), (60, 0)]
+    ):
+        cutoff = churn_ts - pd.Timedelta(days=days_before)
+        add(is_churner & (cutoff > min_ts).to_numpy(), slot, cutoff, target)
+
+    # C. Non-Churners (Negative Samples)
+    # 1. Random Historical Snapshots (Active periods)
+    # Pick 2 random points between min_ts and max_ts (draws 0 and 1)
+    # This teaches the model what "normal activity" looks like
+    span = ((max_ts - min_ts) // pd.Timedelta(seconds=1)).to_numpy()
+    active = ~is_churner & (span > 3600)  # At least 1 hour history
+    for draw in range(2):
+        seconds = integers(keys, draw, 0, np.maximum(span, 1))
+        cutoff = min_ts + pd.to_timedelta(seconds, unit="s")
+        add(active, draw, cutoff, 0)
+    # Fallback for very short history
+    add(~is_churner & ~active, 0, max_ts, 0)
+
+    # 2. "Dormancy" Snapshots (The Fix for Test Set Distribution)
+    # Add snapshots AFTER the last event to simulate inactivity gaps.
+    # The Test Set has gaps up to ~50 days. We sample from 1 to 45 days.
+    # We add 3 such snapshots per user (draws 2-4) to heavily weight this
+    # "safe gap" concept.
+    for draw in range(2, 5):
+        gaps = integers(keys, draw, 1, 45)
+        cutoff = max_ts + pd.to_timedelta(gaps, unit="D")
+        add(~is_churner, draw, cutoff, 0)
+
+    snapshot_df = pd.concat(pieces, ignore_index=True)
+    snapshot_df = snapshot_df.sort_values(["position", "slot"], kind="stable")
+    snapshot_df.insert(0, "userId", users[snapshot_df["position"].to_numpy()])
+    snapshot_df = snapshot_df.drop(columns=["position", "slot"]).reset_index(drop=True)
 
     # Filter by train_end_date if provided (for time-based validation)
     if train_end_date:
@@ -617,9 +560,38 @@ def generate_training_data(df, train_end_date=None):
     print(f"Generated {len(snapshot_df)} snapshots.")
     print(f"Class Balance: {snapshot_df['target'].mean():.2%}")
 
+    return snapshot_df
+
+
+def generate_training_data(
+    df,
+    train_end_date=None,
+    version="current",
+    backend="pandas",
+    memory_budget=None,
+    seed=42,
+):
+    """
+    Generates training data using the Snapshot approach with Random Sampling.
+    Creates multiple training examples per user at different points in time
+    (see training_snapshots for the sampling strategy).
+
+    Args:
+        df: Raw event log dataframe.
+        train_end_date: Optional date to split train/validation.
+        version: Feature-set version passed to aggregate_user_features.
+        backend: Execution backend passed to aggregate_user_features.
+        memory_budget: Merge memory budget (bytes) passed to aggregate_user_features.
+        seed: Seed of the random snapshot cutoffs (see training_snapshots).
+    """
+    # 1-2. Sample the snapshots
+    snapshot_df = training_snapshots(df, train_end_date, seed)
+
     # 3. Compute Features
     # This calls the updated aggregate_user_features
-    features_df = aggregate_user_features(df, snapshot_df)
+    features_df = aggregate_user_features(
+        df, snapshot_df, version=version, backend=backend, memory_budget=memory_budget
+    )
 
     # 4. Add Target
     # Join the target from snapshot_df
@@ -0,0 +1,183 @@
+import pathlib
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.metrics import average_precision_score, f1_score, log_loss, roc_auc_score
+
+from .utils import PROJECT_ROOT
+
+IMPORTANCE_CACHE_DIR = PROJECT_ROOT / "experiment_reports/importance_cache/"
+
+# Metrics computed from the positive-class probabilities (higher is better)
+SCORERS = {
+    "roc_auc": lambda y, p: roc_auc_score(y, p),
+    "average_precision": lambda y, p: average_precision_score(y, p),
+    "neg_log_loss": lambda y, p: -log_loss(y, p, labels=[0, 1]),
+    "f1": lambda y, p: f1_score(y, (p >= 0.5).astype(int)),
+}
+
+
+def _members(model):
+    """
+    Returns ({name: fitted_estimator}, weights).
+    A soft VotingClassifier is split into its members so that each batch is
+    predicted once per member and the ensemble is rebuilt as their weighted mean.
+    """
+    if hasattr(model, "named_estimators_") and getattr(model, "voting", None) == "soft":
+        members = {
+            name: est
+            for name, est in model.named_estimators_.items()
+            if not isinstance(est, str)
+        }
+        return members, model.weights
+    return {"model": model}, None
+
+
+def _predict_all(members, weights, X):
+    """Positive-class probabilities for every member (+ the soft-vote ensemble)."""
+    probas = {name: est.predict_proba(X)[:, 1] for name, est in members.items()}
+    if len(members) > 1:
+        probas["ensemble"] = np.average(
+            np.column_stack(list(probas.values())), axis=1, weights=weights
+        )
+    return probas
+
+
+def _score_chunk(
+    members, weights, X, y, col_indices, n_repeats, random_state, scorer, max_rows
+):
+    """
+    Permutation scores for a chunk of columns.
+
+    All (column, repeat) permuted copies are concatenated and predicted in
+    batches of at most max_rows rows, instead of one predict call per copy.
+    Returns {name: array (len(col_indices), n_repeats)}.
+    """
+    n = len(X)
+    copies = []
+    for col_idx in col_indices:
+        # Seeded per column: results do not depend on how columns are chunked
+        rng = np.random.default_rng([random_state, col_idx])
+        for _ in range(n_repeats):
+            copies.append((col_idx, rng.permutation(n)))
+
+    per_batch = max(1, max_rows // n)
+    scores = {}
+    for start in range(0, len(copies), per_batch):
+        batch = copies[start : start + per_batch]
+        X_batch = pd.concat([X] * len(batch), ignore_index=True)
+        for k, (col_idx, perm) in enumerate(batch):
+            col = X.columns[col_idx]
+            X_batch.iloc[k * n : (k + 1) * n, col_idx] = X[col].values[perm]
+
+        probas = _predict_all(members, weights, X_batch)
+        for name, p in probas.items():
+            scores.setdefault(name, []).extend(
+                scorer(y, p[k * n : (k + 1) * n]) for k in range(len(batch))
+            )
+
+    return {
+        name: np.array(s).reshape(len(col_indices), n_repeats)
+        for name, s in scores.items()
+    }
+
+
+def compute_permutation_importance(
+    model,
+    X,
+    y,
+    scoring="roc_auc",
+    n_repeats=5,
+    max_samples=None,
+    n_jobs=-1,
+    max_rows=500_000,
+    random_state=42,
+    use_cache=True,
+    cache_dir=None,
+):
+    """
+    Permutation importance (baseline score - permuted score, averaged over repeats).
+
+    - Model agnostic: works on raw features through Pipelines, Bagging, etc.
+    - A soft VotingClassifier is handled directly: returns one column per member
+      plus an 'ensemble' column, all from the same permuted batches.
+    - Columns are split in chunks scored in a process pool (joblib/loky).
+    - Results are cached on disk, keyed by the model hash and the inputs.
+
+    Args:
+        model: Fitted estimator with predict_proba.
+        X: Validation DataFrame (raw features, as fed to the model).
+        y: Validation target.
+        scoring: One of SCORERS.
+        max_samples: Optional row subsample of large validation sets.
+        max_rows: Max rows per batched predict_proba call.
+
+    Returns:
+        DataFrame indexed by feature name, one column per member (or 'model').
+    """
+    if scoring not in SCORERS:
+        raise ValueError(f"Unknown scoring '{scoring}'. Options: {list(SCORERS)}")
+    scorer = SCORERS[scoring]
+    y = np.asarray(y)
+
+    if max_samples is not None and len(X) > max_samples:
+        idx = np.random.default_rng(random_state).choice(
+            len(X), max_samples, replace=False
+        )
+        X, y = X.iloc[np.sort(idx)], y[np.sort(idx)]
+    X = X.reset_index(drop=True)
+
+    # 1. Cache lookup
+    cache_path = None
+    if use_cache:
+        key = joblib.hash((joblib.hash(model), X, y, scoring, n_repeats, random_state))
+        cache_path = pathlib.Path(cache_dir or IMPORTANCE_CACHE_DIR) / f"{key}.joblib"
+        if cache_path.exists():
+            print(f"♻️  Loaded cached importance: {cache_path.name}")
+            return joblib.load(cache_path)
+
+    # 2. Baseline score
+    members, weights = _members(model)
+    baseline = {
+        name: scorer(y, p) for name, p in _predict_all(members, weights, X).items()
+    }
+
+    # 3. Permuted scores, chunks of columns in parallel
+    n_chunks = min(
+        len(X.columns), joblib.cpu_count() if n_jobs == -1 else max(1, n_jobs)
+    )
+    chunks = np.array_split(np.arange(len(X.columns)), n_chunks)
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_score_chunk)(
+            members, weights, X, y, chunk, n_repeats, random_state, scorer, max_rows
+        )
+        for chunk in chunks
+    )
+
+    importances = pd.DataFrame(
+        {
+            name: baseline[name]
+            - np.concatenate([r[name] for r in results]).mean(axis=1)
+            for name in baseline
+        },
+        index=X.columns,
+    )
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(importances, cache_path)
+
+    return importances
+
+
+def get_permutation_importance(model, X, y, **kwargs):
+    """
+    Same interface as visualization.get_true_names_and_importance: returns a
+    pd.Series of importances indexed by feature name (the ensemble's for a
+    soft VotingClassifier). See compute_permutation_importance for kwargs.
+    """
+    importances = compute_permutation_importance(model, X, y, **kwargs)
+    column = "ensemble" if "ensemble" in importances.columns else importances.columns[0]
+    return importances[column].rename(None)
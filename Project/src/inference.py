@@ -0,0 +1,239 @@
+"""
+Single-file inference bundle: feature transformer + preprocessor + ensemble +
+decision threshold, versioned and loaded in one call.
+
+models/ used to hold preprocessor.joblib, feature_names.joblib and
+optimal_threshold.joblib as separate files. The last cell of Modeling.ipynb
+also saves stacking_model.joblib and feature_transformer.joblib, then the
+bundle (InferenceBundle.from_models_dir(...).save()). A bundle keeps
+everything needed to go from raw events to churn predictions together:
+
+- saved uncompressed, so the large numpy arrays inside the models (tree nodes,
+  coefficients) are memory-mapped at load time instead of copied,
+- scored in fixed-size user batches (bounded memory), with the cold-start and
+  per-batch latencies recorded.
+"""
+
+import re
+import time
+import pathlib
+import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from .feature_transformer import MODELS_DIR, iter_user_batches
+
+BUNDLE_FORMAT = 1
+BUNDLE_PATTERN = re.compile(r"inference_bundle_v(\d+)\.joblib$")
+
+
+def _bundle_versions(models_dir):
+    """{version number: path} of the bundles saved in models_dir."""
+    versions = {}
+    for path in pathlib.Path(models_dir).glob("inference_bundle_v*.joblib"):
+        match = BUNDLE_PATTERN.search(path.name)
+        if match:
+            versions[int(match.group(1))] = path
+    return versions
+
+
+def _library_versions():
+    import sklearn
+
+    return {
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+class InferenceBundle:
+    """
+    Everything needed to score users from their raw events.
+
+    Args:
+        transformer: Fitted FeatureTransformer (its 'features' are the model inputs).
+        ensemble: Fitted classifier with predict_proba (e.g. the soft VotingClassifier).
+        threshold: Decision threshold on the churn probability.
+        preprocessor: Fitted preprocessor applied once before the ensemble.
+                      Kept but not applied when preprocess=False (ensemble members
+                      are Pipelines embedding their own copy, as in Modeling.ipynb).
+        preprocess: Whether predict applies 'preprocessor' before the ensemble.
+
+    Attributes:
+        version: Bundle number (set by save / load).
+        metadata: Creation date, feature names and library versions.
+        load_seconds: Cold-start time of the last load (None if built in memory).
+        batch_latencies_: Seconds per batch of the last predict_proba call.
+        compiled: CompiledEnsemble used instead of 'ensemble' (see compile()).
+    """
+
+    def __init__(
+        self, transformer, ensemble, threshold, preprocessor=None, preprocess=None
+    ):
+        self.transformer = transformer
+        self.ensemble = ensemble
+        self.threshold = float(threshold)
+        self.preprocessor = preprocessor
+        self.preprocess = preprocessor is not None if preprocess is None else preprocess
+        self.version = None
+        self.metadata = {
+            "format": BUNDLE_FORMAT,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "features": list(transformer.features),
+            "libraries": _library_versions(),
+        }
+        self.load_seconds = None
+        self.batch_latencies_ = []
+        self.compiled = None
+
+    @classmethod
+    def from_models_dir(cls, models_dir=None, model_file="stacking_model.joblib"):
+        """
+        Bundles the separate artifacts saved by Modeling.ipynb
+        (model, preprocessor, threshold, feature transformer).
+
+        Raises FileNotFoundError if one is missing: run the "SAVE MODEL
+        ARTIFACTS" cell of Modeling.ipynb, or build the bundle from the
+        in-memory objects with InferenceBundle(transformer, ensemble, ...).
+        """
+        from .feature_transformer import FeatureTransformer
+
+        models_dir = pathlib.Path(models_dir or MODELS_DIR)
+        files = [
+            model_file,
+            "preprocessor.joblib",
+            "optimal_threshold.joblib",
+            "feature_transformer.joblib",
+        ]
+        missing = [name for name in files if not (models_dir / name).exists()]
+        if missing:
+            raise FileNotFoundError(
+                f"Missing model artifacts in {models_dir}: {missing}. Run the "
+                f"'SAVE MODEL ARTIFACTS' cell of Modeling.ipynb, or build the "
+                f"bundle from the in-memory ensemble: InferenceBundle(transformer, "
+                f"ensemble, threshold, preprocessor)."
+            )
+        ensemble = joblib.load(models_dir / model_file)
+        preprocessor = joblib.load(models_dir / "preprocessor.joblib")
+        threshold = joblib.load(models_dir / "optimal_threshold.joblib")
+        transformer = FeatureTransformer.load(models_dir / "feature_transformer.joblib")
+
+        # The notebook's VotingClassifier members are Pipelines(preprocessor, model)
+        members = getattr(ensemble, "estimators", None) or []
+        embedded = bool(members) and all(hasattr(est, "steps") for _, est in members)
+        return cls(transformer, ensemble, threshold, preprocessor, not embedded)
+
+    # --- 1. PERSISTENCE ---
+
+    def save(self, models_dir=None, version=None):
+        """
+        Saves the bundle as models/inference_bundle_v{version}.joblib
+        (next free version by default). Uncompressed, so it can be memory-mapped.
+        """
+        models_dir = pathlib.Path(models_dir or MODELS_DIR)
+        models_dir.mkdir(parents=True, exist_ok=True)
+        if version is None:
+            version = max(_bundle_versions(models_dir), default=0) + 1
+        self.version = version
+        self.metadata["libraries"] = _library_versions()
+
+        path = models_dir / f"inference_bundle_v{version}.joblib"
+        latencies, self.batch_latencies_ = self.batch_latencies_, []
+        try:
+            joblib.dump(self, path)
+        finally:
+            self.batch_latencies_ = latencies
+        print(f"-> Saved inference bundle v{version} to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path=None, version=None, mmap=True):
+        """
+        Loads a bundle in one call (latest version of models/ by default).
+        Large arrays are memory-mapped (read-only) unless mmap=False.
+        """
+        start = time.perf_counter()
+        if path is None:
+            versions = _bundle_versions(MODELS_DIR)
+            if not versions:
+                raise FileNotFoundError(f"No inference bundle in {MODELS_DIR}")
+            path = versions[version if version is not None else max(versions)]
+        bundle = joblib.load(path, mmap_mode="r" if mmap else None)
+        bundle.load_seconds = time.perf_counter() - start
+
+        saved = bundle.metadata.get("libraries", {})
+        for name, current in _library_versions().items():
+            if saved.get(name) not in (None, current):
+                print(f"⚠️ Bundle saved with {name} {saved[name]}, running {current}")
+        print(
+            f"✅ Loaded inference bundle v{bundle.version} in {bundle.load_seconds:.3f}s"
+        )
+        return bundle
+
+    # --- 2. PREDICTION ---
+
+    def compile(self, dtype=np.float32, n_threads=None):
+        """
+        Switches predict to the faster CompiledEnsemble scoring mode
+        (shared preprocessing, parallel native tree predictors, stacked LRs).
+        """
+        from .compiled_ensemble import CompiledEnsemble
+
+        self.compiled = CompiledEnsemble(self.ensemble, dtype, n_threads)
+        return self
+
+    def _score(self, features):
+        X = features[self.transformer.features]
+        if self.preprocess:
+            X = self.preprocessor.transform(X)
+        model = getattr(self, "compiled", None) or self.ensemble
+        return model.predict_proba(X)[:, 1]
+
+    def predict_proba(self, df, snapshot_df=None, batch_size=1000):
+        """
+        Churn probability of every user (or snapshot) in the event log.
+
+        Args:
+            df: Event log (after extract_user_attributes).
+            snapshot_df: Optional ['userId', 'cutoff_ts'] (e.g. the test cutoff).
+            batch_size: Users scored together: bounds the memory used.
+
+        Returns a Series indexed like the features (userId[, cutoff_ts]).
+        """
+        scores = []
+        self.batch_latencies_ = []
+        for events, snapshots in iter_user_batches(df, snapshot_df, batch_size):
+            start = time.perf_counter()
+            features = self.transformer.transform(events, snapshots)
+            scores.append(pd.Series(self._score(features), index=features.index))
+            self.batch_latencies_.append(time.perf_counter() - start)
+        return pd.concat(scores).rename("churn_proba")
+
+    def predict(self, df, snapshot_df=None, batch_size=1000):
+        """Churn predictions (probability >= threshold) of every user."""
+        proba = self.predict_proba(df, snapshot_df, batch_size)
+        return (proba >= self.threshold).astype(int).rename("churn")
+
+    def latency_report(self):
+        """Cold-start time and per-batch latency of the last predict_proba call."""
+        latencies = np.asarray(self.batch_latencies_)
+        report = {
+            "version": self.version,
+            "cold_start_sec": self.load_seconds,
+            "n_batches": len(latencies),
+            "batch_p50_sec": float(np.median(latencies)) if len(latencies) else None,
+            "batch_p95_sec": (
+                float(np.percentile(latencies, 95)) if len(latencies) else None
+            ),
+            "batch_max_sec": float(latencies.max()) if len(latencies) else None,
+            "total_sec": float(latencies.sum()),
+        }
+        print(
+            f"Cold start: {report['cold_start_sec'] or 0:.3f}s | "
+            f"{report['n_batches']} batches, p50 {report['batch_p50_sec'] or 0:.3f}s, "
+            f"p95 {report['batch_p95_sec'] or 0:.3f}s"
+        )
+        return report
@@ -0,0 +1,376 @@
+"""
+Streaming ingestion: per-user aggregates updated as events arrive.
+
+Everything else in src/ reads a complete parquet snapshot. Here events are
+consumed from an asyncio.Queue (a stand-in for a socket / message broker):
+
+- the queue is bounded, so producers wait when the consumer falls behind
+  (backpressure) instead of growing memory without limit,
+- events are drained in micro-batches and go through the same per-event logic
+  as the batch pipeline (extract_behavioral_flags, aggregate_session_metrics),
+- per-user counters (events, songs, thumbs, ads, errors, redirects, listen
+  time, sessions, first / last event) and daily window buckets are updated in
+  place, with one vectorized np.add.at per micro-batch,
+- exponentially-decayed counters (decay.DecayedCounters) are updated in O(1)
+  per event next to the window buckets,
+- the aggregates are flushed to parquet every 'flush_every' seconds.
+
+Window sums (songs_last_7d, ...) are bucketed to the day and relative to the
+stream clock (newest event seen), like the test snapshot at ts.max().
+load_test replays a synthetic log through the whole loop and reports
+events/sec and the enqueue-to-update latency.
+"""
+
+import time
+import asyncio
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from .decay import DecayedCounters, decay_name
+from .features import aggregate_session_metrics, extract_behavioral_flags
+from .feature_registry import WINDOW_STATS, WINDOWS, window_name
+from .utils import PROJECT_ROOT
+
+STREAM_DIR = PROJECT_ROOT / "data/stream"
+
+# Per-user running sums (event flags of the batch pipeline + listen time).
+# 'downgrade_events' counts downgrades; to_frame adds the has-ever 'downgrade'
+# flag of the batch features (max)
+COUNTERS = [
+    "events",
+    "is_song",
+    "thumbs_up",
+    "thumbs_down",
+    "roll_advert",
+    "downgrade_events",
+    "is_error",
+    "is_redirect",
+    "length",
+]
+
+# Window buckets: only the additive window statistics (no unique counts)
+BUCKET_STATS = {
+    stat: source for stat, (source, agg) in WINDOW_STATS.items() if agg == "sum"
+}
+
+DAY_NS = 24 * 3600 * 10**9
+
+
+def _prepare(events):
+    """Micro-batch of raw events -> frame with the per-event flags."""
+    batch = pd.DataFrame.from_records(events)
+    if pd.api.types.is_numeric_dtype(batch["ts"]):
+        # 'ts' is in milliseconds in the raw events (as in the parquet files)
+        batch["ts"] = pd.to_datetime(batch["ts"], unit="ms")
+    batch = extract_behavioral_flags(aggregate_session_metrics(batch))
+    batch["is_song"] = (batch["page"] == "NextSong").astype(int)
+    batch["is_thumbs_down"] = batch["thumbs_down"]
+    batch["downgrade_events"] = batch["downgrade"]
+    batch["events"] = 1
+    batch["length"] = batch["length"].fillna(0.0)
+    return batch
+
+
+class UserAggregates:
+    """
+    Running per-user counters and daily window buckets.
+
+    Args:
+        windows: Window lengths in days (default: feature_registry.WINDOWS).
+        half_lives: Half-lives of the decayed counters in days
+                    (default: decay.DECAY_HALF_LIVES).
+
+    Attributes:
+        users: userId -> row of the arrays below.
+        counts: (n_users, len(COUNTERS)) running sums.
+        first_ts, last_ts: First / last event time of each user (ns).
+        sessions: Number of distinct sessionIds of each user.
+        buckets: {day number: (n_users, len(BUCKET_STATS)) sums of that day},
+                 only the days still inside the longest window.
+        decayed: DecayedCounters of BUCKET_STATS (one row per user).
+        clock: Newest event time seen (ns).
+    """
+
+    def __init__(self, windows=None, half_lives=None):
+        self.windows = list(windows or WINDOWS)
+        self.users = {}
+        self.capacity = 1024
+        self.counts = np.zeros((self.capacity, len(COUNTERS)))
+        self.first_ts = np.full(self.capacity, np.iinfo(np.int64).max)
+        self.last_ts = np.full(self.capacity, np.iinfo(np.int64).min)
+        self.sessions = np.zeros(self.capacity, dtype=np.int64)
+        self._seen_sessions = set()
+        self.buckets = {}
+        self.decayed = DecayedCounters(len(BUCKET_STATS), half_lives, self.capacity)
+        self.clock = None
+
+    def _rows(self, user_ids):
+        """Array rows of the users (new users get a new row)."""
+        codes, uniques = pd.factorize(user_ids)
+        rows = np.empty(len(uniques), dtype=np.int64)
+        for i, user in enumerate(uniques):
+            rows[i] = self.users.setdefault(user, len(self.users))
+        if len(self.users) > self.capacity:
+            self._grow(max(2 * self.capacity, len(self.users)))
+        return rows[codes]
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.counts = np.vstack([self.counts, np.zeros((extra, len(COUNTERS)))])
+        self.first_ts = np.r_[self.first_ts, np.full(extra, np.iinfo(np.int64).max)]
+        self.last_ts = np.r_[self.last_ts, np.full(extra, np.iinfo(np.int64).min)]
+        self.sessions = np.r_[self.sessions, np.zeros(extra, dtype=np.int64)]
+        for day, bucket in self.buckets.items():
+            self.buckets[day] = np.vstack([bucket, np.zeros((extra, bucket.shape[1]))])
+        self.decayed.grow(capacity)
+        self.capacity = capacity
+
+    def update(self, events):
+        """Applies one micro-batch of raw events (list of dicts). Returns its size."""
+        batch = _prepare(events)
+        batch = batch[batch["userId"].notna() & batch["ts"].notna()]
+        if batch.empty:
+            return 0
+        rows = self._rows(batch["userId"].to_numpy())
+        ts = batch["ts"].to_numpy().astype("datetime64[ns]").view("int64")
+
+        # 1. Counters, first / last event
+        np.add.at(self.counts, rows, batch[COUNTERS].to_numpy(dtype=float))
+        np.minimum.at(self.first_ts, rows, ts)
+        np.maximum.at(self.last_ts, rows, ts)
+
+        # 2. Distinct sessions (only the pairs not seen before)
+        for row, session in set(zip(rows.tolist(), batch["sessionId"].tolist())):
+            if session == session and (row, session) not in self._seen_sessions:
+                self._seen_sessions.add((row, session))
+                self.sessions[row] += 1
+
+        # 3. Daily window buckets, then drop the days out of the longest window
+        days = ts // DAY_NS
+        values = batch[list(BUCKET_STATS.values())].to_numpy(dtype=float)
+        for day in np.unique(days):
+            bucket = self.buckets.get(day)
+            if bucket is None:
+                bucket = self.buckets[day] = np.zeros(
+                    (self.capacity, len(BUCKET_STATS))
+                )
+            in_day = days == day
+            np.add.at(bucket, rows[in_day], values[in_day])
+        self.decayed.update(rows, ts / DAY_NS, values)
+        newest = ts.max()
+        self.clock = newest if self.clock is None else max(self.clock, newest)
+        oldest = self.clock // DAY_NS - max(self.windows)
+        for day in [d for d in self.buckets if d <= oldest]:
+            del self.buckets[day]
+        return len(batch)
+
+    def window(self, days):
+        """Sums of BUCKET_STATS over the last 'days' days (incl. today) per user."""
+        total = np.zeros((len(self.users), len(BUCKET_STATS)))
+        if self.clock is None:
+            return total
+        today = self.clock // DAY_NS
+        for day, bucket in self.buckets.items():
+            if day > today - days:
+                total += bucket[: len(self.users)]
+        return total
+
+    def to_frame(self):
+        """
+        One row per user: counters, sessions, first / last event, windows and
+        decayed counters (decayed to the stream clock).
+        """
+        n = len(self.users)
+        frame = pd.DataFrame(self.counts[:n], columns=COUNTERS)
+        frame["events"] = frame["events"].astype(int)
+        frame["downgrade"] = (frame["downgrade_events"] > 0).astype(int)
+        frame["total_sessions"] = self.sessions[:n]
+        frame["first_ts"] = pd.to_datetime(self.first_ts[:n])
+        frame["last_ts"] = pd.to_datetime(self.last_ts[:n])
+        for days in self.windows:
+            sums = self.window(days)
+            for j, stat in enumerate(BUCKET_STATS):
+                frame[window_name(stat, days)] = sums[:, j]
+        if self.clock is not None:
+            decayed = self.decayed.value_at(self.clock / DAY_NS, n)
+            for h, half_life in enumerate(self.decayed.half_lives):
+                for j, stat in enumerate(BUCKET_STATS):
+                    frame[decay_name(stat, half_life)] = decayed[:, j, h]
+        frame.index = pd.Index(list(self.users), name="userId")
+        return frame
+
+
+class EventIngestor:
+    """
+    Asyncio consumer updating UserAggregates from a bounded queue.
+
+    Args:
+        aggregates: UserAggregates to update (default: a new one).
+        max_queue: Queue size: producers wait (backpressure) when it is full.
+        batch_size: Maximum events applied per micro-batch.
+        flush_every: Seconds between parquet flushes (None: only at the end).
+        output_dir: Folder of the flushed 'user_aggregates.parquet'.
+
+    Attributes:
+        latencies: Enqueue-to-update seconds of each event.
+        n_events, n_batches, n_flushes, max_depth: Counters of the run.
+    """
+
+    def __init__(
+        self,
+        aggregates=None,
+        max_queue=10_000,
+        batch_size=500,
+        flush_every=5.0,
+        output_dir=None,
+    ):
+        self.aggregates = aggregates or UserAggregates()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self.output_dir = pathlib.Path(output_dir or STREAM_DIR)
+        self.latencies = []
+        self.n_events = self.n_batches = self.n_flushes = self.max_depth = 0
+
+    async def put(self, event):
+        """Enqueues one raw event (waits while the queue is full)."""
+        await self.queue.put((time.perf_counter(), event))
+
+    async def close(self):
+        """Asks the consumer to stop once the queued events are applied."""
+        await self.queue.put(None)
+
+    async def flush(self):
+        """Writes the current aggregates to parquet (atomic replace, off the loop)."""
+        frame = self.aggregates.to_frame()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / "user_aggregates.parquet"
+        tmp_path = path.with_suffix(".parquet.tmp")
+
+        def write():
+            frame.to_parquet(tmp_path)
+            tmp_path.replace(path)
+
+        await asyncio.to_thread(write)
+        self.n_flushes += 1
+        return path
+
+    async def run(self):
+        """Consumes the queue until close(), then flushes a last time."""
+        last_flush = time.perf_counter()
+        done = False
+        while not done:
+            # 1. Wait for one event, then drain what is already queued
+            items = [await self.queue.get()]
+            self.max_depth = max(self.max_depth, self.queue.qsize() + 1)
+            while len(items) < self.batch_size and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            if items[-1] is None:
+                done = True
+                items.pop()
+
+            # 2. Apply the micro-batch
+            if items:
+                self.aggregates.update([event for _, event in items])
+                applied = time.perf_counter()
+                self.latencies.extend(applied - queued for queued, _ in items)
+                self.n_events += len(items)
+                self.n_batches += 1
+
+            # 3. Periodic flush
+            if (
+                self.flush_every
+                and time.perf_counter() - last_flush >= self.flush_every
+            ):
+                await self.flush()
+                last_flush = time.perf_counter()
+        return await self.flush()
+
+
+async def replay_events(ingestor, df, rate=None):
+    """
+    Producer: feeds the rows of an event log to the ingestor in 'ts' order.
+
+    Args:
+        rate: Target events per second (None: as fast as backpressure allows).
+    """
+    events = df.sort_values("ts", kind="stable").to_dict("records")
+    start = time.perf_counter()
+    for i, event in enumerate(events):
+        await ingestor.put(event)
+        if rate is not None:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    await ingestor.close()
+
+
+async def run_load_test(df, output_dir, rate=None, **ingestor_args):
+    """Async body of load_test (use it directly inside a running event loop)."""
+    ingestor = EventIngestor(output_dir=output_dir, **ingestor_args)
+    start = time.perf_counter()
+    await asyncio.gather(replay_events(ingestor, df, rate), ingestor.run())
+    elapsed = time.perf_counter() - start
+
+    latencies = np.asarray(ingestor.latencies)
+    return ingestor, {
+        "n_events": ingestor.n_events,
+        "n_users": len(ingestor.aggregates.users),
+        "seconds": elapsed,
+        "events_per_sec": ingestor.n_events / elapsed,
+        "latency_p50_ms": float(np.median(latencies)) * 1000,
+        "latency_p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "latency_max_ms": float(latencies.max()) * 1000,
+        "n_batches": ingestor.n_batches,
+        "n_flushes": ingestor.n_flushes,
+        "max_queue_depth": ingestor.max_depth,
+    }
+
+
+def load_test(df=None, n_users=200, rate=None, output_dir=None, **ingestor_args):
+    """
+    End-to-end load test: replays an event log (default: synthetic) through the
+    queue, the per-user updates and the parquet flushes.
+
+    Also checks the streamed counters against a pandas groupby of the same log.
+    Returns a dict with events/sec, latency percentiles and the check result.
+    """
+    import tempfile
+
+    if df is None:
+        from .equivalence import make_synthetic_events
+
+        df = make_synthetic_events(n_users)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ingestor, report = asyncio.run(
+            run_load_test(df, output_dir or tmp_dir, rate, **ingestor_args)
+        )
+        flushed = pd.read_parquet(ingestor.output_dir / "user_aggregates.parquet")
+
+    # Same counters from the batch pipeline
+    expected = aggregate_session_metrics(extract_behavioral_flags(df))
+    grouped = expected[expected["userId"].notna()].groupby("userId")
+    checks = {
+        "thumbs_down": grouped["thumbs_down"].sum(),
+        "is_error": grouped["is_error"].sum(),
+        "downgrade": grouped["downgrade"].max(),
+        "total_sessions": grouped["sessionId"].nunique(),
+        "events": grouped.size(),
+    }
+    flushed = flushed.sort_index()
+    report["matches_batch"] = all(
+        np.array_equal(flushed[col].to_numpy(), values.sort_index().to_numpy())
+        for col, values in checks.items()
+    )
+
+    status = "✅" if report["matches_batch"] else "❌"
+    print(
+        f"{status} Ingested {report['n_events']} events from {report['n_users']} users "
+        f"in {report['seconds']:.2f}s ({report['events_per_sec']:.0f} events/s) | "
+        f"latency p50 {report['latency_p50_ms']:.1f}ms, "
+        f"p95 {report['latency_p95_ms']:.1f}ms | {report['n_flushes']} flush(es)"
+    )
+    return report
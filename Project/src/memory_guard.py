@@ -0,0 +1,191 @@
+"""
+Memory budget guard for the large merges of the feature pipeline.
+
+The merges of label_churn (churn time per event) and aggregate_user_features
+(snapshot cutoffs x events, per-user last event, last session) materialise a
+frame the size of the event log or larger (one copy of a user's events per
+snapshot). On constrained nodes they were killed without warning.
+
+With a memory budget (bytes), each merge's output is estimated first from the
+per-key row counts (cheap: a groupby size on the keys) and the bytes per row
+of a sample. Over budget, the work is split by user (hash of userId), into
+at most one partition per user:
+
+- the inputs of each user partition are written to local parquet files,
+- the partitions are read back and processed one at a time,
+- the spill folder is removed at the end.
+
+Every aggregation is per user, so the partitioned results are the same as the
+in-memory ones. A single user's rows are never split: if one user alone is
+over the budget, a warning is printed (once) and that partition runs anyway.
+"""
+
+import math
+import pathlib
+import shutil
+import tempfile
+
+import pandas as pd
+
+from .utils import PROJECT_ROOT
+
+SPILL_DIR = PROJECT_ROOT / "data/spill"
+
+# Rows sampled to estimate the bytes per row (deep memory usage is O(rows))
+SAMPLE_ROWS = 10_000
+
+_warned_oversized = False
+
+
+def _row_bytes(frame, columns=None):
+    """Average in-memory bytes of one row of frame[columns] (sampled)."""
+    sample = frame if columns is None else frame[columns]
+    sample = sample.head(SAMPLE_ROWS)
+    if len(sample) == 0:
+        return 0.0
+    return sample.memory_usage(deep=True, index=False).sum() / len(sample)
+
+
+def format_bytes(n_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n_bytes < 1024:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} TB"
+
+
+def _keys(keys):
+    return [keys] if isinstance(keys, str) else list(keys)
+
+
+def _key_rows(left, right, on=None, left_on=None, right_on=None, how="inner"):
+    """Output rows of left.merge(right, ...) per left key, and bytes per row."""
+    left_on, right_on = _keys(left_on or on), _keys(right_on or on)
+
+    left_counts = left.groupby(left_on, observed=True).size()
+    right_counts = right.groupby(right_on, observed=True).size()
+    right_counts.index.names = left_counts.index.names
+    matched = right_counts.reindex(left_counts.index, fill_value=0)
+    if how == "left":
+        matched = matched.clip(lower=1)
+
+    extra = [c for c in right.columns if c not in right_on]
+    return left_counts * matched, _row_bytes(left) + _row_bytes(right, extra)
+
+
+def estimate_merge(left, right, on=None, left_on=None, right_on=None, how="inner"):
+    """
+    Estimated (rows, bytes) of left.merge(right, ...) without running it.
+
+    Rows are exact for equality keys (sum over keys of left x right counts,
+    unmatched left rows kept by a left merge); bytes use sampled row sizes.
+    """
+    key_rows, row_bytes = _key_rows(left, right, on, left_on, right_on, how)
+    rows = int(key_rows.sum())
+    return rows, rows * row_bytes
+
+
+def n_partitions(n_bytes, budget, n_users=None):
+    """
+    Number of user partitions keeping each one under the budget (1 = no split),
+    capped at n_users (a user's rows are never split).
+    """
+    n_parts = max(1, math.ceil(n_bytes / budget))
+    return n_parts if n_users is None else max(1, min(n_parts, n_users))
+
+
+def plan_partitions(left, right, budget, **merge_keys):
+    """
+    (rows, bytes, n_parts) of a merge on keys including 'userId': its estimated
+    size and the number of user partitions keeping it under the budget.
+
+    Warns once when a single user's output is over the budget on its own.
+    """
+    global _warned_oversized
+
+    key_rows, row_bytes = _key_rows(left, right, **merge_keys)
+    user_rows = key_rows.groupby(level="userId").sum()
+    rows = int(user_rows.sum())
+    n_bytes = rows * row_bytes
+    n_parts = n_partitions(n_bytes, budget, n_users=len(user_rows))
+
+    largest = user_rows.max() * row_bytes if len(user_rows) else 0.0
+    if n_parts > 1 and largest > budget and not _warned_oversized:
+        _warned_oversized = True
+        print(
+            f"⚠️ One user's merge output (~{format_bytes(largest)}) is over the "
+            f"{format_bytes(budget)} budget: its partition is processed whole"
+        )
+    return rows, n_bytes, n_parts
+
+
+def user_partitions(user_ids, n_parts):
+    """Partition number of each row: stable hash of its userId modulo n_parts."""
+    hashes = pd.util.hash_pandas_object(pd.Series(user_ids), index=False)
+    return (hashes.to_numpy() % n_parts).astype(int)
+
+
+def spill_by_user(frames, n_parts, spill_dir=None):
+    """
+    Writes each frame (all with a 'userId' column) to parquet in n_parts user
+    partitions, then yields the list of frames of each partition, read back one
+    partition at a time. None entries are passed through.
+    """
+    spill_dir = pathlib.Path(spill_dir or SPILL_DIR)
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    workdir = pathlib.Path(tempfile.mkdtemp(dir=spill_dir))
+    try:
+        # 1. Write: one file per (frame, partition)
+        for k, frame in enumerate(frames):
+            if frame is None:
+                continue
+            parts = user_partitions(frame["userId"], n_parts)
+            for part, chunk in frame.groupby(parts):
+                chunk.to_parquet(workdir / f"{k}-{part}.parquet", index=False)
+
+        # 2. Read back one partition at a time (empty frame if no rows)
+        for part in range(n_parts):
+            chunks = []
+            for k, frame in enumerate(frames):
+                path = workdir / f"{k}-{part}.parquet"
+                if frame is None:
+                    chunks.append(None)
+                elif path.exists():
+                    chunks.append(pd.read_parquet(path))
+                else:
+                    chunks.append(frame.iloc[:0].reset_index(drop=True))
+            yield chunks
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def guarded_merge(left, right, budget=None, spill_dir=None, **merge_kwargs):
+    """
+    left.merge(right, **merge_kwargs), partitioned by userId when the estimated
+    output is over 'budget' bytes (None: no guard).
+
+    Both frames need a 'userId' key. The inputs are spilled to parquet per
+    user partition, each partition is merged on its own and the outputs are
+    concatenated in the order of the in-memory merge (left rows order, for
+    inner / left merges).
+    """
+    if budget is None:
+        return left.merge(right, **merge_kwargs)
+    keys = {k: merge_kwargs.get(k) for k in ["on", "left_on", "right_on", "how"]}
+    rows, n_bytes, n_parts = plan_partitions(
+        left, right, budget, **{k: v for k, v in keys.items() if v}
+    )
+    if n_parts == 1:
+        return left.merge(right, **merge_kwargs)
+
+    print(
+        f"💾 Merge of ~{rows} rows ({format_bytes(n_bytes)}) over the "
+        f"{format_bytes(budget)} budget: {n_parts} user partitions spilled to disk"
+    )
+    left = left.assign(_row=range(len(left)))
+    outputs = []
+    for left_part, right_part in spill_by_user([left, right], n_parts, spill_dir):
+        outputs.append(left_part.merge(right_part, **merge_kwargs))
+    merged = pd.concat(outputs, ignore_index=True)
+    merged = merged.sort_values("_row", kind="stable", ignore_index=True)
+    return merged.drop(columns="_row")
@@ -0,0 +1,211 @@
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+from sklearn.model_selection import GroupKFold, StratifiedKFold
+
+
+class OOFPredictionCache:
+    """
+    Stores out-of-fold probabilities (positive class) for every base model.
+
+    Each base model is fitted once per fold. Ensembles (soft voting with any
+    weights, stacking) and threshold searches are then recombined from the
+    cached predictions without refitting anything.
+
+    Attributes:
+        y: Target array (n_samples,).
+        fold_ids: Fold number of each sample when it was in the validation set.
+        probas: Dict {model_name: OOF probabilities (n_samples,)}.
+        fit_times: Dict {model_name: total fit + predict seconds over all folds}.
+    """
+
+    def __init__(self, y, fold_ids):
+        self.y = np.asarray(y)
+        self.fold_ids = np.asarray(fold_ids)
+        self.probas = {}
+        self.fit_times = {}
+
+    @property
+    def n_folds(self):
+        return int(self.fold_ids.max()) + 1
+
+    @property
+    def model_names(self):
+        return list(self.probas.keys())
+
+    def fold_indices(self, fold):
+        """Returns (train_idx, valid_idx) of a fold."""
+        valid = self.fold_ids == fold
+        return np.flatnonzero(~valid), np.flatnonzero(valid)
+
+    # --- 1. BUILDING THE CACHE ---
+
+    @classmethod
+    def from_models(cls, models, X, y, preprocessor=None, cv=5, groups=None):
+        """
+        Fits every model on every fold and caches the validation probabilities.
+
+        Args:
+            models: Dict {name: estimator} or list of (name, estimator) tuples
+                    (e.g. the 'estimators' list given to the VotingClassifier).
+            X, y: Training data.
+            preprocessor: Optional transformer applied before each model. It is
+                          fitted once per fold and shared by all models.
+            cv: Number of folds. Same StratifiedKFold split as cross_validate(cv=5),
+                or GroupKFold if groups are given.
+        """
+        y = np.asarray(y)
+        if groups is not None:
+            splitter = GroupKFold(n_splits=cv)
+        else:
+            splitter = StratifiedKFold(n_splits=cv)
+        splits = list(splitter.split(X, y, groups))
+
+        fold_ids = np.empty(len(y), dtype=int)
+        for fold, (_, valid_idx) in enumerate(splits):
+            fold_ids[valid_idx] = fold
+
+        cache = cls(y, fold_ids)
+        cache._splits = splits
+        cache.add_models(models, X, preprocessor=preprocessor)
+        return cache
+
+    def add_models(self, models, X, preprocessor=None):
+        """Adds (or replaces) base models without touching the already cached ones."""
+        items = list(models.items()) if isinstance(models, dict) else list(models)
+        items = [(name, est) for name, est in items if est is not None]
+        splits = getattr(self, "_splits", None) or [
+            self.fold_indices(f) for f in range(self.n_folds)
+        ]
+
+        for name, _ in items:
+            self.probas[name] = np.full(len(self.y), np.nan)
+            self.fit_times[name] = 0.0
+
+        for fold, (train_idx, valid_idx) in enumerate(splits):
+            X_tr, X_va = _take(X, train_idx), _take(X, valid_idx)
+
+            # Preprocess once per fold, shared by all models
+            if preprocessor is not None:
+                fold_pre = clone(preprocessor)
+                X_tr = fold_pre.fit_transform(X_tr, self.y[train_idx])
+                X_va = fold_pre.transform(X_va)
+
+            for name, estimator in items:
+                start = time.perf_counter()
+                model = clone(estimator)
+                model.fit(X_tr, self.y[train_idx])
+                self.probas[name][valid_idx] = model.predict_proba(X_va)[:, 1]
+                self.fit_times[name] += time.perf_counter() - start
+
+            print(f"Fold {fold + 1}/{len(splits)} cached for {[n for n, _ in items]}")
+
+        return self
+
+    # --- 2. RECOMBINATION ---
+
+    def soft_vote(self, names=None, weights=None):
+        """
+        Soft-voting OOF probabilities (same average as VotingClassifier(voting='soft')).
+        """
+        names = names or self.model_names
+        stacked = np.column_stack([self.probas[n] for n in names])
+        return np.average(stacked, axis=1, weights=weights)
+
+    def stack(self, meta_estimator=None, names=None):
+        """
+        Stacking OOF probabilities: for each fold, the meta model is fitted on the
+        cached predictions of the other folds and applied to this fold.
+        """
+        if meta_estimator is None:
+            from sklearn.linear_model import LogisticRegression
+
+            meta_estimator = LogisticRegression()
+
+        names = names or self.model_names
+        Z = np.column_stack([self.probas[n] for n in names])
+        out = np.empty(len(self.y))
+        for fold in range(self.n_folds):
+            train_idx, valid_idx = self.fold_indices(fold)
+            meta = clone(meta_estimator).fit(Z[train_idx], self.y[train_idx])
+            out[valid_idx] = meta.predict_proba(Z[valid_idx])[:, 1]
+        return out
+
+    def scores(self, probas=None, threshold=None):
+        """
+        Per-fold f1 / roc_auc / accuracy, shaped like cross_validate output
+        ({"test_f1": array, ...}).
+
+        Args:
+            probas: OOF probabilities to score (default: soft vote of all models).
+            threshold: Decision threshold. None reproduces VotingClassifier.predict
+                       (positive class if proba > 0.5).
+        """
+        if probas is None:
+            probas = self.soft_vote()
+        if threshold is None:
+            y_pred = (probas > 0.5).astype(int)
+        else:
+            y_pred = (probas >= threshold).astype(int)
+
+        results = {"test_f1": [], "test_roc_auc": [], "test_accuracy": []}
+        for fold in range(self.n_folds):
+            mask = self.fold_ids == fold
+            results["test_f1"].append(f1_score(self.y[mask], y_pred[mask]))
+            results["test_roc_auc"].append(roc_auc_score(self.y[mask], probas[mask]))
+            results["test_accuracy"].append(accuracy_score(self.y[mask], y_pred[mask]))
+        return {k: np.array(v) for k, v in results.items()}
+
+    def summary(self):
+        """One row per base model (and the soft vote) with its mean CV scores."""
+        rows = []
+        for name in self.model_names + ["soft_vote"]:
+            probas = self.soft_vote() if name == "soft_vote" else self.probas[name]
+            s = self.scores(probas)
+            rows.append(
+                {
+                    "Model": name,
+                    "F1 Score (Mean)": s["test_f1"].mean(),
+                    "ROC-AUC (Mean)": s["test_roc_auc"].mean(),
+                    "Accuracy (Mean)": s["test_accuracy"].mean(),
+                    "Fit Time (s)": self.fit_times.get(
+                        name, sum(self.fit_times.values())
+                    ),
+                }
+            )
+        return pd.DataFrame(rows).sort_values(by="ROC-AUC (Mean)", ascending=False)
+
+    # --- 3. PERSISTENCE ---
+
+    def save(self, path):
+        """Saves the cache to a joblib file."""
+        joblib.dump(
+            {
+                "y": self.y,
+                "fold_ids": self.fold_ids,
+                "probas": self.probas,
+                "fit_times": self.fit_times,
+            },
+            path,
+        )
+        print(f"-> Saved OOF predictions to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Loads a cache saved with save()."""
+        data = joblib.load(path)
+        cache = cls(data["y"], data["fold_ids"])
+        cache.probas = data["probas"]
+        cache.fit_times = data["fit_times"]
+        return cache
+
+
+def _take(X, idx):
+    """Row selection for both DataFrames and arrays."""
+    if hasattr(X, "iloc"):
+        return X.iloc[idx]
+    return X[idx]
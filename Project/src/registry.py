@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import sqlite3
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from .utils import BASE_REPORT_DIR, VARIABLES_FILE, NumpyEncoder
+
+REGISTRY_DB = BASE_REPORT_DIR / "../registry.db"
+
+COUNTER_NAME = "experience_number"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS experiments (
+    exp_id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    exp_id INTEGER NOT NULL,
+    report TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value_num REAL,
+    value_text TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_metrics_key ON metrics (key, exp_id);
+"""
+
+
+def _flatten(content, prefix=""):
+    """{'a': {'b': 1}} -> {'a.b': 1}. Lists and other leaves are kept as is."""
+    flat = {}
+    for key, value in content.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix=f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _split_value(value):
+    """Returns (value_num, value_text) for storage."""
+    if isinstance(value, (bool, np.bool_)):
+        return float(value), None
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value), None
+    if isinstance(value, str):
+        # Numbers saved as strings (e.g. kaggle_results) stay queryable
+        try:
+            return float(value), None
+        except ValueError:
+            return None, value
+    return None, json.dumps(value, cls=NumpyEncoder)
+
+
+class ExperimentRegistry:
+    """
+    Experiment counter + append-only metric store in a local SQLite file.
+
+    - ID allocation is atomic (BEGIN IMMEDIATE), so parallel jobs never share a number.
+    - Reports are appended as (exp_id, report, key, value) rows: nothing is rewritten.
+    - query() answers cross-experiment questions without opening the JSON reports.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = pathlib.Path(db_path or REGISTRY_DB).resolve()
+        self._initialized = False
+
+    def _connect(self):
+        # Created on first use only (no filesystem writes at import time)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _legacy_start_id(self):
+        """First ID when the registry is created: continues variables.json / existing folders."""
+        start = 1
+        if VARIABLES_FILE.exists():
+            try:
+                with open(VARIABLES_FILE, "r") as f:
+                    start = json.load(f).get(COUNTER_NAME, 1)
+            except (json.JSONDecodeError, IOError):
+                pass
+        for folder in BASE_REPORT_DIR.glob("experiment_*"):
+            suffix = folder.name.split("_")[-1]
+            if suffix.isdigit():
+                start = max(start, int(suffix) + 1)
+        return start
+
+    def _read_counter(self, conn):
+        row = conn.execute(
+            "SELECT value FROM counters WHERE name = ?", (COUNTER_NAME,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        start = self._legacy_start_id()
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?)", (COUNTER_NAME, start)
+        )
+        return start
+
+    def _write_counter(self, conn, value):
+        conn.execute(
+            "UPDATE counters SET value = ? WHERE name = ?", (value, COUNTER_NAME)
+        )
+        # Mirror for humans / old notebooks (written inside the lock, atomically)
+        tmp_path = VARIABLES_FILE.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({COUNTER_NAME: value}, f, indent=4)
+        os.replace(tmp_path, VARIABLES_FILE)
+
+    def current_id(self):
+        """ID of the experiment in progress (the one save_report writes to)."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            value = self._read_counter(conn)
+            conn.execute("COMMIT")
+            return value
+        finally:
+            conn.close()
+
+    def _next_free_id(self, conn):
+        """First ID above both the shared counter and every recorded experiment."""
+        (max_recorded,) = conn.execute("SELECT MAX(exp_id) FROM experiments").fetchone()
+        return max(self._read_counter(conn), max_recorded or 0) + 1
+
+    def increment(self):
+        """
+        Atomically moves the counter to the next experiment. Returns the new ID.
+        IDs already reserved by allocate_id are skipped.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            value = self._next_free_id(conn)
+            self._write_counter(conn, value)
+            conn.execute("COMMIT")
+            return value
+        finally:
+            conn.close()
+
+    def allocate_id(self):
+        """
+        Atomically reserves a fresh ID for a job running in parallel with others.
+
+        The ID is taken above the shared counter and every recorded experiment,
+        and recorded in the experiments table only: the counter does not move,
+        so current_id() (the notebook's experiment in progress) never points to
+        a reserved folder, and increment() skips the reserved IDs.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            value = self._next_free_id(conn)
+            conn.execute(
+                "INSERT INTO experiments (exp_id, created_at) VALUES (?, ?)",
+                (value, time.strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            conn.execute("COMMIT")
+            return value
+        finally:
+            conn.close()
+
+    def log_report(self, exp_id, report_name, content):
+        """Appends every (flattened) field of a report as metric rows."""
+        if not isinstance(content, dict):
+            content = {"value": content}
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        rows = [
+            (exp_id, report_name, key, *_split_value(value), now)
+            for key, value in _flatten(content).items()
+        ]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR IGNORE INTO experiments (exp_id, created_at) VALUES (?, ?)",
+                (exp_id, now),
+            )
+            conn.executemany(
+                "INSERT INTO metrics (exp_id, report, key, value_num, value_text, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def query(self, keys=None, report=None):
+        """
+        Returns a DataFrame with one row per experiment and one column per key
+        (latest value if a key was logged several times).
+
+        Example: registry.query(["kaggle_results", "model_performance_cv.roc_auc_mean"])
+        """
+        sql = "SELECT exp_id, key, value_num, value_text FROM metrics"
+        clauses, params = [], []
+        if keys:
+            clauses.append(f"key IN ({', '.join('?' * len(keys))})")
+            params.extend(keys)
+        if report:
+            clauses.append("report = ?")
+            params.append(report)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY rowid"
+
+        conn = self._connect()
+        try:
+            rows = pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+
+        if rows.empty:
+            return pd.DataFrame()
+
+        rows["value"] = rows["value_num"].astype(object)
+        text_mask = rows["value_num"].isna()
+        rows.loc[text_mask, "value"] = rows.loc[text_mask, "value_text"]
+        table = rows.groupby(["exp_id", "key"])["value"].last().unstack()
+        if keys:
+            table = table[[k for k in keys if k in table.columns]]
+        # Columns that only hold numbers come back as floats
+        for col in table.columns:
+            numeric = pd.to_numeric(table[col], errors="coerce")
+            if numeric.notna().sum() == table[col].notna().sum():
+                table[col] = numeric
+        return table
+
+    def import_reports(self, base_dir=None):
+        """
+        Back-fills the metric store from existing experiment_XXX/*.json reports.
+        Reports already in the registry are skipped.
+        """
+        base_dir = pathlib.Path(base_dir or BASE_REPORT_DIR)
+        conn = self._connect()
+        try:
+            known = set(conn.execute("SELECT DISTINCT exp_id, report FROM metrics"))
+        finally:
+            conn.close()
+
+        n_reports = 0
+        for path in sorted(base_dir.glob("experiment_*/*.json")):
+            suffix = path.parent.name.split("_")[-1]
+            if not suffix.isdigit() or (int(suffix), path.stem) in known:
+                continue
+            with open(path, "r") as f:
+                content = json.load(f)
+            self.log_report(int(suffix), path.stem, content)
+            n_reports += 1
+        print(f"-> Imported {n_reports} reports into {self.db_path}")
+        return n_reports
+
+
+_default_registry = None
+
+
+def get_registry():
+    """Shared registry instance for the default database."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = ExperimentRegistry()
+    return _default_registry
+
+
+def check_allocation():
+    """
+    Reserves two IDs in a throwaway registry and checks that neither is the
+    experiment in progress and that the shared counter did not move.
+
+    Run: python -m src.registry
+    """
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ExperimentRegistry(pathlib.Path(tmp) / "registry.db")
+        current = registry.current_id()
+        first, second = registry.allocate_id(), registry.allocate_id()
+        assert first != registry.current_id(), "allocate_id handed out current_id"
+        assert registry.current_id() == current, "allocate_id moved the counter"
+        assert len({current, first, second}) == 3, "allocate_id reused an ID"
+    print(f"✅ Reserved #{first} and #{second} while #{current} stays in progress")
+
+
+if __name__ == "__main__":
+    check_allocation()
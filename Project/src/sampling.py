@@ -0,0 +1,53 @@
+"""
+Counter-based random numbers keyed by (seed, userId).
+
+training_snapshots used np.random.seed(42) and drew the random cutoffs of
+each user in iteration order: adding, removing or reordering users changed
+the draws of every following user, and shards could not be sampled apart.
+
+Here each random number is a pure function of (seed, userId, counter):
+
+    key   = mix(hash(userId) ^ mix(seed))
+    value = mix(key + (counter + 1) * GOLDEN)
+
+with mix the SplitMix64 finaliser. The draws are computed for all users at
+once with uint64 array arithmetic, and a user gets the same values whichever
+subset, shard or order it is sampled in. userIds are hashed as strings, so
+10 and "10" share their draws.
+"""
+
+import numpy as np
+import pandas as pd
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(x):
+    """SplitMix64 finaliser (bijective avalanche of uint64 values)."""
+    x = np.asarray(x, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def user_keys(user_ids, seed=42):
+    """Per-user RNG key: stable hash of the userId (as string) mixed with the seed."""
+    hashes = pd.util.hash_pandas_object(
+        pd.Series(user_ids).astype(str), index=False
+    ).to_numpy()
+    return _mix(hashes ^ _mix(np.uint64(seed)))
+
+
+def uniform(keys, counter):
+    """Uniform floats in [0, 1): draw number 'counter' of each key."""
+    with np.errstate(over="ignore"):
+        bits = _mix(keys + np.uint64(counter + 1) * GOLDEN)
+    return (bits >> np.uint64(11)) * 2.0**-53
+
+
+def integers(keys, counter, low, high):
+    """Integers in [low, high) (low / high scalars or arrays, like randint)."""
+    low = np.asarray(low, dtype=np.int64)
+    span = np.asarray(high, dtype=np.int64) - low
+    return low + np.floor(uniform(keys, counter) * span).astype(np.int64)
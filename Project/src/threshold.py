@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+METRICS = [
+    "f1",
+    "fbeta",
+    "precision",
+    "recall",
+    "accuracy",
+    "balanced_accuracy",
+    "mcc",
+    "youden",
+]
+
+
+def _sorted_counts(y_true, y_scores, weights=None):
+    """
+    Sorts the scores once (descending) and returns the distinct cutoffs with the
+    cumulative true/false positive counts when predicting 'score >= cutoff'.
+
+    weights: Optional (n_samples,) or (n_boot, n_samples) sample weights.
+             A 2D array computes the counts of every bootstrap replicate at once.
+    """
+    y_true = np.asarray(y_true).astype(np.int8)
+    y_scores = np.asarray(y_scores, dtype=float)
+
+    order = np.argsort(-y_scores, kind="mergesort")
+    scores = y_scores[order]
+    y_sorted = y_true[order]
+
+    # Last position of each run of equal scores = one distinct cutoff
+    last_of_run = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    thresholds = scores[last_of_run]
+
+    if weights is None:
+        tp = np.cumsum(y_sorted)[last_of_run]
+        fp = (last_of_run + 1) - tp
+    else:
+        w = np.asarray(weights)[..., order]
+        tp = np.cumsum(w * y_sorted, axis=-1)[..., last_of_run]
+        fp = np.cumsum(w * (1 - y_sorted), axis=-1)[..., last_of_run]
+
+    return thresholds, tp, fp
+
+
+def _safe_div(num, den):
+    """num / den with 0 where den == 0 (sklearn's zero_division=0 behaviour)."""
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    out = np.zeros(np.broadcast(num, den).shape)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+
+def _metrics_from_counts(tp, fp, pos, neg, beta=2.0):
+    """Computes every threshold metric from the confusion counts (vectorized)."""
+    fn = pos - tp
+    tn = neg - fp
+
+    precision = _safe_div(tp, tp + fp)
+    recall = _safe_div(tp, pos)
+    specificity = _safe_div(tn, neg)
+    b2 = beta**2
+
+    return {
+        "tp": tp,
+        "fp": fp,
+        "fn": fn,
+        "tn": tn,
+        "precision": precision,
+        "recall": recall,
+        # Same formulas as sklearn (f1 = 2tp / (2tp + fp + fn))
+        "f1": _safe_div(2 * tp, 2 * tp + fp + fn),
+        "fbeta": _safe_div((1 + b2) * tp, (1 + b2) * tp + b2 * fn + fp),
+        "accuracy": _safe_div(tp + tn, pos + neg),
+        "balanced_accuracy": (recall + specificity) / 2,
+        "mcc": _safe_div(
+            tp * tn - fp * fn,
+            np.sqrt((tp + fp) * (tp + fn) * (tn + fp) * (tn + fn)),
+        ),
+        "youden": recall + specificity - 1,
+    }
+
+
+def threshold_curve(y_true, y_scores, beta=2.0):
+    """
+    Evaluates every distinct decision threshold in one cumulative pass.
+
+    Predictions are 'y_scores >= threshold', as in the notebook's sweep.
+    Returns a DataFrame (one row per distinct score, increasing thresholds) with
+    the confusion counts and all metrics listed in METRICS.
+    """
+    thresholds, tp, fp = _sorted_counts(y_true, y_scores)
+    pos = float(np.sum(np.asarray(y_true) == 1))
+    neg = len(np.asarray(y_true)) - pos
+
+    curve = pd.DataFrame(
+        {"threshold": thresholds, **_metrics_from_counts(tp, fp, pos, neg, beta)}
+    )
+    return curve.iloc[::-1].reset_index(drop=True)
+
+
+def find_optimal_threshold(y_true, y_scores, metric="f1", beta=2.0):
+    """
+    Returns (threshold, best_score) maximizing the metric over ALL distinct cutoffs.
+
+    Exact replacement of the 0.01 grid loop with sklearn's f1_score.
+    On ties, the lowest threshold wins (same as np.argmax over an increasing grid).
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Options: {METRICS}")
+
+    curve = threshold_curve(y_true, y_scores, beta=beta)
+    best_idx = int(np.argmax(curve[metric].values))
+    return float(curve["threshold"].iloc[best_idx]), float(curve[metric].iloc[best_idx])
+
+
+def bootstrap_threshold_bands(
+    y_true,
+    y_scores,
+    metric="f1",
+    n_boot=200,
+    alpha=0.05,
+    beta=2.0,
+    batch_size=50,
+    random_state=42,
+):
+    """
+    Bootstrap confidence bands for a threshold metric, computed in a vectorized way.
+
+    Each replicate is a multinomial resampling expressed as sample weights, so all
+    replicates of a batch share the single sort and go through one cumsum.
+
+    Returns:
+        bands: DataFrame (threshold, metric, lower, upper) over the distinct cutoffs.
+        optimum: Dict with the bootstrap distribution summary of the optimal
+                 threshold and of the best score.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Options: {METRICS}")
+
+    y_true = np.asarray(y_true)
+    n = len(y_true)
+    rng = np.random.default_rng(random_state)
+    thresholds, tp, fp = _sorted_counts(y_true, y_scores)
+    point = _metrics_from_counts(
+        tp, fp, float(y_true.sum()), n - float(y_true.sum()), beta
+    )[metric]
+
+    curves = []
+    for start in range(0, n_boot, batch_size):
+        size = min(batch_size, n_boot - start)
+        # (size, n) resampling counts: weight k = sample drawn k times
+        weights = rng.multinomial(n, np.full(n, 1.0 / n), size=size).astype(np.float32)
+        _, tp_b, fp_b = _sorted_counts(y_true, y_scores, weights=weights)
+        pos_b = (weights * y_true).sum(axis=1, keepdims=True)
+        neg_b = n - pos_b
+        curves.append(_metrics_from_counts(tp_b, fp_b, pos_b, neg_b, beta)[metric])
+    curves = np.vstack(curves)
+
+    lower, upper = np.quantile(curves, [alpha / 2, 1 - alpha / 2], axis=0)
+    bands = (
+        pd.DataFrame(
+            {"threshold": thresholds, metric: point, "lower": lower, "upper": upper}
+        )
+        .iloc[::-1]
+        .reset_index(drop=True)
+    )
+
+    # Optimal threshold of each replicate (lowest threshold on ties)
+    best_idx = (curves.shape[1] - 1) - np.argmax(curves[:, ::-1], axis=1)
+    best_thresholds = thresholds[best_idx]
+    best_scores = curves[np.arange(len(curves)), best_idx]
+    optimum = {
+        "threshold_median": float(np.median(best_thresholds)),
+        "threshold_lower": float(np.quantile(best_thresholds, alpha / 2)),
+        "threshold_upper": float(np.quantile(best_thresholds, 1 - alpha / 2)),
+        f"{metric}_median": float(np.median(best_scores)),
+        f"{metric}_lower": float(np.quantile(best_scores, alpha / 2)),
+        f"{metric}_upper": float(np.quantile(best_scores, 1 - alpha / 2)),
+    }
+    return bands, optimum
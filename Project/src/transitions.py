@@ -0,0 +1,138 @@
+"""
+Sparse page-to-page transition counts per user (or per snapshot).
+
+The page sequence of a user (NextSong -> Thumbs Down -> Help -> ...) is only
+seen through fixed flags elsewhere. Here every consecutive pair of pages in a
+user's time-ordered events is counted, for all users at once:
+
+- events are sorted once by (user, ts); the previous / next page codes are the
+  same code array shifted by one, a pair is kept when both events belong to
+  the same user,
+- each (row, cutoff) takes the prefix of its user's transitions up to the
+  cutoff (searchsorted on a (user, time rank) key), without a merge,
+- the counts go straight into a scipy CSR matrix (n_rows x n_pages**2).
+
+aggregate_user_features(..., transitions=True) attaches them as sparse pandas
+columns; sparse_design_matrix turns such a frame into a scipy matrix for the
+models (XGBoost, LightGBM and LogisticRegression accept CSR input).
+"""
+
+import numpy as np
+import pandas as pd
+
+TRANSITION_PREFIX = "transition: "
+
+
+def transition_name(from_page, to_page):
+    return f"{TRANSITION_PREFIX}{from_page} -> {to_page}"
+
+
+def _codes(values, categories):
+    """Position of each value in 'categories' (-1 if absent), one lookup per distinct value."""
+    codes, uniques = pd.factorize(values)
+    lookup = np.append(categories.get_indexer(uniques), -1)
+    return lookup[codes]
+
+
+def page_transition_matrix(df, index, pages=None):
+    """
+    Counts the page transitions of each row of a feature index.
+
+    Args:
+        df: Event log with 'userId', 'ts' and 'page'.
+        index: Feature index: userId, or (userId, cutoff_ts) for snapshots
+               (only the events at or before the cutoff are counted).
+        pages: Page vocabulary (fixed columns across train / test). Defaults to
+               the sorted pages of df. Transitions from / to other pages are
+               dropped.
+
+    Returns (matrix, columns): CSR matrix (len(index) x len(pages)**2) and the
+    column names (transition_name of each (from, to) pair).
+    """
+    from scipy import sparse
+
+    events = df.loc[df["userId"].notna() & df["ts"].notna(), ["userId", "ts", "page"]]
+    if pages is None:
+        pages = np.sort(events["page"].dropna().unique())
+    pages = pd.Index(pages)
+    n_pages = len(pages)
+
+    # 1. Events sorted by (user, ts): stable, so ties keep the log order
+    if isinstance(index, pd.MultiIndex):
+        row_users = index.get_level_values("userId")
+        row_cutoffs = index.get_level_values("cutoff_ts")
+    else:
+        row_users, row_cutoffs = index, None
+    users = pd.Index(row_users.unique())
+    user = _codes(events["userId"], users)
+    ts = events["ts"].to_numpy()
+    page = _codes(events["page"], pages)
+    order = np.lexsort((ts, user))
+    order = order[user[order] >= 0]
+    user, ts, page = user[order], ts[order], page[order]
+
+    # 2. Shifted code arrays: pair (page[i], page[i + 1]) of the same user
+    valid = (user[1:] == user[:-1]) & (page[:-1] >= 0) & (page[1:] >= 0)
+    tr_user = user[1:][valid]
+    tr_ts = ts[1:][valid]
+    tr_col = (page[:-1] * n_pages + page[1:])[valid]
+
+    # 3. Prefix of each row's transitions: searchsorted on (user, time rank)
+    row_user = users.get_indexer(row_users)
+    starts = np.searchsorted(tr_user, row_user, side="left")
+    if row_cutoffs is None:
+        ends = np.searchsorted(tr_user, row_user, side="right")
+    else:
+        times, tr_rank = np.unique(tr_ts, return_inverse=True)
+        key = tr_user.astype(np.int64) * (len(times) + 1) + tr_rank
+        cutoff_rank = np.searchsorted(times, row_cutoffs.to_numpy(), side="right") - 1
+        ends = np.searchsorted(
+            key, row_user.astype(np.int64) * (len(times) + 1) + cutoff_rank, "right"
+        )
+    lengths = np.maximum(ends - starts, 0)
+
+    # 4. (row, column) of every counted transition -> CSR (duplicates summed)
+    total = int(lengths.sum())
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    positions = np.arange(total) + offsets
+    rows = np.repeat(np.arange(len(index)), lengths)
+    matrix = sparse.csr_matrix(
+        (np.ones(total, dtype=np.int64), (rows, tr_col[positions])),
+        shape=(len(index), n_pages * n_pages),
+    )
+    matrix.sum_duplicates()
+    columns = [transition_name(a, b) for a in pages for b in pages]
+    return matrix, columns
+
+
+def attach_transitions(features_df, df, pages=None):
+    """
+    Adds the transition counts of each row of features_df as sparse columns
+    (pandas SparseDtype, fill value 0: nothing is densified).
+    """
+    matrix, columns = page_transition_matrix(df, features_df.index, pages)
+    transitions = pd.DataFrame.sparse.from_spmatrix(
+        matrix, index=features_df.index, columns=columns
+    )
+    return pd.concat([features_df, transitions], axis=1)
+
+
+def sparse_design_matrix(features_df, preprocessor=None):
+    """
+    CSR model input from a frame with sparse transition columns.
+
+    The dense columns go through 'preprocessor' (fitted, e.g.
+    models/preprocessor.joblib) if given, else are used as they are (numeric).
+    """
+    from scipy import sparse
+
+    is_sparse = [isinstance(dtype, pd.SparseDtype) for dtype in features_df.dtypes]
+    sparse_cols = features_df.columns[is_sparse]
+    dense = features_df.drop(columns=sparse_cols)
+    dense = preprocessor.transform(dense) if preprocessor is not None else dense
+    if not sparse.issparse(dense):
+        dense = sparse.csr_matrix(np.asarray(dense, dtype=float))
+    if len(sparse_cols) == 0:
+        return dense
+    counts = features_df[sparse_cols].sparse.to_coo().tocsr()
+    return sparse.hstack([dense, counts], format="csr")
@@ -0,0 +1,371 @@
+import os
+import time
+import pathlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import GroupKFold, StratifiedKFold
+
+from .utils import PROJECT_ROOT, allocate_experiment_id, save_report
+
+RANDOM_SEED = 42
+
+# Optuna storage and preprocessed folds live next to the experiment reports
+TUNING_DIR = PROJECT_ROOT / "experiment_reports/tuning/"
+FOLD_CACHE_DIR = TUNING_DIR / "fold_cache"
+
+ALL_MODELS = ["xgb", "lgbm", "cat", "rf", "bag_lr"]
+
+
+# --- 1. SEARCH SPACES (Same ranges as the Modeling notebook) ---
+
+
+def _suggest_xgb(trial):
+    return {
+        "n_estimators": trial.suggest_int("n_estimators", 100, 1000),
+        "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3),
+        "max_depth": trial.suggest_int("max_depth", 3, 10),
+        "subsample": trial.suggest_float("subsample", 0.5, 1.0),
+        "colsample_bytree": trial.suggest_float("colsample_bytree", 0.5, 1.0),
+        "gamma": trial.suggest_float("gamma", 0, 5),
+        "min_child_weight": trial.suggest_int("min_child_weight", 1, 10),
+    }
+
+
+def _suggest_lgbm(trial):
+    return {
+        "n_estimators": trial.suggest_int("n_estimators", 100, 1000),
+        "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3),
+        "num_leaves": trial.suggest_int("num_leaves", 20, 150),
+        "max_depth": trial.suggest_int("max_depth", 3, 12),
+        "subsample": trial.suggest_float("subsample", 0.5, 1.0),
+        "colsample_bytree": trial.suggest_float("colsample_bytree", 0.5, 1.0),
+        "min_child_samples": trial.suggest_int("min_child_samples", 5, 100),
+    }
+
+
+def _suggest_cat(trial):
+    return {
+        "iterations": trial.suggest_int("iterations", 100, 1000),
+        "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3),
+        "depth": trial.suggest_int("depth", 4, 10),
+        "l2_leaf_reg": trial.suggest_float("l2_leaf_reg", 1, 10),
+        "random_strength": trial.suggest_float("random_strength", 0, 10),
+        "bagging_temperature": trial.suggest_float("bagging_temperature", 0, 1),
+    }
+
+
+def _suggest_rf(trial):
+    return {
+        "n_estimators": trial.suggest_int("n_estimators", 100, 500),
+        "max_depth": trial.suggest_int("max_depth", 5, 20),
+        "min_samples_split": trial.suggest_int("min_samples_split", 2, 20),
+        "min_samples_leaf": trial.suggest_int("min_samples_leaf", 1, 10),
+        "max_features": trial.suggest_categorical("max_features", ["sqrt", "log2"]),
+    }
+
+
+def _suggest_bag_lr(trial):
+    return {
+        "C": trial.suggest_float("C", 0.01, 10.0, log=True),
+        "n_estimators": trial.suggest_int("n_estimators", 10, 100),
+        "max_samples": trial.suggest_float("max_samples", 0.5, 1.0),
+        "max_features": trial.suggest_float("max_features", 0.5, 1.0),
+    }
+
+
+SEARCH_SPACES = {
+    "xgb": _suggest_xgb,
+    "lgbm": _suggest_lgbm,
+    "cat": _suggest_cat,
+    "rf": _suggest_rf,
+    "bag_lr": _suggest_bag_lr,
+}
+
+
+def build_model(name, params=None, n_jobs=-1):
+    """
+    Instantiates an ensemble member from (tuned) parameters.
+    Fixed parameters (seed, threads, verbosity) are added the same way as in the notebook.
+    Model libraries are imported here so only the needed one gets loaded.
+    """
+    params = dict(params or {})
+
+    if name == "xgb":
+        from xgboost import XGBClassifier
+
+        params.update(eval_metric="logloss", random_state=RANDOM_SEED, n_jobs=n_jobs)
+        return XGBClassifier(**params)
+
+    if name == "lgbm":
+        from lightgbm import LGBMClassifier
+
+        params.update(random_state=RANDOM_SEED, n_jobs=n_jobs, verbose=-1)
+        return LGBMClassifier(**params)
+
+    if name == "cat":
+        from catboost import CatBoostClassifier
+
+        params.update(verbose=0, random_state=RANDOM_SEED, thread_count=n_jobs)
+        return CatBoostClassifier(**params)
+
+    if name == "rf":
+        from sklearn.ensemble import RandomForestClassifier
+
+        params.update(random_state=RANDOM_SEED, n_jobs=n_jobs)
+        return RandomForestClassifier(**params)
+
+    if name == "bag_lr":
+        from sklearn.ensemble import BaggingClassifier
+        from sklearn.linear_model import LogisticRegression
+
+        # C belongs to the base estimator, the rest to the Bagging wrapper
+        C = params.pop("C", 0.1)
+        base_estimator = LogisticRegression(
+            max_iter=1000, C=C, solver="liblinear", random_state=RANDOM_SEED
+        )
+        params.update(
+            estimator=base_estimator,
+            bootstrap=True,
+            bootstrap_features=False,
+            random_state=RANDOM_SEED,
+            n_jobs=n_jobs,
+        )
+        return BaggingClassifier(**params)
+
+    raise ValueError(f"Unknown model '{name}'. Options: {ALL_MODELS}")
+
+
+# --- 2. FOLD CACHE (Preprocess once, reuse in every trial) ---
+
+
+def build_fold_cache(X, y, preprocessor, cv=3, groups=None, cache_dir=None):
+    """
+    Splits the data once, fits a clone of the preprocessor on each training fold
+    and dumps the transformed matrices to disk.
+
+    The cache folder is keyed by a hash of the data, preprocessor and split,
+    so re-running with the same inputs reuses the existing files.
+    Returns the path of the cache folder.
+    """
+    cache_dir = pathlib.Path(cache_dir or FOLD_CACHE_DIR)
+    y = np.asarray(y)
+    key = joblib.hash((X, y, preprocessor, cv, groups))
+    target_dir = cache_dir / key
+
+    if (target_dir / "meta.joblib").exists():
+        print(f"♻️  Reusing cached folds: {target_dir}")
+        return target_dir
+
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    # Same split as cross_val_score(cv=3) on a classifier, or grouped by user
+    if groups is not None:
+        splitter = GroupKFold(n_splits=cv)
+    else:
+        splitter = StratifiedKFold(n_splits=cv)
+
+    n_folds = 0
+    for i, (train_idx, valid_idx) in enumerate(splitter.split(X, y, groups)):
+        fold_pre = clone(preprocessor)
+        X_tr = fold_pre.fit_transform(X.iloc[train_idx], y[train_idx])
+        X_va = fold_pre.transform(X.iloc[valid_idx])
+        joblib.dump(
+            (X_tr, y[train_idx], X_va, y[valid_idx]), target_dir / f"fold_{i}.joblib"
+        )
+        n_folds += 1
+
+    # Written last: its presence marks the cache as complete
+    joblib.dump({"n_folds": n_folds, "n_rows": len(y)}, target_dir / "meta.joblib")
+    print(f"💾 Cached {n_folds} preprocessed folds in {target_dir}")
+    return target_dir
+
+
+def load_fold_cache(cache_path):
+    """Loads the cached folds (dense arrays are memory-mapped, not copied)."""
+    cache_path = pathlib.Path(cache_path)
+    meta = joblib.load(cache_path / "meta.joblib")
+    return [
+        joblib.load(cache_path / f"fold_{i}.joblib", mmap_mode="r")
+        for i in range(meta["n_folds"])
+    ]
+
+
+# --- 3. OBJECTIVE & WORKERS ---
+
+
+def _objective(trial, name, folds, metric, model_threads):
+    """Cross-validates one trial fold by fold, pruning as soon as it looks bad."""
+    import optuna
+
+    params = SEARCH_SPACES[name](trial)
+    scorer = get_scorer(metric)
+    scores = []
+
+    for step, (X_tr, y_tr, X_va, y_va) in enumerate(folds):
+        model = build_model(name, params, n_jobs=model_threads)
+        model.fit(X_tr, y_tr)
+        scores.append(scorer(model, X_va, y_va))
+
+        # Report the running mean so the pruner compares trials at the same fold
+        trial.report(float(np.mean(scores)), step)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
+
+    return float(np.mean(scores))
+
+
+def _run_worker(
+    name, study_name, storage, cache_path, n_trials, metric, seed, model_threads
+):
+    """Worker process: attaches to the shared study and runs its share of trials."""
+    import optuna
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    folds = load_fold_cache(cache_path)
+
+    study = optuna.load_study(
+        study_name=study_name,
+        storage=storage,
+        sampler=optuna.samplers.TPESampler(seed=seed),
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5),
+    )
+    study.optimize(
+        lambda trial: _objective(trial, name, folds, metric, model_threads),
+        n_trials=n_trials,
+    )
+    return name
+
+
+def get_storage(db_path=None):
+    """Returns an Optuna RDB storage backed by a local SQLite file."""
+    import optuna
+
+    db_path = pathlib.Path(db_path or TUNING_DIR / "optuna.db")
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    # Generous lock timeout: several processes write trials to the same file
+    return optuna.storages.RDBStorage(
+        url=f"sqlite:///{db_path}",
+        engine_kwargs={"connect_args": {"timeout": 60}},
+    )
+
+
+def _split_trials(n_trials, n_parts):
+    """Splits n_trials as evenly as possible (e.g. 30 over 4 -> 8, 8, 7, 7)."""
+    base, extra = divmod(n_trials, n_parts)
+    return [base + (1 if i < extra else 0) for i in range(n_parts) if base or i < extra]
+
+
+def tune_models(
+    X,
+    y,
+    preprocessor,
+    models=None,
+    n_trials=30,
+    n_workers=None,
+    cv=3,
+    metric="f1",
+    groups=None,
+    study_prefix="churn",
+    db_path=None,
+    report_name="tuning_results",
+):
+    """
+    Tunes every requested ensemble member with Optuna.
+
+    - Folds are preprocessed once and shared with all trials (see build_fold_cache).
+    - Trials run in parallel worker processes that share a SQLite study storage,
+      so an interrupted run can be resumed by calling this again: each study is
+      topped up to n_trials finished (complete or pruned) trials.
+    - Bad trials are pruned after the first folds (MedianPruner).
+    - Best parameters are recorded with utils.save_report, under an experiment
+      ID of their own (utils.allocate_experiment_id).
+
+    Returns a dict {model_name: {"best_params", "best_value", ...}}.
+    """
+    import optuna
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    models = list(models or ALL_MODELS)
+    n_workers = n_workers or max(1, min(os.cpu_count() or 1, 8))
+    # Share the cores between workers to avoid nested parallelism oversubscription
+    model_threads = max(1, (os.cpu_count() or 1) // n_workers)
+
+    start = time.perf_counter()
+    cache_path = build_fold_cache(X, y, preprocessor, cv=cv, groups=groups)
+    storage = get_storage(db_path)
+
+    # 1. Create (or resume) one study per model, topping it up to n_trials
+    finished = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    study_names, remaining = {}, {}
+    for name in models:
+        study_names[name] = f"{study_prefix}_{name}_{metric}"
+        study = optuna.create_study(
+            study_name=study_names[name],
+            storage=storage,
+            direction="maximize",
+            load_if_exists=True,
+        )
+        done = len(study.get_trials(deepcopy=False, states=finished))
+        remaining[name] = max(0, n_trials - done)
+        if done:
+            print(f"♻️  Resuming {name}: {done} trials done, {remaining[name]} to go")
+
+    # 2. Submit every model's trials to the same pool
+    print(f"🚀 Tuning {models} with {n_workers} workers ({n_trials} trials each)...")
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx) as pool:
+        futures = []
+        for name in models:
+            for i, share in enumerate(_split_trials(remaining[name], n_workers)):
+                futures.append(
+                    pool.submit(
+                        _run_worker,
+                        name,
+                        study_names[name],
+                        storage.url,
+                        cache_path,
+                        share,
+                        metric,
+                        RANDOM_SEED + i,
+                        model_threads,
+                    )
+                )
+        for future in futures:
+            future.result()
+
+    # 3. Collect results
+    results = {}
+    report = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "metric": metric,
+        "trials": n_trials,
+        "n_workers": n_workers,
+        "wall_time_sec": None,
+    }
+    for name in models:
+        study = optuna.load_study(study_name=study_names[name], storage=storage)
+        states = [t.state for t in study.trials]
+        results[name] = {
+            "best_params": study.best_params,
+            "best_value": study.best_value,
+            "n_complete": states.count(optuna.trial.TrialState.COMPLETE),
+            "n_pruned": states.count(optuna.trial.TrialState.PRUNED),
+        }
+        print(
+            f"Best {name} {metric}: {study.best_value:.4f} "
+            f"({results[name]['n_pruned']} trials pruned)"
+        )
+        report[name] = study.best_params
+        report[f"{metric}_{name}_best_perf"] = study.best_value
+        report[f"{name}_pruned_trials"] = results[name]["n_pruned"]
+
+    report["wall_time_sec"] = time.perf_counter() - start
+    # Own experiment ID: parallel tuning jobs never share a report file
+    save_report(report_name, report, exp_id=allocate_experiment_id())
+
+    return results
@@ -0,0 +1,92 @@
+"""
+Shared per-user index: first / last event, churn time and registration.
+
+label_churn, training_snapshots (generate_training_data), aggregate_user_features
+and the visualization helpers each scanned the full log for
+'Cancellation Confirmation' events (and a min / max 'ts' groupby). The index is
+built in one groupby over the log and cached per DataFrame object, so the
+functions called on the same cleaned frame share a single scan.
+
+The cache holds a weak reference to the frame: it is dropped with the frame.
+It is keyed by object identity and row count, so call
+get_user_index(df, refresh=True) after editing 'ts' / 'page' in place.
+"""
+
+import weakref
+
+import pandas as pd
+
+CHURN_PAGE = "Cancellation Confirmation"
+
+INDEX_COLUMNS = ["first_ts", "last_ts", "churn_ts", "registration"]
+
+# id(df) -> (weak reference to df, number of rows, index)
+_CACHE = {}
+
+
+def build_user_index(df):
+    """
+    One row per userId (sorted): first_ts, last_ts, churn_ts (first
+    Cancellation Confirmation, NaT if none) and registration (if present).
+    """
+    aggs = {
+        "first_ts": ("ts", "min"),
+        "last_ts": ("ts", "max"),
+        "churn_ts": ("churn_ts", "min"),
+    }
+    if "registration" in df.columns:
+        aggs["registration"] = ("registration", "first")
+
+    # Churn time as a masked column: a single groupby instead of a filter + groupby
+    events = pd.DataFrame(
+        {
+            "userId": df["userId"],
+            "ts": df["ts"],
+            "churn_ts": df["ts"].where(df["page"] == CHURN_PAGE),
+        }
+    )
+    if "registration" in df.columns:
+        events["registration"] = df["registration"]
+    return events.groupby("userId").agg(**aggs)
+
+
+def _remember(df, index):
+    key = id(df)
+
+    def forget(ref):
+        if key in _CACHE and _CACHE[key][0] is ref:
+            del _CACHE[key]
+
+    _CACHE[key] = (weakref.ref(df, forget), len(df), index)
+
+
+def get_user_index(df, refresh=False):
+    """Cached build_user_index(df): built on the first call for this frame."""
+    entry = _CACHE.get(id(df))
+    if not refresh and entry is not None and entry[0]() is df and entry[1] == len(df):
+        return entry[2]
+    index = build_user_index(df)
+    _remember(df, index)
+    return index
+
+
+def share_user_index(source, derived):
+    """
+    Reuses the cached index of 'source' for 'derived' (same users, 'ts' and
+    'page', e.g. the output of label_churn). No-op if 'source' has none.
+    """
+    entry = _CACHE.get(id(source))
+    if entry is not None and entry[0]() is source and len(derived) == entry[1]:
+        _remember(derived, entry[2])
+    return derived
+
+
+def churner_users(df):
+    """userIds with a Cancellation Confirmation."""
+    index = get_user_index(df)
+    return index.index[index["churn_ts"].notna()].to_numpy()
+
+
+def churner_flags(df):
+    """1 if the user has a Cancellation Confirmation, 0 otherwise (per userId)."""
+    return get_user_index(df)["churn_ts"].notna().astype(int)
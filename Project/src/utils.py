@@ -67,8 +67,8 @@ PROJECT_ROOT = HERE.parent.parent
 BASE_REPORT_DIR = PROJECT_ROOT / "experiment_reports/experiments/"
 VARIABLES_FILE = BASE_REPORT_DIR / "../variables.json"
 
-# Ensure the report directory exists immediately
-BASE_REPORT_DIR.mkdir(parents=True, exist_ok=True)
+# NOTE: No directory is created at import time. Folders are created on first
+# write (save_report / the registry), so importing src.utils has no side effects.
 
 
 class NumpyEncoder(json.JSONEncoder):
@@ -90,33 +90,177 @@ class NumpyEncoder(json.JSONEncoder):
             return str(obj)
 
 
+# --- Side Files for Bulky Report Fields ---
+
+# Arrays with at least this many elements are written next to the JSON
+ARTIFACT_MIN_SIZE = 1000
+
+_JSON_SCALARS = (str, int, float, bool, type(None), np.generic)
+
+
+def _artifact_name(stem, key_path):
+    """report + key path -> safe file name stem (e.g. 'modeling_results__cv.scores')"""
+    key = ".".join(str(k) for k in key_path)
+    key = "".join(c if c.isalnum() or c in "._-" else "_" for c in key)
+    return f"{stem}__{key}"
+
+
+def _externalize(obj, target_dir, stem, compress, key_path=()):
+    """
+    Walks the report and moves bulky / non-JSON values to side files:
+    - large numeric ndarrays -> .npy (.npz if compress)
+    - large object ndarrays (e.g. column names) -> .joblib
+    - DataFrames / Series -> .parquet (zstd if compress, snappy otherwise)
+    - other objects (models, ...) -> .joblib
+    Small arrays and pd.Index values stay inline as JSON lists and scalar-like
+    objects (Timestamp, Timedelta, ...) as strings, as NumpyEncoder writes them.
+    Each is replaced by a small reference {"__artifact__": file, "format": ...}.
+    """
+    if isinstance(obj, dict):
+        return {
+            k: _externalize(v, target_dir, stem, compress, key_path + (k,))
+            for k, v in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [
+            _externalize(v, target_dir, stem, compress, key_path + (i,))
+            for i, v in enumerate(obj)
+        ]
+    if isinstance(obj, _JSON_SCALARS):
+        return obj
+    if pd.api.types.is_scalar(obj):
+        return str(obj)
+    if isinstance(obj, (np.ndarray, pd.Index)) and obj.size < ARTIFACT_MIN_SIZE:
+        return obj.tolist()
+
+    name = _artifact_name(stem, key_path)
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        if compress:
+            file_name = f"{name}.npz"
+            np.savez_compressed(target_dir / file_name, data=obj)
+        else:
+            file_name = f"{name}.npy"
+            np.save(target_dir / file_name, obj, allow_pickle=False)
+        ref = {"format": "npy", "shape": list(obj.shape), "dtype": str(obj.dtype)}
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        file_name = f"{name}.parquet"
+        is_series = isinstance(obj, pd.Series)
+        frame = (
+            obj.to_frame(name=obj.name if obj.name is not None else "value")
+            if is_series
+            else obj
+        )
+        # Parquet needs string column names
+        frame = frame.rename(columns=str)
+        frame.to_parquet(
+            target_dir / file_name, compression="zstd" if compress else "snappy"
+        )
+        ref = {"format": "parquet", "kind": "series" if is_series else "frame"}
+        if is_series:
+            # Original name (None included), restored by _rehydrate
+            name_is_json = isinstance(obj.name, _JSON_SCALARS)
+            ref["name"] = obj.name if name_is_json else str(obj.name)
+    else:
+        import joblib
+
+        file_name = f"{name}.joblib"
+        joblib.dump(obj, target_dir / file_name, compress=3 if compress else 0)
+        ref = {"format": "joblib", "type": type(obj).__name__}
+
+    return {"__artifact__": file_name, **ref}
+
+
+def _rehydrate(obj, target_dir, mmap=False):
+    """Inverse of _externalize: loads every referenced side file."""
+    if isinstance(obj, list):
+        return [_rehydrate(v, target_dir, mmap) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if "__artifact__" not in obj:
+        return {k: _rehydrate(v, target_dir, mmap) for k, v in obj.items()}
+
+    path = target_dir / obj["__artifact__"]
+    if obj["format"] == "npy":
+        if path.suffix == ".npz":
+            with np.load(path) as data:
+                return data["data"]
+        return np.load(path, mmap_mode="r" if mmap else None)
+    if obj["format"] == "parquet":
+        frame = pd.read_parquet(path)
+        if obj.get("kind") == "series":
+            return frame.iloc[:, 0].rename(obj.get("name", frame.columns[0]))
+        return frame
+
+    import joblib
+
+    return joblib.load(path)
+
+
+def load_report(report_name, exp_id=None, mmap=False):
+    """
+    Loads experiment_XXX/report_name.json and the side files it references,
+    so arrays / DataFrames / models come back exactly as they were saved.
+
+    exp_id: Defaults to the current experiment number.
+    mmap: Memory-map uncompressed .npy arrays instead of reading them.
+    """
+    if exp_id is None:
+        exp_id = _get_current_id()
+    if not report_name.endswith(".json"):
+        report_name += ".json"
+
+    target_dir = BASE_REPORT_DIR / f"experiment_{exp_id:03d}"
+    with open(target_dir / report_name, "r") as f:
+        content = json.load(f)
+    return _rehydrate(content, target_dir, mmap=mmap)
+
+
 def _get_current_id():
-    """Internal: Reads the current ID from variables.json"""
-    # If file doesn't exist, create it inside experiment_reports/
-    if not VARIABLES_FILE.exists():
-        with open(VARIABLES_FILE, "w") as f:
-            json.dump({"experience_number": 1}, f)
-        return 1
+    """Internal: Reads the current ID from the experiment registry (registry.db)"""
+    from .registry import get_registry
 
-    with open(VARIABLES_FILE, "r") as f:
-        data = json.load(f)
-        return data.get("experience_number", 1)
+    return get_registry().current_id()
 
 
 def _increment_id():
-    """Internal: Adds +1 to the ID in variables.json"""
-    current = _get_current_id()
-    with open(VARIABLES_FILE, "w") as f:
-        json.dump({"experience_number": current + 1}, f, indent=4)
-    print(f"🔄 Auto-Update: Next experiment will be #{current + 1}")
+    """Internal: Atomically adds +1 to the ID in the experiment registry"""
+    from .registry import get_registry
 
+    new_id = get_registry().increment()
+    print(f"🔄 Auto-Update: Next experiment will be #{new_id}")
 
-def save_report(report_name, content, is_last_report=False):
+
+def allocate_experiment_id():
+    """
+    Reserves a unique experiment ID for a job running in parallel with others.
+    Pass it to save_report(..., exp_id=...) so jobs never share a folder.
+    """
+    from .registry import get_registry
+
+    exp_id = get_registry().allocate_id()
+    print(f"🔒 Reserved experiment #{exp_id}")
+    return exp_id
+
+
+def save_report(
+    report_name, content, is_last_report=False, exp_id=None, compress=False
+):
     """
     Saves the JSON to experiment_reports/experiment_XXX/report_name.json
+    and appends its fields to the experiment registry (see registry.query).
+
+    Bulky fields (large arrays, DataFrames, models) are written to side files
+    next to the JSON and referenced from it; read everything back with load_report.
+
+    exp_id: Optional ID from allocate_experiment_id() (parallel jobs).
+            Defaults to the current shared experiment number.
+    compress: Compress the side files (npz / zstd parquet / joblib level 3).
     """
+    from .registry import get_registry
+
     # 1. Auto-fetch ID
-    exp_id = _get_current_id()
+    if exp_id is None:
+        exp_id = _get_current_id()
 
     # 2. Inject ID into your report dictionary automatically
     if isinstance(content, dict):
@@ -132,12 +276,20 @@ def save_report(report_name, content, is_last_report=False):
 
     file_path = target_dir / report_name
 
-    # 5. Save
-    with open(file_path, "w") as f:
+    # 5. Move bulky fields to side files, keep small metadata inline
+    content = _externalize(content, target_dir, report_name[: -len(".json")], compress)
+
+    # 6. Save (write to a temp file, then rename: readers never see a partial file)
+    tmp_path = file_path.with_name(f".{report_name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
         json.dump(content, f, indent=4, cls=NumpyEncoder)
+    os.replace(tmp_path, file_path)
+
+    # 7. Append to the registry
+    get_registry().log_report(exp_id, report_name[: -len(".json")], content)
 
     print(f"✅ Report saved: {file_path}")
 
-    # 6. Handle counter
+    # 8. Handle counter
     if is_last_report:
         _increment_id()
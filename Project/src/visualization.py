@@ -1,59 +1,215 @@
+import pathlib
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sb
 import matplotlib.dates as mdates
 import pandas as pd
 import numpy as np
-from sklearn.pipeline import Pipeline
 
+from .eda_summary import UNKNOWN, EDASummary
 
-def plot_churn_distribution(df):
+# --- Rendering Helpers (Headless / Batch Mode) ---
+
+
+def use_headless_backend():
+    """Switches matplotlib to the non-interactive Agg backend (batch jobs, no display)."""
+    matplotlib.use("Agg")
+
+
+def _show_or_save(name, save_dir=None, dpi=120):
+    """
+    Shows the current figure, or saves it to save_dir/name.png and closes it.
+    Closing matters in batch jobs: open figures are never garbage collected.
+    """
+    if save_dir is None:
+        plt.show()
+        return
+
+    save_dir = pathlib.Path(save_dir)
+    save_dir.mkdir(parents=True, exist_ok=True)
+    path = save_dir / f"{name}.png"
+    plt.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close()
+    print(f"-> Saved figure to {path}")
+
+
+def _map_unique(series, func):
+    """Applies func once per distinct value instead of once per event."""
+    uniques = series.dropna().unique()
+    return series.map(dict(zip(uniques, map(func, uniques))))
+
+
+def _downsample(df, max_points, random_state=42):
+    """Randomly keeps at most max_points rows (row order is preserved)."""
+    if max_points is None or len(df) <= max_points:
+        return df
+    return df.sample(n=max_points, random_state=random_state).sort_index()
+
+
+def _box_stats(data, value, by):
+    """
+    Pre-computes boxplot statistics (quartiles + 1.5 IQR whiskers) per group,
+    so only a few numbers per box are drawn instead of every observation.
+    Returns a DataFrame indexed by the 'by' columns, in matplotlib bxp format.
+    """
+    g = data.groupby(by)[value]
+    stats = g.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "med", "q3"]
+
+    iqr = stats["q3"] - stats["q1"]
+    bounds = pd.DataFrame(
+        {"lo": stats["q1"] - 1.5 * iqr, "hi": stats["q3"] + 1.5 * iqr}
+    )
+    # Whiskers = most extreme observations inside the 1.5 IQR fences
+    inside = data.join(bounds, on=by)
+    inside = inside[(inside[value] >= inside["lo"]) & (inside[value] <= inside["hi"])]
+    whiskers = inside.groupby(by)[value].agg(["min", "max"])
+    stats["whislo"] = whiskers["min"]
+    stats["whishi"] = whiskers["max"]
+    return stats
+
+
+def _sparse_box_stats(matrix, columns, groups):
+    """
+    Same statistics as _box_stats for every column of a sparse matrix, split
+    by 'groups' (one label per row). Only one column is densified at a time.
+    Returns a DataFrame indexed by (column, group).
+    """
+    matrix = matrix.tocsc()
+    rows, index = [], []
+    for group in np.unique(groups):
+        sub = matrix[groups == group]
+        for j, col in enumerate(columns):
+            stored = sub.data[sub.indptr[j] : sub.indptr[j + 1]]
+            values = np.concatenate([np.zeros(sub.shape[0] - len(stored)), stored])
+            q1, med, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+            iqr = q3 - q1
+            inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+            rows.append([q1, med, q3, inside.min(), inside.max()])
+            index.append((col, group))
+    return pd.DataFrame(
+        rows,
+        index=pd.MultiIndex.from_tuples(index),
+        columns=["q1", "med", "q3", "whislo", "whishi"],
+    ).sort_index()
+
+
+def _summary(data, categorical=(), numerical=()):
+    """EDASummary of an event DataFrame (returned as is if already summarised)."""
+    if isinstance(data, EDASummary):
+        return data
+    return EDASummary.from_frame(data, list(categorical), list(numerical))
+
+
+def _draw_grouped_boxes(ax, stats, x_order, hue_order=None):
+    """Draws pre-computed box statistics (see _box_stats), optionally split by hue."""
+    hue_order = hue_order if hue_order is not None else [None]
+    width = 0.8 / len(hue_order)
+    colors = sb.color_palette(n_colors=max(len(hue_order), len(x_order)))
+
+    for h, hue in enumerate(hue_order):
+        boxes, positions = [], []
+        for i, x in enumerate(x_order):
+            key = x if hue is None else (x, hue)
+            if key not in stats.index:
+                continue
+            row = stats.loc[key]
+            boxes.append({k: row[k] for k in ["q1", "med", "q3", "whislo", "whishi"]})
+            positions.append(i - 0.4 + width * (h + 0.5))
+
+        color = colors[h] if hue is not None else None
+        artists = ax.bxp(
+            boxes,
+            positions=positions,
+            widths=width * 0.9,
+            showfliers=False,
+            patch_artist=True,
+            manage_ticks=False,
+            medianprops={"color": "black"},
+        )
+        for i, patch in enumerate(artists["boxes"]):
+            patch.set_facecolor(color if color is not None else colors[i])
+        if hue is not None:
+            artists["boxes"][0].set_label(str(hue))
+
+    ax.set_xticks(range(len(x_order)))
+    ax.set_xticklabels([str(x) for x in x_order])
+
+
+def plot_churn_distribution(df, save_dir=None):
     """Plots the distribution of the churn target variable."""
+    # Count first, then draw the bars (no event-level data handed to seaborn)
+    counts = df["churn"].value_counts().sort_index()
+
     plt.figure(figsize=(6, 4))
-    sb.countplot(x="churn", data=df)
+    sb.barplot(x=counts.index.astype(str), y=counts.values)
     plt.title("Distribution of Churn")
-    plt.show()
+    plt.xlabel("churn")
+    plt.ylabel("count")
+    _show_or_save("churn_distribution", save_dir)
 
 
-def plot_avg_songs_per_session(df):
+def plot_avg_songs_per_session(df, save_dir=None):
     """Plots boxplot of average songs per session for churn vs non-churn events."""
-    songs_df = df[df["page"] == "NextSong"]
-    songs_per_session = (
-        songs_df.groupby(["userId", "sessionId"]).size().reset_index(name="songs_count")
-    )
-    user_churn_map = df[["userId", "churn"]].drop_duplicates()
-    songs_per_session = songs_per_session.merge(user_churn_map, on="userId")
+    songs_df = df.loc[df["page"] == "NextSong", ["userId", "sessionId"]]
+    songs_per_session = songs_df.groupby(["userId", "sessionId"]).size()
     avg_songs_user = (
-        songs_per_session.groupby(["userId", "churn"])["songs_count"]
-        .mean()
-        .reset_index()
+        songs_per_session.groupby(level="userId").mean().rename("songs_count")
     )
 
-    plt.figure(figsize=(8, 6))
-    sb.boxplot(x="churn", y="songs_count", data=avg_songs_user)
+    # A user can appear in both groups (events inside and outside the churn window)
+    user_churn_map = df[["userId", "churn"]].drop_duplicates()
+    avg_songs_user = user_churn_map.join(avg_songs_user, on="userId", how="inner")
+
+    stats = _box_stats(avg_songs_user, "songs_count", "churn")
+    fig, ax = plt.subplots(figsize=(8, 6))
+    _draw_grouped_boxes(ax, stats, list(stats.index))
+    ax.set_xlabel("churn")
     plt.title("Average Songs Played per Session (Churn vs Non-Churn)")
     plt.ylabel("Avg Songs per Session")
-    plt.show()
+    _show_or_save("avg_songs_per_session", save_dir)
 
 
-def plot_error_frequency(df):
+def plot_error_frequency(df, save_dir=None):
     """Plots boxplot of error frequency for churn vs non-churn users."""
-    errors_df = df[df["page"] == "Error"]
-    user_churn_map = df[["userId", "churn"]].drop_duplicates()
-    error_counts = errors_df.groupby("userId").size().reset_index(name="error_count")
-    error_counts = error_counts.merge(user_churn_map, on="userId", how="right").fillna(
-        0
+    error_counts = (
+        df.loc[df["page"] == "Error", "userId"].value_counts().rename("error_count")
     )
+    user_churn_map = df[["userId", "churn"]].drop_duplicates()
+    error_counts = user_churn_map.join(error_counts, on="userId").fillna(0)
 
-    plt.figure(figsize=(8, 6))
-    sb.boxplot(x="churn", y="error_count", data=error_counts)
+    stats = _box_stats(error_counts, "error_count", "churn")
+    fig, ax = plt.subplots(figsize=(8, 6))
+    _draw_grouped_boxes(ax, stats, list(stats.index))
+    ax.set_xlabel("churn")
+    ax.set_ylabel("error_count")
     plt.title("Frequency of Errors (Churn vs Non-Churn)")
-    plt.show()
+    _show_or_save("error_frequency", save_dir)
+
 
+def plot_user_journeys(df, user_ids, max_points=5000, save_dir=None):
+    """
+    Plots the user journey (page visits over time) for a list of user IDs.
+    The log is filtered once for all users, then split by user in a single groupby.
+    Users with more than max_points events are down-sampled (pre-churn points first).
+    """
+    journeys = df.loc[df["userId"].isin(user_ids), ["userId", "ts", "page", "churn"]]
+    journeys = dict(tuple(journeys.groupby("userId")))
 
-def plot_user_journeys(df, user_ids):
-    """Plots the user journey (page visits over time) for a list of user IDs."""
     for uid in user_ids:
-        user_data = df[df["userId"] == uid].sort_values("ts")
+        if uid not in journeys:
+            continue
+        user_data = journeys[uid].sort_values("ts")
+
+        # Keep every pre-churn point if possible, sample the normal activity
+        if max_points is not None and len(user_data) > max_points:
+            churn_rows = _downsample(
+                user_data[user_data["churn"] == 1], max_points // 2
+            )
+            normal_rows = _downsample(
+                user_data[user_data["churn"] == 0], max_points - len(churn_rows)
+            )
+            user_data = pd.concat([normal_rows, churn_rows]).sort_values("ts")
 
         fig, ax = plt.subplots(figsize=(12, 6))
 
@@ -87,23 +243,19 @@ def plot_user_journeys(df, user_ids):
         plt.legend(loc="upper left")
 
         plt.tight_layout()
-        plt.show()
+        _show_or_save(f"user_journey_{uid}", save_dir)
 
 
-def plot_categorical_churn_impact(df, columns):
+def plot_categorical_churn_impact(df, columns, save_dir=None):
     """
     Plots the churn rate for each category in the specified columns.
     Aggregates by USER first.
+
+    df: Event DataFrame or EDASummary (see eda_summary.py).
     """
     # Create user-level dataset
     # We take the last value for categorical columns
-    agg_dict = {"churn_ts": "max"}
-    for col in columns:
-        if col in df.columns:
-            agg_dict[col] = "last"
-
-    user_df = df.groupby("userId").agg(agg_dict)
-    user_df["is_churner"] = user_df["churn_ts"].notna().astype(int)
+    user_df = _summary(df, categorical=columns).users
 
     for col in columns:
         if col not in user_df.columns:
@@ -120,47 +272,44 @@ def plot_categorical_churn_impact(df, columns):
         plt.ylabel("Proportion of Users who Churned")
         plt.xticks(rotation=45)
         plt.tight_layout()
-        plt.show()
+        _show_or_save(f"churn_rate_by_{col}", save_dir)
 
 
-def plot_numerical_churn_impact(df, columns):
+def plot_numerical_churn_impact(df, columns, save_dir=None):
     """
     Plots boxplots for numerical columns split by churn status.
     Aggregates by USER first (mean).
-    """
-    agg_dict = {"churn_ts": "max"}
-    for col in columns:
-        if col in df.columns:
-            agg_dict[col] = "mean"
 
-    user_df = df.groupby("userId").agg(agg_dict)
-    user_df["is_churner"] = user_df["churn_ts"].notna().astype(int)
+    df: Event DataFrame or EDASummary (see eda_summary.py).
+    """
+    user_df = _summary(df, numerical=columns).users
 
     for col in columns:
         if col not in user_df.columns:
             continue
-        plt.figure(figsize=(8, 6))
-        sb.boxplot(x="is_churner", y=col, data=user_df, showfliers=False)
+        stats = _box_stats(user_df, col, "is_churner")
+        fig, ax = plt.subplots(figsize=(8, 6))
+        _draw_grouped_boxes(ax, stats, list(stats.index))
+        ax.set_xlabel("is_churner")
+        ax.set_ylabel(col)
         plt.title(f"Distribution of Average {col} per User")
-        plt.show()
+        _show_or_save(f"distribution_{col}", save_dir)
 
 
-def analyze_location(df):
+def analyze_location(df, save_dir=None):
     """
     Extracts state from location and plots churn rate by state.
     Aggregates by USER first.
     """
-    if "location" not in df.columns:
+    # Reduce to one row per user first, then parse each distinct location once
+    user_df = _summary(df, categorical=["location"]).users
+    if "location" not in user_df.columns:
         return
-
-    df = df.copy()
-    df["state"] = df["location"].apply(
-        lambda x: x.split(",")[-1].strip() if x and "," in x else "Unknown"
+    user_df["state"] = _map_unique(
+        user_df["location"],
+        lambda x: x.split(",")[-1].strip() if x and "," in x else "Unknown",
     )
 
-    user_df = df.groupby("userId").agg({"state": "last", "churn_ts": "max"})
-    user_df["is_churner"] = user_df["churn_ts"].notna().astype(int)
-
     churn_rate = (
         user_df.groupby("state")["is_churner"].mean().sort_values(ascending=False)
     )
@@ -171,19 +320,20 @@ def analyze_location(df):
     plt.ylabel("Proportion of Users who Churned")
     plt.xticks(rotation=90)
     plt.tight_layout()
-    plt.show()
+    _show_or_save("churn_rate_by_state", save_dir)
 
 
-def analyze_user_agent(df):
+def analyze_user_agent(df, save_dir=None):
     """
     Extracts OS/Platform from userAgent and plots churn rate.
     Aggregates by USER first.
     """
-    if "userAgent" not in df.columns:
+    user_df = _summary(df, categorical=["userAgent"]).users
+    if "userAgent" not in user_df.columns:
         return
 
     def get_os(agent):
-        if not agent:
+        if not agent or agent == UNKNOWN:
             return "Unknown"
         if "Windows" in agent:
             return "Windows"
@@ -199,11 +349,8 @@ def analyze_user_agent(df):
             return "Linux"
         return "Other"
 
-    df = df.copy()
-    df["os"] = df["userAgent"].apply(str).apply(get_os)
-
-    user_df = df.groupby("userId").agg({"os": "last", "churn_ts": "max"})
-    user_df["is_churner"] = user_df["churn_ts"].notna().astype(int)
+    # One row per user, then parse each distinct agent once
+    user_df["os"] = _map_unique(user_df["userAgent"].astype(str), get_os)
 
     churn_rate = user_df.groupby("os")["is_churner"].mean().sort_values(ascending=False)
 
@@ -211,44 +358,42 @@ def analyze_user_agent(df):
     sb.barplot(x=churn_rate.index, y=churn_rate.values)
     plt.title("Churn Rate by OS (User Level)")
     plt.ylabel("Proportion of Users who Churned")
-    plt.show()
+    _show_or_save("churn_rate_by_os", save_dir)
 
 
-def analyze_page_distribution(df, ignore_pages=[]):
+def analyze_page_distribution(df, ignore_pages=[], save_dir=None):
     """
     Compares page visit distribution between churn and non-churn users.
     Aggregates by USER first (Proportion of events).
+
+    df: Event DataFrame or EDASummary (see eda_summary.py).
     """
-    if "page" not in df.columns:
+    if isinstance(df, pd.DataFrame) and "page" not in df.columns:
         return
 
-    # 1. Count page visits per user
-    user_page_counts = df.groupby(["userId", "page"]).size().unstack(fill_value=0)
-
-    # 2. Normalize by total events per user
-    user_total_events = df.groupby("userId").size()
-    user_page_props = user_page_counts.div(user_total_events, axis=0)
+    # 1-2. Sparse user x page proportions (page visits / total events per user)
+    summary = _summary(df)
+    user_page_props = summary.page_proportions()
 
-    # 3. Add churn status
-    churn_status = df.groupby("userId")["churn_ts"].max().notna().astype(int)
-    user_page_props["is_churner"] = churn_status
+    # 3. Churn status (one label per row)
+    is_churner = summary.users["is_churner"].to_numpy()
 
-    # 4. Melt for plotting
-    melted = user_page_props.melt(
-        id_vars="is_churner", var_name="page", value_name="proportion"
-    )
+    # 4. Pages to plot
+    keep = [j for j, page in enumerate(summary.pages) if page not in ignore_pages]
+    pages = list(summary.pages[keep])
 
-    if ignore_pages:
-        melted = melted[~melted["page"].isin(ignore_pages)]
+    # 5. Pre-aggregate to one box per (page, churn status), column by column
+    stats = _sparse_box_stats(user_page_props[:, keep], pages, is_churner)
 
-    plt.figure(figsize=(15, 8))
-    sb.boxplot(
-        x="page", y="proportion", hue="is_churner", data=melted, showfliers=False
-    )
+    fig, ax = plt.subplots(figsize=(15, 8))
+    _draw_grouped_boxes(ax, stats, pages, hue_order=[0, 1])
+    ax.set_xlabel("page")
+    ax.set_ylabel("proportion")
+    ax.legend(title="is_churner")
     plt.title("Page Visit Proportion per User (Churn vs Non-Churn)")
     plt.xticks(rotation=90)
     plt.tight_layout()
-    plt.show()
+    _show_or_save("page_distribution", save_dir)
 
 
 def get_true_names_and_importance(estimator, backup_names):
@@ -258,6 +403,9 @@ def get_true_names_and_importance(estimator, backup_names):
     3. Handles standard Coef/Importance.
     4. Patches missing feature names if needed.
     """
+    # Imported here: sklearn is only needed for this helper
+    from sklearn.pipeline import Pipeline
+
     # 1. Unwrap Pipeline (Standard case)
     if isinstance(estimator, Pipeline):
         estimator = estimator.steps[-1][1]